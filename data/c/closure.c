@@ -1,42 +1,98 @@
 /* Objects and helpers used to implement python closures on top of C */
 #include "closure.h"
 
+/* Locals and stacks are created and destroyed on every call of a closure, so we keep the freed ones on free
+   lists rather than going back to malloc.  MpLocals are rounded up to a size class by the number of locals,
+   with the array stored inline after the header; MpStacks are pooled by their exact depth.  Anything too
+   large to pool is allocated directly.
+   Note: like the rest of the runtime, these depend on the GIL to be safe. */
+static const Py_ssize_t locals_classes[] = {4, 8, 16, 32};
+#define LOCALS_CLASS_COUNT (sizeof(locals_classes) / sizeof(locals_classes[0]))
+#define LOCALS_UNPOOLED LOCALS_CLASS_COUNT
+
+#define STACK_MAX_POOLED 8
+
+// the most freed objects we keep for each class
+#define POOL_MAX 64
+
+static MpLocals *locals_pool[LOCALS_CLASS_COUNT][POOL_MAX];
+static int locals_pool_size[LOCALS_CLASS_COUNT];
+
+static MpStack *stack_pool[STACK_MAX_POOLED + 1][POOL_MAX];
+static int stack_pool_size[STACK_MAX_POOLED + 1];
+
 
 MpLocals *
 MpLocals_Create(Py_ssize_t cnt) {
-    MpLocals *locals;
-    locals = (MpLocals *)malloc(sizeof(MpLocals));
-    locals->refcnt = 0;
-    locals->locals_count = cnt;
-    if(cnt > 0) {
-        locals->locals = (PyObject **)calloc(cnt, sizeof(PyObject*));
+    MpLocals *locals = NULL;
+    Py_ssize_t cls;
+
+    for(cls = 0; cls < LOCALS_CLASS_COUNT; cls++) {
+        if(cnt <= locals_classes[cls])
+            break;
+    }
+    if(cls < LOCALS_CLASS_COUNT && locals_pool_size[cls] > 0) {
+        locals = locals_pool[cls][--locals_pool_size[cls]];
     } else {
-        locals->locals = NULL;
+        locals = (MpLocals *)malloc(sizeof(MpLocals) +
+                        sizeof(PyObject *) * (cls < LOCALS_CLASS_COUNT ? locals_classes[cls] : cnt));
+        if(!locals)
+            return NULL;
     }
+    MpLocals_Init(locals, (PyObject **)(locals + 1), cnt);
+    locals->size_class = cls;
+    return locals;
+}
+
+/* Set up locals, with storage for cnt locals in items; used directly for locals that live in a c frame. */
+MpLocals *
+MpLocals_Init(MpLocals *locals, PyObject **items, Py_ssize_t cnt) {
+    locals->size_class = MP_LOCALS_ON_STACK;
+    locals->refcnt = 0;
+    locals->locals_count = cnt;
+    locals->locals = cnt > 0 ? items : NULL;
+    if(cnt > 0)
+        memset(items, 0, sizeof(PyObject *) * cnt);
     return locals;
 }
 
 void
 MpLocals_Destroy(MpStack *stack, Py_ssize_t level) {
     Py_ssize_t i;
-    if(!stack[level])
+    MpLocals *locals = stack[level];
+    if(!locals)
         return;
-    stack[level]->refcnt -= 1;
-    if(stack[level]->refcnt == 0) {
-        for(i = 0; i < stack[level]->locals_count; i++) {
-            Py_XDECREF(stack[level]->locals[i]);
+    locals->refcnt -= 1;
+    if(locals->refcnt == 0) {
+        stack[level] = NULL;
+        for(i = 0; i < locals->locals_count; i++) {
+            Py_XDECREF(locals->locals[i]);
         }
-        if(stack[level]->locals) {
-            free(stack[level]->locals);
+        if(locals->size_class == MP_LOCALS_ON_STACK)
+            return;
+        if(locals->size_class < LOCALS_UNPOOLED && locals_pool_size[locals->size_class] < POOL_MAX) {
+            locals_pool[locals->size_class][locals_pool_size[locals->size_class]++] = locals;
+            return;
         }
-        free(stack[level]);
-        stack[level] = NULL;
+        free(locals);
     }
 }
 
+/* Share the cell at from_index in from with a closure, which finds it at index in captures. */
+void
+MpLocals_Capture(MpLocals *captures, Py_ssize_t index, MpLocals *from, Py_ssize_t from_index) {
+    captures->locals[index] = from->locals[from_index];
+    Py_INCREF(captures->locals[index]);
+}
+
 MpStack *
 MpStack_Create(Py_ssize_t cnt) {
     MpStack *stack;
+    if(cnt <= STACK_MAX_POOLED && stack_pool_size[cnt] > 0) {
+        stack = stack_pool[cnt][--stack_pool_size[cnt]];
+        memset(stack, 0, cnt * sizeof(MpStack));
+        return stack;
+    }
     stack = calloc(cnt, sizeof(MpStack));
     return stack;
 }
@@ -63,5 +119,9 @@ MpStack_Destroy(MpStack *stack, Py_ssize_t cnt) {
     for(i = 0; i < cnt; i++ ) {
         MpLocals_Destroy(stack, i);
     }
+    if(cnt <= STACK_MAX_POOLED && stack_pool_size[cnt] < POOL_MAX) {
+        stack_pool[cnt][stack_pool_size[cnt]++] = stack;
+        return;
+    }
     free(stack);
 }
@@ -11,12 +11,19 @@ typedef struct {
     Py_ssize_t refcnt;
     Py_ssize_t locals_count;
     PyObject **locals;
+
+    // the size class that we were allocated from, or MP_LOCALS_ON_STACK if the storage belongs to a c frame
+    Py_ssize_t size_class;
 } MpLocals;
 
+#define MP_LOCALS_ON_STACK -1
+
 typedef MpLocals* MpStack;
 
 MpLocals * MpLocals_Create(Py_ssize_t cnt);
+MpLocals * MpLocals_Init(MpLocals *locals, PyObject **items, Py_ssize_t cnt);
 void MpLocals_Destroy(MpStack *stack, Py_ssize_t level);
+void MpLocals_Capture(MpLocals *captures, Py_ssize_t index, MpLocals *from, Py_ssize_t from_index);
 
 MpLocals * MpStack_FetchLocals(MpStack *stack, Py_ssize_t level);
 void MpStack_RestoreLocals(MpStack *stack, Py_ssize_t level, MpLocals *locals);
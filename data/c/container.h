@@ -0,0 +1,303 @@
+#ifndef _MP_CONTAINER_H_
+#define _MP_CONTAINER_H_
+
+#include <Python.h>
+#include "env.h"
+
+/* Item access and containment on lists, tuples and dicts.
+   The plain helpers take the concrete apis and require an object of exactly the named type.  The IfExact
+   helpers check the type first and go through the abstract protocol for anything else, so that we can use
+   them where we have only probably got the container.  The Long helpers take an unboxed int index, as a
+   C long and the PyObject* that holds the value instead when it does not fit in the long (see number.h).
+   Anything that the fast paths do not handle falls back to the abstract protocol, which raises the errors
+   the interpreter would. */
+
+
+/* Return the position that the int i names in a sequence of length n, or -1 if it is out of range. */
+static inline Py_ssize_t
+MpSequence_Position(long i, Py_ssize_t n)
+{
+    if(i < 0)
+        i += n;
+    if(i < 0 || i >= n)
+        return -1;
+    return i;
+}
+
+/* Return the position that key names in a sequence of length n, or -1 if it is not an int in range. */
+static inline Py_ssize_t
+MpSequence_KeyPosition(PyObject *key, Py_ssize_t n)
+{
+    long i;
+    int overflow;
+
+    if(!PyLong_CheckExact(key))
+        return -1;
+    i = PyLong_AsLongAndOverflow(key, &overflow);
+    if(overflow)
+        return -1;
+    return MpSequence_Position(i, n);
+}
+
+/* Index obj with the boxed form of an unboxed int, through the abstract protocol. */
+static inline PyObject *
+MpObject_GetItemLong(PyObject *obj, long i, PyObject *io)
+{
+    PyObject *key, *out;
+
+    if(io)
+        return PyObject_GetItem(obj, io);
+    key = PyLong_FromLong(i);
+    if(!key)
+        return NULL;
+    out = PyObject_GetItem(obj, key);
+    Py_DECREF(key);
+    return out;
+}
+
+static inline int
+MpObject_SetItemLong(PyObject *obj, long i, PyObject *io, PyObject *value)
+{
+    PyObject *key;
+    int rv;
+
+    if(io)
+        return PyObject_SetItem(obj, io, value);
+    key = PyLong_FromLong(i);
+    if(!key)
+        return -1;
+    rv = PyObject_SetItem(obj, key, value);
+    Py_DECREF(key);
+    return rv;
+}
+
+
+/*** list ***/
+static inline PyObject *
+MpList_GetItem(PyObject *list, PyObject *key)
+{
+    PyObject *item;
+    Py_ssize_t pos = MpSequence_KeyPosition(key, PyList_GET_SIZE(list));
+
+    if(unlikely(pos < 0))
+        return PyObject_GetItem(list, key);
+    item = PyList_GET_ITEM(list, pos);
+    Py_INCREF(item);
+    return item;
+}
+
+static inline PyObject *
+MpList_GetItemIfExact(PyObject *obj, PyObject *key)
+{
+    if(likely(PyList_CheckExact(obj)))
+        return MpList_GetItem(obj, key);
+    return PyObject_GetItem(obj, key);
+}
+
+static inline PyObject *
+MpList_GetItemLong(PyObject *list, long i, PyObject *io)
+{
+    PyObject *item;
+    Py_ssize_t pos = MpSequence_Position(i, PyList_GET_SIZE(list));
+
+    if(unlikely(io || pos < 0))
+        return MpObject_GetItemLong(list, i, io);
+    item = PyList_GET_ITEM(list, pos);
+    Py_INCREF(item);
+    return item;
+}
+
+static inline PyObject *
+MpList_GetItemLongIfExact(PyObject *obj, long i, PyObject *io)
+{
+    if(likely(PyList_CheckExact(obj)))
+        return MpList_GetItemLong(obj, i, io);
+    return MpObject_GetItemLong(obj, i, io);
+}
+
+/* Replace the item at pos in list with a new reference to value. */
+static inline int
+MpList_Replace(PyObject *list, Py_ssize_t pos, PyObject *value)
+{
+    PyObject *prior = PyList_GET_ITEM(list, pos);
+
+    Py_INCREF(value);
+    PyList_SET_ITEM(list, pos, value);
+    Py_DECREF(prior);
+    return 0;
+}
+
+static inline int
+MpList_SetItem(PyObject *list, PyObject *key, PyObject *value)
+{
+    Py_ssize_t pos = MpSequence_KeyPosition(key, PyList_GET_SIZE(list));
+
+    if(unlikely(pos < 0))
+        return PyObject_SetItem(list, key, value);
+    return MpList_Replace(list, pos, value);
+}
+
+static inline int
+MpList_SetItemIfExact(PyObject *obj, PyObject *key, PyObject *value)
+{
+    if(likely(PyList_CheckExact(obj)))
+        return MpList_SetItem(obj, key, value);
+    return PyObject_SetItem(obj, key, value);
+}
+
+static inline int
+MpList_SetItemLong(PyObject *list, long i, PyObject *io, PyObject *value)
+{
+    Py_ssize_t pos = MpSequence_Position(i, PyList_GET_SIZE(list));
+
+    if(unlikely(io || pos < 0))
+        return MpObject_SetItemLong(list, i, io, value);
+    return MpList_Replace(list, pos, value);
+}
+
+static inline int
+MpList_SetItemLongIfExact(PyObject *obj, long i, PyObject *io, PyObject *value)
+{
+    if(likely(PyList_CheckExact(obj)))
+        return MpList_SetItemLong(obj, i, io, value);
+    return MpObject_SetItemLong(obj, i, io, value);
+}
+
+static inline int
+MpList_Contains(PyObject *list, PyObject *value)
+{
+    PyObject *item;
+    Py_ssize_t i;
+    int cmp;
+
+    // Note: like list_contains, we check the size every time, since the comparison can resize the list
+    for(i = 0; i < PyList_GET_SIZE(list); i++) {
+        item = PyList_GET_ITEM(list, i);
+        if(item == value)
+            return 1;
+        Py_INCREF(item);
+        cmp = PyObject_RichCompareBool(value, item, Py_EQ);
+        Py_DECREF(item);
+        if(cmp != 0)
+            return cmp;
+    }
+    return 0;
+}
+
+static inline int
+MpList_ContainsIfExact(PyObject *obj, PyObject *value)
+{
+    if(likely(PyList_CheckExact(obj)))
+        return MpList_Contains(obj, value);
+    return PySequence_Contains(obj, value);
+}
+
+
+/*** tuple ***/
+static inline PyObject *
+MpTuple_GetItem(PyObject *tuple, PyObject *key)
+{
+    PyObject *item;
+    Py_ssize_t pos = MpSequence_KeyPosition(key, PyTuple_GET_SIZE(tuple));
+
+    if(unlikely(pos < 0))
+        return PyObject_GetItem(tuple, key);
+    item = PyTuple_GET_ITEM(tuple, pos);
+    Py_INCREF(item);
+    return item;
+}
+
+static inline PyObject *
+MpTuple_GetItemIfExact(PyObject *obj, PyObject *key)
+{
+    if(likely(PyTuple_CheckExact(obj)))
+        return MpTuple_GetItem(obj, key);
+    return PyObject_GetItem(obj, key);
+}
+
+static inline PyObject *
+MpTuple_GetItemLong(PyObject *tuple, long i, PyObject *io)
+{
+    PyObject *item;
+    Py_ssize_t pos = MpSequence_Position(i, PyTuple_GET_SIZE(tuple));
+
+    if(unlikely(io || pos < 0))
+        return MpObject_GetItemLong(tuple, i, io);
+    item = PyTuple_GET_ITEM(tuple, pos);
+    Py_INCREF(item);
+    return item;
+}
+
+static inline PyObject *
+MpTuple_GetItemLongIfExact(PyObject *obj, long i, PyObject *io)
+{
+    if(likely(PyTuple_CheckExact(obj)))
+        return MpTuple_GetItemLong(obj, i, io);
+    return MpObject_GetItemLong(obj, i, io);
+}
+
+static inline int
+MpTuple_Contains(PyObject *tuple, PyObject *value)
+{
+    PyObject *item;
+    Py_ssize_t i;
+    int cmp;
+
+    for(i = 0; i < PyTuple_GET_SIZE(tuple); i++) {
+        item = PyTuple_GET_ITEM(tuple, i);
+        if(item == value)
+            return 1;
+        cmp = PyObject_RichCompareBool(value, item, Py_EQ);
+        if(cmp != 0)
+            return cmp;
+    }
+    return 0;
+}
+
+static inline int
+MpTuple_ContainsIfExact(PyObject *obj, PyObject *value)
+{
+    if(likely(PyTuple_CheckExact(obj)))
+        return MpTuple_Contains(obj, value);
+    return PySequence_Contains(obj, value);
+}
+
+
+/*** dict ***/
+static inline PyObject *
+MpDict_GetItem(PyObject *dict, PyObject *key)
+{
+    PyObject *item = PyDict_GetItem(dict, key);
+
+    // Note: PyDict_GetItem swallows errors, so on a miss we let the dict raise the KeyError, or the error from the key
+    if(unlikely(!item))
+        return PyObject_GetItem(dict, key);
+    Py_INCREF(item);
+    return item;
+}
+
+static inline PyObject *
+MpDict_GetItemIfExact(PyObject *obj, PyObject *key)
+{
+    if(likely(PyDict_CheckExact(obj)))
+        return MpDict_GetItem(obj, key);
+    return PyObject_GetItem(obj, key);
+}
+
+static inline int
+MpDict_SetItemIfExact(PyObject *obj, PyObject *key, PyObject *value)
+{
+    if(likely(PyDict_CheckExact(obj)))
+        return PyDict_SetItem(obj, key, value);
+    return PyObject_SetItem(obj, key, value);
+}
+
+static inline int
+MpDict_ContainsIfExact(PyObject *obj, PyObject *key)
+{
+    if(likely(PyDict_CheckExact(obj)))
+        return PyDict_Contains(obj, key);
+    return PySequence_Contains(obj, key);
+}
+
+#endif // _MP_CONTAINER_H_
@@ -7,96 +7,84 @@ extern int __millipede_main__(int argc, wchar_t **argv);
 extern wchar_t* _Mp_char2wchar(const char* arg, size_t *size);
 
 
+/* The frames that the current error has unwound through, in the order we left them.  The strings are the
+   static ones that the generated code passes us, so capturing a frame only stores pointers; we only format
+   them if we print the traceback.  We keep the innermost MP_TRACEBACK_HEAD frames, where the error was
+   raised, and never overwrite them; past those, the last MP_TRACEBACK_TAIL frames go round a ring, so that
+   we also have the outermost frames once the unwind is done.  Any frames in between are only counted. */
+#define MP_TRACEBACK_HEAD 96
+#define MP_TRACEBACK_TAIL 32
+
+typedef struct {
+	const char *file;
+	int lineno;
+	int clineno;
+	const char *context;
+	const char *srcline;
+} MpTracebackEntry;
+
+typedef struct {
+	MpTracebackEntry entries[MP_TRACEBACK_HEAD + MP_TRACEBACK_TAIL];
+	// the number of frames captured since the last clear; may be more than we have kept
+	Py_ssize_t count;
+} MpTraceback;
+
+static __thread MpTraceback traceback;
+
+
+static MpTracebackEntry *
+_traceback_entry(Py_ssize_t i) {
+	if(i < MP_TRACEBACK_HEAD)
+		return &traceback.entries[i];
+	return &traceback.entries[MP_TRACEBACK_HEAD + (i - MP_TRACEBACK_HEAD) % MP_TRACEBACK_TAIL];
+}
+
+
 void __err_capture__(char *file, int lineno, int clineno, char *context,
 				char *srcline, int err_start, int err_end) {
-    PyObject *val, *src, *dict, *tb;
-    int rv;
+	MpTracebackEntry *entry = _traceback_entry(traceback.count);
 
-    // build current value
-    val = PyUnicode_FromFormat("  File \"%s\", line %d (%d), in %s\n", file, lineno, clineno, context);
-    if(!val)
-		Py_FatalError("Failed to format captured error");
-    src = PyUnicode_FromFormat("    %s\n", srcline);
-    if(!src)
-		Py_FatalError("Failed to format captured source line");
-
-    // get the thread state dict
-    dict = PyThreadState_GET()->dict;
-    if(!dict) {
-	    dict = PyThreadState_GET()->dict = PyDict_New();
-	    if(!dict)
-			Py_FatalError("Could not create thread state dict");
-    }
+	entry->file = file;
+	entry->lineno = lineno;
+	entry->clineno = clineno;
+	entry->context = context;
+	entry->srcline = srcline;
+	traceback.count++;
+}
 
-    // get the traceback list
-    tb = PyDict_GetItemString(dict, "__millipede_traceback__");
-    if(!tb) {
-		tb = PyList_New(0);
-		if(!tb)
-			Py_FatalError("Could not create traceback list");
-		Py_INCREF(tb);
-		rv = PyDict_SetItemString(dict, "__millipede_traceback__", tb);
-		if(rv == -1)
-			Py_FatalError("Failed to insert traceback into thread state");
-    }
 
-    // add the value to the traceback list
-    rv = PyList_Append(tb, src);
-    if(rv == -1)
-		Py_FatalError("Failed to append to traceback");
-    rv = PyList_Append(tb, val);
-    if(rv == -1)
-		Py_FatalError("Failed to append to traceback");
+static void
+_traceback_show_entry(Py_ssize_t i) {
+	MpTracebackEntry *entry = _traceback_entry(i);
+	fprintf(stderr, "  File \"%s\", line %d (%d), in %s\n", entry->file, entry->lineno, entry->clineno, entry->context);
+	fprintf(stderr, "    %s\n", entry->srcline);
 }
 
 
 void __err_show_traceback__() {
-	PyObject *dict, *tb, *val;
-	Py_ssize_t i, cnt;
+	Py_ssize_t i, tail_end, head_end;
 
 	fprintf(stderr, "Traceback (most recent call last):\n");
 
-	dict = PyThreadState_GET()->dict;
-	if(!dict)
-		return;
-	tb = PyDict_GetItemString(dict, "__millipede_traceback__");
-	if(!tb)
-		return;
-
-	cnt = PyList_Size(tb);
-	for(i = cnt - 1; i > -1; i--) {
-		val = PyList_GetItem(tb, i);
-		if(!val) {
-			Py_FatalError("Failed to get_item in tb list when printing traceback");
-		}
-		if(!PyUnicode_Check(val)) {
-			Py_FatalError("Non-Unicode object in traceback");
-		}
-		PyObject_Print(val, stderr, Py_PRINT_RAW);
-	}
+	// the last frame we captured is the outermost one; the ring holds the frames from tail_end up
+	head_end = traceback.count < MP_TRACEBACK_HEAD ? traceback.count : MP_TRACEBACK_HEAD;
+	tail_end = traceback.count - MP_TRACEBACK_TAIL;
+	if(tail_end < head_end)
+		tail_end = head_end;
+	for(i = traceback.count - 1; i >= tail_end; i--)
+		_traceback_show_entry(i);
+	if(tail_end > head_end)
+		fprintf(stderr, "  ... %zd more frames not recorded\n", tail_end - head_end);
+	for(i = head_end - 1; i >= 0; i--)
+		_traceback_show_entry(i);
 }
 
 
 void __err_clear__() {
-    int rv;
-    PyObject *dict, *tb;
-
     // reset the error indicator
     PyErr_Clear();
 
-    dict = PyThreadState_GET()->dict;
-    if(!dict)
-		return;
-
-    // grab the traceback list
-    tb = PyDict_GetItemString(dict, "__millipede_traceback__");
-    if(!tb)
-		return;
-
-    // clear the traceback list
-    rv = PyList_SetSlice(tb, 0, PyList_Size(tb), NULL);
-    if(rv)
-		Py_FatalError("Error clearing traceback list when clearing error.");
+    traceback.count = 0;
 }
 
 
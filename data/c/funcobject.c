@@ -23,6 +23,8 @@ MpFunction_New(const char *name,
     op->m_annotations = NULL;
     op->m_defaults = NULL;
     op->m_kwdefaults = NULL;
+    op->m_defaults_items = NULL;
+    op->m_ndefaults = 0;
     PyObject_GC_Track(op);
     return (PyObject *)op;
 }
@@ -71,6 +73,43 @@ MpFunction_Call(PyObject *func, PyObject *arg, PyObject *kw)
     return (*meth)(func, arg, kw);
 }
 
+
+int
+MpFunction_BindPositional(PyObject *op, PyObject *args, Py_ssize_t nparams, int varargs, PyObject **out)
+{
+    MpFunctionObject *fn = (MpFunctionObject *)op;
+    Py_ssize_t nargs = PyTuple_GET_SIZE(args);
+    Py_ssize_t first_default = nparams - fn->m_ndefaults;
+    Py_ssize_t i;
+
+    if(nargs < first_default || (nargs > nparams && !varargs))
+        return -1;
+    if(nargs > nparams)
+        nargs = nparams;
+    for(i = 0; i < nargs; i++) {
+        out[i] = PyTuple_GET_ITEM(args, i);
+        Py_INCREF(out[i]);
+    }
+    for(; i < nparams; i++) {
+        out[i] = fn->m_defaults_items[i - first_default];
+        Py_INCREF(out[i]);
+    }
+    return 0;
+}
+
+
+PyObject *
+MpFunction_GetDefault(PyObject *op, Py_ssize_t i)
+{
+    MpFunctionObject *fn = (MpFunctionObject *)op;
+    if(i < 0 || i >= fn->m_ndefaults) {
+        PyErr_Format(PyExc_TypeError, "%s() is missing a default for argument %zd", fn->m_name, i);
+        return NULL;
+    }
+    Py_INCREF(fn->m_defaults_items[i]);
+    return fn->m_defaults_items[i];
+}
+
 /* Methods (the standard built-in methods, that is) */
 
 static void
@@ -154,6 +193,8 @@ meth_set__defaults__(MpFunctionObject *m, PyObject *value)
     tmp = m->m_defaults;
     Py_INCREF(value);
     m->m_defaults = value;
+    m->m_defaults_items = &PyTuple_GET_ITEM(value, 0);
+    m->m_ndefaults = PyTuple_GET_SIZE(value);
     Py_XDECREF(tmp);
     return 0;
 }
@@ -34,6 +34,14 @@ PyAPI_FUNC(void) MpFunction_SetStack(PyObject *, MpStack *, Py_ssize_t);
 #endif
 PyAPI_FUNC(PyObject *) MpFunction_Call(PyObject *, PyObject *, PyObject *);
 
+/* Fill the first nparams slots of out with new references to the positional args, then to the defaults.
+   Returns -1, without setting an error, if the args cannot be bound this way; the caller must then
+   do the full binding to get the right error.  If varargs is set, extra positional args are allowed. */
+PyAPI_FUNC(int) MpFunction_BindPositional(PyObject *, PyObject *, Py_ssize_t, int, PyObject **);
+
+/* Return a new reference to the i'th default, or NULL with TypeError if there is no such default. */
+PyAPI_FUNC(PyObject *) MpFunction_GetDefault(PyObject *, Py_ssize_t);
+
 
 PyAPI_FUNC(PyObject *) MpFunction_New(
                                 const char *name,
@@ -58,6 +66,9 @@ typedef struct {
     PyObject *m_annotations;
     PyObject *m_defaults;
     PyObject *m_kwdefaults;
+    // the items of m_defaults, so that binding does not need to go through the tuple
+    PyObject **m_defaults_items;
+    Py_ssize_t m_ndefaults;
 } MpFunctionObject;
 
 #ifdef __cplusplus
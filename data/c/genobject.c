@@ -1,6 +1,8 @@
 /* A generator is the type returned by a generator function or comprehension
 	to provide values. */
 #include "genobject.h"
+#include <sys/mman.h>
+#include <unistd.h>
 
 // Initialized with MpGenerator_Initialize and used for returing from a coroutine
 //	to the main thread.
@@ -12,6 +14,101 @@ static coro_context __main_coroutine__;
 
 #define DEBUG 0
 
+
+/* Coroutine stacks.
+   Every stack is mmapped with an inaccessible guard page below it, so that overflowing the stack faults
+   instead of scribbling over the heap; pages are only made resident as the coroutine touches them.  Stacks
+   are rounded up to a size class and kept on a per-thread free list when their generator dies, so that
+   short lived generators get their stack in constant time.  Stacks larger than the largest class are
+   mapped and unmapped directly. */
+static const Py_ssize_t stack_classes[] = {64 * 1024, 256 * 1024, 1024 * 1024};
+#define STACK_CLASS_COUNT (sizeof(stack_classes) / sizeof(stack_classes[0]))
+
+// the most free stacks we keep for each class, so that a burst of generators does not stay resident
+#define STACK_POOL_MAX 32
+
+typedef struct _MpCoroStack {
+	struct _MpCoroStack *next;
+} MpCoroStack;
+
+// Note: stacks on a thread's free list when the thread exits are not reclaimed
+static __thread MpCoroStack *stack_pool[STACK_CLASS_COUNT];
+static __thread int stack_pool_size[STACK_CLASS_COUNT];
+
+static Py_ssize_t
+stack_page_size(void)
+{
+	static Py_ssize_t page = 0;
+	if(!page)
+		page = sysconf(_SC_PAGESIZE);
+	return page;
+}
+
+/* Return the size class for a stack of size bytes, or -1 if it is too large to pool. */
+static int
+stack_class(Py_ssize_t size)
+{
+	int i;
+	for(i = 0; i < STACK_CLASS_COUNT; i++) {
+		if(size <= stack_classes[i])
+			return i;
+	}
+	return -1;
+}
+
+/* Return the usable size of a stack that was requested with size bytes. */
+static Py_ssize_t
+stack_usable_size(Py_ssize_t size)
+{
+	int cls = stack_class(size);
+	Py_ssize_t page = stack_page_size();
+	if(cls >= 0)
+		return stack_classes[cls];
+	return (size + page - 1) / page * page;
+}
+
+static unsigned char *
+stack_alloc(Py_ssize_t size)
+{
+	int cls = stack_class(size);
+	Py_ssize_t page = stack_page_size();
+	unsigned char *base;
+	MpCoroStack *stack;
+
+	if(cls >= 0 && stack_pool[cls]) {
+		stack = stack_pool[cls];
+		stack_pool[cls] = stack->next;
+		stack_pool_size[cls]--;
+		return (unsigned char *)stack;
+	}
+
+	base = mmap(NULL, page + size, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+	if(base == MAP_FAILED)
+		return NULL;
+	if(mprotect(base, page, PROT_NONE)) {
+		munmap(base, page + size);
+		return NULL;
+	}
+	return base + page;
+}
+
+static void
+stack_free(unsigned char *stack, Py_ssize_t size)
+{
+	int cls = stack_class(size);
+	Py_ssize_t page = stack_page_size();
+	MpCoroStack *free_stack;
+
+	if(cls >= 0 && stack_pool_size[cls] < STACK_POOL_MAX) {
+		free_stack = (MpCoroStack *)stack;
+		free_stack->next = stack_pool[cls];
+		stack_pool[cls] = free_stack;
+		stack_pool_size[cls]++;
+		return;
+	}
+	munmap(stack - page, page + size);
+}
+
 static void
 gen_del(PyObject *self) {
 	//MpGeneratorObject *gen = (MpGeneratorObject *)self;
@@ -34,14 +131,22 @@ gen_dealloc(MpGeneratorObject *gen)
 
 	if(!gen->exhausted && gen->entered) {
 		((PyObject **)(gen->data))[SEND_INDEX] = (PyObject *)1;
-		coro_transfer(gen->coro_source, &gen->coro);
+		if(gen->step)
+			gen->step(gen->data, gen->frame);
+		else
+			coro_transfer(gen->coro_source, &gen->coro);
 	}
 
-	// Note: this is usually a no-op macro, so suppress the "unused" warning
-	__attribute__((unused)) void *ctx = coro_destroy(&gen->coro);
+	if(gen->step) {
+		free(gen->frame);
+		gen->frame = NULL;
+	} else {
+		// Note: this is usually a no-op macro, so suppress the "unused" warning
+		__attribute__((unused)) void *ctx = coro_destroy(&gen->coro);
 
-	free(gen->stack);
-	gen->stack = NULL;
+		stack_free(gen->stack, gen->stacksize);
+		gen->stack = NULL;
+	}
 
 	if(gen->name) {
 		free(gen->name);
@@ -62,6 +167,12 @@ gen_iter(PyObject *obj)
 	MpGeneratorObject *gen = (MpGeneratorObject *)obj;
 	PyObject *dict, *stack, *cap;
 
+	// stackless generators run on the stack of whoever asks for the next item, so there is nothing to return to
+	if(gen->step) {
+		Py_INCREF(obj);
+		return obj;
+	}
+
     // get the thread state dict
     dict = PyThreadState_GET()->dict;
     if(!dict)
@@ -101,18 +212,22 @@ gen_iternext(MpGeneratorObject *gen)
 		return NULL;
 	}
 
-	// If the runtime did not call __iter__ to get an iterator first, we need
-	// to call it manually to set ourself up for usage.
-	if(!gen->coro_source) {
-		PyObject *obj = gen_iter((PyObject *)gen);
-		Py_DECREF(obj);
+	if(gen->step) {
+		gen->step(gen->data, gen->frame);
+	} else {
+		// If the runtime did not call __iter__ to get an iterator first, we need
+		// to call it manually to set ourself up for usage.
+		if(!gen->coro_source) {
+			PyObject *obj = gen_iter((PyObject *)gen);
+			Py_DECREF(obj);
+		}
+
+		if(DEBUG)
+			printf("(0)IterNext: %p -> %p\n", gen->coro_source, &gen->coro);
+		coro_transfer(gen->coro_source, &gen->coro);
+		if(DEBUG)
+			printf("(1)IterNext: %p -> %p\n", gen->coro_source, &gen->coro);
 	}
-
-	if(DEBUG)
-		printf("(0)IterNext: %p -> %p\n", gen->coro_source, &gen->coro);
-	coro_transfer(gen->coro_source, &gen->coro);
-	if(DEBUG)
-		printf("(1)IterNext: %p -> %p\n", gen->coro_source, &gen->coro);
 	rv = ((PyObject **)(gen->data))[RETURN_INDEX];
 	if(!rv) {
 		gen->exhausted = 1;
@@ -216,9 +331,11 @@ MpGenerator_New(char *name, coro_func func, void *data, int stacksize)
 	gen->coro_source = NULL;
 	gen->exhausted = 0;
 	gen->entered = 0;
+	gen->step = NULL;
+	gen->frame = NULL;
 
-	gen->stacksize = stacksize;
-	gen->stack = calloc(1, stacksize);
+	gen->stacksize = stack_usable_size(stacksize);
+	gen->stack = stack_alloc(gen->stacksize);
 	if(!gen->stack) {
 		return PyErr_NoMemory();
 	}
@@ -231,6 +348,36 @@ MpGenerator_New(char *name, coro_func func, void *data, int stacksize)
 	return (PyObject *)gen;
 }
 
+PyObject *
+MpGenerator_NewStackless(char *name, MpGeneratorStep step, void *data, Py_ssize_t framesize)
+{
+	if(!name) {
+		PyErr_BadArgument();
+		return NULL;
+	}
+
+	MpGeneratorObject *gen = PyObject_New(MpGeneratorObject, &MpGenerator_Type);
+	if(!gen) {
+		return NULL;
+	}
+
+	gen->name = name;
+	gen->data = data;
+	gen->coro_source = NULL;
+	gen->exhausted = 0;
+	gen->entered = 0;
+	gen->stack = NULL;
+	gen->stacksize = 0;
+
+	gen->step = step;
+	gen->frame = calloc(1, framesize);
+	if(!gen->frame) {
+		return PyErr_NoMemory();
+	}
+
+	return (PyObject *)gen;
+}
+
 coro_context *
 MpGenerator_GetContext(PyObject *self) {
 	MpGeneratorObject *gen = (MpGeneratorObject *)self;
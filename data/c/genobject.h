@@ -7,6 +7,10 @@ extern "C" {
 #include <Python.h>
 #include <coro.h>
 
+/* The runner of a stackless generator: it runs the generator from where it last stopped until the next
+   yield, keeping all of its state in frame, and returns to us instead of switching stacks. */
+typedef void (*MpGeneratorStep)(void *data, void *frame);
+
 typedef struct {
 	PyObject_HEAD
 
@@ -23,7 +27,7 @@ typedef struct {
 	//  - this will be freed on deletion, so pass a malloced pointer.
 	void *data;
 
-	// internally alloced based on the passed stack size.
+	// internally alloced from the stack pool, rounded up from the passed stack size.
 	unsigned char *stack;
 	Py_ssize_t stacksize;
 
@@ -38,9 +42,15 @@ typedef struct {
 	
 	// set to 1 immediately before we enter the co-routine for the first time
 	int entered;
+
+	// for stackless generators, the runner that we call for each item and the zeroed frame that holds its
+	// state between calls; a stackless generator has no stack or coroutine.
+	MpGeneratorStep step;
+	void *frame;
 } MpGeneratorObject;
 
 PyObject * MpGenerator_New(char *name, coro_func func, void *data, int stacksize);
+PyObject * MpGenerator_NewStackless(char *name, MpGeneratorStep step, void *data, Py_ssize_t framesize);
 void MpGenerator_Yield(PyObject *self);
 coro_context * MpGenerator_GetContext(PyObject *self);
 coro_context * MpGenerator_GetSourceContext(PyObject *self);
@@ -0,0 +1,87 @@
+#include "iter.h"
+
+
+static int
+MpRange_ArgAsLong(PyObject *arg, long *out)
+{
+    int overflow;
+
+    if(!arg)
+        return 1;
+    if(!PyLong_CheckExact(arg))
+        return 0;
+    *out = PyLong_AsLongAndOverflow(arg, &overflow);
+    return !overflow;
+}
+
+
+int
+MpRange_Init(MpRange *r, PyObject **it, PyObject *range, PyObject *start, PyObject *stop, PyObject *step)
+{
+    long a = 0, b = 0, s = 1;
+    PyObject *obj;
+
+    *it = NULL;
+    if(range == (PyObject *)&PyRange_Type && MpRange_ArgAsLong(start, &a) && MpRange_ArgAsLong(stop, &b) &&
+            MpRange_ArgAsLong(step, &s) && s != 0) {
+        MpRange_Set(r, a, b, s);
+        return 0;
+    }
+
+    // let range check its args and raise
+    if(start)
+        obj = PyObject_CallFunctionObjArgs(range, start, stop, step, NULL);
+    else
+        obj = PyObject_CallFunctionObjArgs(range, stop, NULL);
+    if(!obj)
+        return -1;
+    *it = PyObject_GetIter(obj);
+    Py_DECREF(obj);
+    if(!*it)
+        return -1;
+    return 0;
+}
+
+
+int
+MpRange_InitSlow(MpRange *r, PyObject **it, PyObject *range, long start, PyObject *starto, long stop, PyObject *stopo,
+                 long step, PyObject *stepo)
+{
+    PyObject *a, *b, *s;
+    int rv = -1;
+
+    a = starto ? (Py_INCREF(starto), starto) : PyLong_FromLong(start);
+    b = stopo ? (Py_INCREF(stopo), stopo) : PyLong_FromLong(stop);
+    s = stepo ? (Py_INCREF(stepo), stepo) : PyLong_FromLong(step);
+    if(a && b && s)
+        rv = MpRange_Init(r, it, range, a, b, s);
+    Py_XDECREF(a);
+    Py_XDECREF(b);
+    Py_XDECREF(s);
+    return rv;
+}
+
+
+int
+MpRange_NextSlow(PyObject *it, long *out, PyObject **outo)
+{
+    PyObject *item;
+    int overflow;
+
+    item = PyIter_Next(it);
+    if(!item)
+        return PyErr_Occurred() ? -1 : 0;
+
+    *out = PyLong_AsLongAndOverflow(item, &overflow);
+    if(*out == -1 && PyErr_Occurred()) {
+        Py_DECREF(item);
+        return -1;
+    }
+    if(overflow) {
+        *outo = item;
+    } else {
+        *outo = NULL;
+        Py_DECREF(item);
+    }
+    return 1;
+}
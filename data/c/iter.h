@@ -0,0 +1,123 @@
+#ifndef _MP_ITER_H_
+#define _MP_ITER_H_
+
+#include <Python.h>
+#include "env.h"
+
+/* Iteration for for loops.
+   The Next helpers store the next item and return 1, return 0 when the loop is done, and return -1 if
+   there is an error. */
+
+
+/* Return the object to iterate obj with: obj itself, for the exact lists and tuples that MpIter_Next can
+   index directly, or obj's iterator otherwise.  Returns a new reference, or NULL on error. */
+static inline PyObject *
+MpIter_Get(PyObject *obj)
+{
+    if(PyList_CheckExact(obj) || PyTuple_CheckExact(obj)) {
+        Py_INCREF(obj);
+        return obj;
+    }
+    return PyObject_GetIter(obj);
+}
+
+/* Store a new reference to the next item of it, from MpIter_Get, in out.  index must start at 0. */
+static inline int
+MpIter_Next(PyObject *it, Py_ssize_t *index, PyObject **out)
+{
+    // Note: like the list iterator, we check the size every time, since the loop body can resize the list
+    if(PyList_CheckExact(it)) {
+        if(*index >= PyList_GET_SIZE(it))
+            return 0;
+        *out = PyList_GET_ITEM(it, *index);
+    } else if(PyTuple_CheckExact(it)) {
+        if(*index >= PyTuple_GET_SIZE(it))
+            return 0;
+        *out = PyTuple_GET_ITEM(it, *index);
+    } else {
+        *out = PyIter_Next(it);
+        if(!*out)
+            return PyErr_Occurred() ? -1 : 0;
+        return 1;
+    }
+    Py_INCREF(*out);
+    (*index)++;
+    return 1;
+}
+
+
+/* A range that fits in C longs, counted down in remaining so that we never step past the end. */
+typedef struct {
+    long index;
+    long step;
+    unsigned long remaining;
+} MpRange;
+
+/* Set up r to count over range(start, stop, step), where range is the object the program called; start and step
+   may be NULL.  If range is not the builtin, or its args are not ints that fit in a long, *it is set to a new
+   reference to the iterator of range(start, stop, step) instead, which raises any error the call would.
+   Otherwise *it is NULL.  Returns -1 on error. */
+int MpRange_Init(MpRange *r, PyObject **it, PyObject *range, PyObject *start, PyObject *stop, PyObject *step);
+int MpRange_InitSlow(MpRange *r, PyObject **it, PyObject *range, long start, PyObject *starto, long stop, PyObject *stopo,
+                     long step, PyObject *stepo);
+int MpRange_NextSlow(PyObject *it, long *out, PyObject **outo);
+
+static inline void
+MpRange_Set(MpRange *r, long start, long stop, long step)
+{
+    r->index = start;
+    r->step = step;
+    if(step > 0)
+        r->remaining = start < stop ? ((unsigned long)stop - (unsigned long)start - 1) / (unsigned long)step + 1 : 0;
+    else
+        r->remaining = start > stop ? ((unsigned long)start - (unsigned long)stop - 1) / (0UL - (unsigned long)step) + 1 : 0;
+}
+
+/* As MpRange_Init, for the builtin range, with args that are unboxed ints. */
+static inline int
+MpRange_InitLong(MpRange *r, PyObject **it, PyObject *range, long start, PyObject *starto, long stop, PyObject *stopo,
+                 long step, PyObject *stepo)
+{
+    if(unlikely(starto || stopo || stepo || step == 0))
+        return MpRange_InitSlow(r, it, range, start, starto, stop, stopo, step, stepo);
+    MpRange_Set(r, start, stop, step);
+    *it = NULL;
+    return 0;
+}
+
+/* Store the next value of the range in out, as a new reference. */
+static inline int
+MpRange_Next(MpRange *r, PyObject *it, PyObject **out)
+{
+    if(unlikely(it != NULL)) {
+        *out = PyIter_Next(it);
+        if(!*out)
+            return PyErr_Occurred() ? -1 : 0;
+        return 1;
+    }
+    if(!r->remaining)
+        return 0;
+    *out = PyLong_FromLong(r->index);
+    if(!*out)
+        return -1;
+    r->remaining--;
+    r->index = (long)((unsigned long)r->index + (unsigned long)r->step);
+    return 1;
+}
+
+/* Store the next value of the builtin range as an unboxed int in out and outo. */
+static inline int
+MpRange_NextLong(MpRange *r, PyObject *it, long *out, PyObject **outo)
+{
+    if(unlikely(it != NULL))
+        return MpRange_NextSlow(it, out, outo);
+    if(!r->remaining)
+        return 0;
+    *out = r->index;
+    *outo = NULL;
+    r->remaining--;
+    r->index = (long)((unsigned long)r->index + (unsigned long)r->step);
+    return 1;
+}
+
+#endif // _MP_ITER_H_
@@ -0,0 +1,115 @@
+#include "number.h"
+
+
+static int
+MpLong_BoxBoth(long a, PyObject *ao, long b, PyObject *bo, PyObject **x, PyObject **y)
+{
+    *x = MpLong_Box(a, ao);
+    if(!*x)
+        return -1;
+    *y = MpLong_Box(b, bo);
+    if(!*y) {
+        Py_DECREF(*x);
+        return -1;
+    }
+    return 0;
+}
+
+
+int
+MpLong_Slow(binaryfunc op, long a, PyObject *ao, long b, PyObject *bo, long *out, PyObject **outo)
+{
+    PyObject *x, *y, *r;
+    int overflow;
+
+    if(MpLong_BoxBoth(a, ao, b, bo, &x, &y) == -1)
+        return -1;
+    r = op(x, y);
+    Py_DECREF(x);
+    Py_DECREF(y);
+    if(!r)
+        return -1;
+
+    *out = PyLong_AsLongAndOverflow(r, &overflow);
+    if(*out == -1 && PyErr_Occurred()) {
+        Py_DECREF(r);
+        return -1;
+    }
+    if(overflow) {
+        *outo = r;
+    } else {
+        *outo = NULL;
+        Py_DECREF(r);
+    }
+    return 0;
+}
+
+
+int
+MpLong_SlowRichCompare(long a, PyObject *ao, long b, PyObject *bo, int op)
+{
+    PyObject *x, *y;
+    int rv;
+
+    if(MpLong_BoxBoth(a, ao, b, bo, &x, &y) == -1)
+        return -1;
+    rv = PyObject_RichCompareBool(x, y, op);
+    Py_DECREF(x);
+    Py_DECREF(y);
+    return rv;
+}
+
+
+int
+MpLong_SlowTrueDivide(long a, PyObject *ao, long b, PyObject *bo, double *out)
+{
+    PyObject *x, *y, *r;
+
+    if(MpLong_BoxBoth(a, ao, b, bo, &x, &y) == -1)
+        return -1;
+    r = PyNumber_TrueDivide(x, y);
+    Py_DECREF(x);
+    Py_DECREF(y);
+    if(!r)
+        return -1;
+    *out = PyFloat_AsDouble(r);
+    Py_DECREF(r);
+    if(*out == -1.0 && PyErr_Occurred())
+        return -1;
+    return 0;
+}
+
+
+int
+MpLong_SlowAsDouble(PyObject *ao, double *out)
+{
+    *out = PyLong_AsDouble(ao);
+    if(*out == -1.0 && PyErr_Occurred())
+        return -1;
+    return 0;
+}
+
+
+int
+MpFloat_SlowTrueDivide(double a, double b, double *out)
+{
+    PyObject *x, *y, *r;
+
+    // let the float type raise the error, so that it matches the interpreter's
+    x = PyFloat_FromDouble(a);
+    if(!x)
+        return -1;
+    y = PyFloat_FromDouble(b);
+    if(!y) {
+        Py_DECREF(x);
+        return -1;
+    }
+    r = PyNumber_TrueDivide(x, y);
+    Py_DECREF(x);
+    Py_DECREF(y);
+    if(!r)
+        return -1;
+    *out = PyFloat_AsDouble(r);
+    Py_DECREF(r);
+    return 0;
+}
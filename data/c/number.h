@@ -0,0 +1,173 @@
+#ifndef _MP_NUMBER_H_
+#define _MP_NUMBER_H_
+
+#include <Python.h>
+#include <limits.h>
+#include "env.h"
+
+/* Unboxed numbers.
+   A python int that we keep unboxed is a C long plus a PyObject* that holds the value instead whenever it
+   does not fit in the long.  The PyObject* is NULL whenever the long is valid.  The fast helpers below
+   return nonzero when they cannot compute the result in a long, in which case the caller must take
+   the slow path through MpLong_Slow, which also raises any error the interpreter would. */
+
+/* Doubles with an exact C long representation: we can convert freely without rounding. */
+#define MP_LONG_EXACT_DOUBLE (1L << 53)
+
+
+static inline int
+MpLong_Add(long a, long b, long *out)
+{
+    if((b > 0 && a > LONG_MAX - b) || (b < 0 && a < LONG_MIN - b))
+        return 1;
+    *out = a + b;
+    return 0;
+}
+
+static inline int
+MpLong_Subtract(long a, long b, long *out)
+{
+    if((b < 0 && a > LONG_MAX + b) || (b > 0 && a < LONG_MIN + b))
+        return 1;
+    *out = a - b;
+    return 0;
+}
+
+static inline int
+MpLong_Multiply(long a, long b, long *out)
+{
+    if(a > 0) {
+        if(b > 0 ? a > LONG_MAX / b : b < LONG_MIN / a)
+            return 1;
+    } else {
+        if(b > 0 ? a < LONG_MIN / b : (a != 0 && b < LONG_MAX / a))
+            return 1;
+    }
+    *out = a * b;
+    return 0;
+}
+
+static inline int
+MpLong_FloorDivide(long a, long b, long *out)
+{
+    long q;
+    if(b == 0 || (a == LONG_MIN && b == -1))
+        return 1;
+    q = a / b;
+    if(a % b != 0 && (a < 0) != (b < 0))
+        q--;
+    *out = q;
+    return 0;
+}
+
+static inline int
+MpLong_Remainder(long a, long b, long *out)
+{
+    long m;
+    if(b == 0 || (a == LONG_MIN && b == -1))
+        return 1;
+    m = a % b;
+    if(m != 0 && (m < 0) != (b < 0))
+        m += b;
+    *out = m;
+    return 0;
+}
+
+static inline int
+MpLong_And(long a, long b, long *out)
+{
+    *out = a & b;
+    return 0;
+}
+
+static inline int
+MpLong_Or(long a, long b, long *out)
+{
+    *out = a | b;
+    return 0;
+}
+
+static inline int
+MpLong_Xor(long a, long b, long *out)
+{
+    *out = a ^ b;
+    return 0;
+}
+
+
+/* Apply op to the boxed operands and unbox the result again if it fits.  Returns -1 with an
+   exception set on failure. */
+int MpLong_Slow(binaryfunc op, long a, PyObject *ao, long b, PyObject *bo, long *out, PyObject **outo);
+
+/* Compare with the given rich comparison op; returns -1 with an exception set on failure. */
+int MpLong_SlowRichCompare(long a, PyObject *ao, long b, PyObject *bo, int op);
+
+/* True division of ints, for when the operands are not exactly representable as doubles. */
+int MpLong_SlowTrueDivide(long a, PyObject *ao, long b, PyObject *bo, double *out);
+
+/* Convert an int that does not fit in a long to a double, raising OverflowError if it is too big. */
+int MpLong_SlowAsDouble(PyObject *ao, double *out);
+
+/* The python error for a float division by zero. */
+int MpFloat_SlowTrueDivide(double a, double b, double *out);
+
+
+static inline PyObject *
+MpLong_Box(long a, PyObject *ao)
+{
+    if(ao) {
+        Py_INCREF(ao);
+        return ao;
+    }
+    return PyLong_FromLong(a);
+}
+
+static inline int
+MpLong_RichCompare(long a, PyObject *ao, long b, PyObject *bo, int op)
+{
+    if(likely(!ao && !bo)) {
+        switch(op) {
+        case Py_LT: return a < b;
+        case Py_LE: return a <= b;
+        case Py_EQ: return a == b;
+        case Py_NE: return a != b;
+        case Py_GT: return a > b;
+        case Py_GE: return a >= b;
+        }
+    }
+    return MpLong_SlowRichCompare(a, ao, b, bo, op);
+}
+
+static inline int
+MpLong_TrueDivide(long a, PyObject *ao, long b, PyObject *bo, double *out)
+{
+    if(likely(!ao && !bo && b != 0 &&
+            a <= MP_LONG_EXACT_DOUBLE && a >= -MP_LONG_EXACT_DOUBLE &&
+            b <= MP_LONG_EXACT_DOUBLE && b >= -MP_LONG_EXACT_DOUBLE)) {
+        *out = (double)a / (double)b;
+        return 0;
+    }
+    return MpLong_SlowTrueDivide(a, ao, b, bo, out);
+}
+
+static inline int
+MpLong_AsDouble(long a, PyObject *ao, double *out)
+{
+    if(likely(!ao)) {
+        *out = (double)a;
+        return 0;
+    }
+    return MpLong_SlowAsDouble(ao, out);
+}
+
+static inline int
+MpFloat_TrueDivide(double a, double b, double *out)
+{
+    if(likely(b != 0.0)) {
+        *out = a / b;
+        return 0;
+    }
+    return MpFloat_SlowTrueDivide(a, b, out);
+}
+
+#endif // _MP_NUMBER_H_
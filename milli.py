@@ -22,6 +22,8 @@ def parse_args():
 	build_opts.add_option('-A', '--abi', default='', metavar='ABI', help="Python's ABI definition string (e.g. du, dmu, etc)")
 	build_opts.add_option('-I', '--include', default='.*', metavar='REGEX', help="Only matching files will be considered as in the project (default: .*)")
 	build_opts.add_option('-E', '--exclude', default='$^', metavar='REGEX', help="Any matching files will be considered as outside the project (default: $^)")
+	build_opts.add_option('-j', '--jobs', type='int', default=None, metavar='N', help="Number of processes to parse with (default: number of cpus)")
+	build_opts.add_option('-i', '--incremental', action='store_true', help="Only re-analyze modules that changed since the last build.")
 	build_opts.add_option('--no-make', dest='no_make', action='store_true', help="Don't exec make after we generate sources.")
 	parser.add_option_group(build_opts)
 
@@ -84,7 +86,8 @@ def main():
 					stdlib=stdlib, extensions=extensions,
 					prefix=opts.prefix, version=opts.version, abi=opts.abi,
 					include=opts.include, exclude=opts.exclude,
-					verbose=opts.verbose, opt_level=opts.opt, opt_options=opts.options
+					verbose=opts.verbose, opt_level=opts.opt, opt_options=opts.options,
+					jobs=opts.jobs, incremental=opts.incremental
 				)
 	mf = project.build_all()
 
@@ -0,0 +1,76 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.lang.visitor import ASTVisitor
+from millipede.py import ast as py
+
+
+class CaptureScan(ASTVisitor):
+	'''
+	Find the names that a function's code uses, by the scope that owns them, and the subset of those that
+	the functions nested in it use.  A closure only captures the variables that it, or something nested
+	in it, names; those of its own that nested functions name need to live in cells.
+
+	inline -- returns whether a call runs its generator expression argument inline (see Py2C.inline_consumer)
+	'''
+	def __init__(self, inline=None):
+		super().__init__()
+		self.inline = inline
+		self.depth = 0
+		self.used = {} # {Scope: {str}}
+		self.nested = {} # {Scope: {str}}
+
+
+	def scan(self, node:py.AST) -> ({object: {str}}, {object: {str}}):
+		'''Return the names used by the function defined by node, and those used by the functions nested in it.'''
+		if isinstance(node, py.GeneratorExp):
+			self.visit(node.elt)
+			self.visit_nodelist(node.generators)
+		elif isinstance(node, py.Lambda):
+			self.visit_nodelist(node.body)
+		else:
+			self.visit_nodelist(node.body)
+		return self.used, self.nested
+
+
+	def visit_Name(self, node):
+		scope = getattr(node.hl, 'parent', None)
+		if scope is None:
+			return
+		scope = scope.owner_of(str(node))
+		self.used.setdefault(scope, set()).add(str(node))
+		if self.depth:
+			self.nested.setdefault(scope, set()).add(str(node))
+
+
+	def visit_Call(self, node):
+		if not self.inline or not self.inline(node):
+			return self.generic_visit(node)
+		# Note: the generator expression runs in our own frame, so it does not capture anything
+		self.visit(node.func)
+		self.visit(node.args[0].elt)
+		self.visit_nodelist(node.args[0].generators)
+
+
+	# Note: decorators and defaults run in the function around the one they define
+	def visit_FunctionDef(self, node):
+		self.visit_nodelist(node.decorator_list)
+		self.visit(node.args)
+		self.depth += 1
+		self.visit_nodelist(node.body)
+		self.depth -= 1
+
+
+	def visit_Lambda(self, node):
+		self.visit(node.args)
+		self.depth += 1
+		self.visit_nodelist(node.body)
+		self.depth -= 1
+
+
+	def visit_GeneratorExp(self, node):
+		self.depth += 1
+		self.visit(node.elt)
+		self.visit_nodelist(node.generators)
+		self.depth -= 1
@@ -0,0 +1,100 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.hl.types.pystring import PyStringType
+from millipede.lang.visitor import ASTVisitor
+from millipede.py import ast as py
+
+
+class GlobalEscapes(ASTVisitor):
+	'''
+	Find the module global names that project code can write without going through the owning module's own
+	stores -- e.g. by setting an attribute on the module object from another module.  Globals that escape
+	this way must always be read from the module dict.
+	'''
+	# builtins that can rewrite the namespace of the current module
+	MODULE_DYNAMIC = {'globals', 'locals'}
+	# builtins that can rewrite any namespace; setattr and delattr with a literal name are handled specially
+	PROGRAM_DYNAMIC = {'setattr', 'delattr', 'vars', 'exec', 'eval'}
+
+	def __init__(self):
+		super().__init__()
+
+		# names that are the target of an attribute store or delete anywhere in the project
+		self.names = set()
+
+		# modules whose globals may be rewritten arbitrarily
+		self.dynamic_modules = set()
+
+		# set if any module could rewrite any other module's globals arbitrarily
+		self.all_dynamic = False
+
+		self.module = None
+
+
+	def scan(self, node:py.Module):
+		self.module = node.hl
+		self.visit(node)
+		self.module = None
+
+
+	def is_static(self, module, name:str) -> bool:
+		'''True if the global name in module can only ever be written by module's own code.'''
+		return not self.all_dynamic and module not in self.dynamic_modules and name not in self.names
+
+
+	def visit_Attribute(self, node):
+		if node.ctx in (py.Store, py.Del, py.Aug):
+			self.names.add(str(node.attr))
+		if str(node.attr) == '__dict__':
+			self.all_dynamic = True
+		self.visit(node.value)
+
+
+	def visit_Call(self, node):
+		# setattr(x, 'name', ...) only escapes 'name'
+		if isinstance(node.func, py.Name) and str(node.func) in ('setattr', 'delattr') and \
+				node.args and len(node.args) >= 2 and isinstance(node.args[1], py.Str):
+			self.names.add(PyStringType.dequote(node.args[1].s))
+			for arg in node.args:
+				self.visit(arg)
+			return
+		self.generic_visit(node)
+
+
+	@staticmethod
+	def _module_names(node) -> [str]:
+		if isinstance(node, py.Attribute):
+			return [str(name) for name in node.get_names()]
+		return [str(node)] if node and str(node) else []
+
+
+	def visit_Import(self, node):
+		# importing a.b sets b on a, whatever name we bind it to
+		for alias in node.names:
+			self.names.update(self._module_names(alias.name)[1:])
+
+
+	def visit_ImportFrom(self, node):
+		# importing from a.b sets b on a; a relative import also sets its first part on the package it is relative to
+		names = self._module_names(node.module)
+		self.names.update(names if node.level else names[1:])
+
+		# any name we import may be a submodule, which importing sets on the package
+		for alias in node.names:
+			if str(alias.name) != '*':
+				self.names.add(str(alias.name))
+			elif node.module.hl:
+				# Note: a star import sets the submodules in the package's __all__
+				self.dynamic_modules.add(node.module.hl)
+			else:
+				self.all_dynamic = True
+
+
+	def visit_Name(self, node):
+		name = str(node)
+		if name in self.MODULE_DYNAMIC:
+			self.dynamic_modules.add(self.module)
+		elif name in self.PROGRAM_DYNAMIC:
+			self.all_dynamic = True
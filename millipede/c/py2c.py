@@ -4,7 +4,12 @@ All rights reserved.
 '''
 from . import ast as c
 from contextlib import contextmanager
+from millipede.c.escapes import GlobalEscapes
 from millipede.c.pybuiltins import PY_BUILTINS
+from millipede.c.stackless import StacklessCheck
+from millipede.c.stacksize import StackEstimate
+from millipede.c.types.cdouble import CDoubleLL
+from millipede.c.types.clong import CLongLL
 from millipede.c.types.integer import CIntegerLL
 from millipede.c.types.lltype import LLType
 from millipede.c.types.pybool import PyBoolLL
@@ -25,6 +30,7 @@ from millipede.c.types.pyset import PySetLL
 from millipede.c.types.pystring import PyStringLL
 from millipede.c.types.pytuple import PyTupleLL
 from millipede.c.types.pytype import PyTypeLL
+from millipede.c.unboxing import NumericLocals, numeric_kind, LONG, DOUBLE
 from millipede.hl.nodes.class_ import MpClass
 from millipede.hl.nodes.function import MpFunction
 from millipede.hl.nodes.module import MpModule
@@ -71,6 +77,9 @@ class Py2C(ASTVisitor):
 										instead of the globals dict.
 		static_builtins			Assume that builtin names are not modified outside
 		static_defaults		Assume that function __defaults__ and __kwdefaults__ are not modified outside 
+		stackless_generators	Compile generators that do not yield inside try/finally or with blocks to step
+										functions that keep their locals in a heap frame, instead of coroutines with
+										their own stack.
 	
 	Meta Options:
 	(Meta options turn on several underlying options all at once in a package.)
@@ -134,6 +143,21 @@ class Py2C(ASTVisitor):
 		PyStringType: PyStringLL,
 		PyTupleType: PyTupleLL,
 	}
+	# the ll types with fast item access, by the hl type that says a value is one
+	CONTAINER_TYPES = {
+		PyDictType: PyDictLL,
+		PyListType: PyListLL,
+		PyTupleType: PyTupleLL,
+	}
+	# the ll types that know how to build each kind of pooled constant
+	CONSTANT_TYPES = {
+		'int': PyIntegerLL,
+		'float': PyFloatLL,
+		'str': PyStringLL,
+		'bytes': PyBytesLL,
+	}
+	# the builtins that we run inline when their only argument is a generator expression
+	INLINE_CONSUMERS = ('sum', 'any', 'all', 'list', 'tuple', 'set', 'min', 'max')
 
 
 	def __init__(self, opt_level, opt_options, hl_builtins):
@@ -147,6 +171,12 @@ class Py2C(ASTVisitor):
 		self.opt_options = opt_options
 		self.opt_elide_docstrings = 'nodocstrings' in opt_options
 		self.opt_debug_memory = 'debug_memory' in self.opt_options
+		self.opt_static_globals = 'static_globals' in self.opt_options or 'no_external_code' in self.opt_options
+		self.opt_static_builtins = 'static_builtins' in self.opt_options or 'no_external_code' in self.opt_options
+		self.opt_stackless_generators = 'stackless_generators' in self.opt_options
+
+		# the globals that static_globals must leave in the module dicts; filled for all modules in preallocate
+		self.global_escapes = GlobalEscapes()
 
 		# the python hl walker context
 		self.scopes = []
@@ -159,6 +189,9 @@ class Py2C(ASTVisitor):
 		# A stack that contains the current nest of loop variable names.
 		self.loop_vars = []
 
+		# A stack of the iterators of the comprehension loops we are inside.
+		self.comp_iters = []
+
 		# This contains the set of all available (at a C scope) temp var names and the set of all in-use (in an expr) names.
 		self.tmp_used = [set()]
 		self.tmp_free = [set()]
@@ -180,17 +213,16 @@ class Py2C(ASTVisitor):
 		self.tu.add_include(c.Include('closure.h', False))
 		self.tu.add_include(c.Include('funcobject.h', False))
 		self.tu.add_include(c.Include('genobject.h', False))
+		self.tu.add_include(c.Include('number.h', False))
+		self.tu.add_include(c.Include('iter.h', False))
+		self.tu.add_include(c.Include('container.h', False))
 
 		# add common names
 		self.hl_builtins = hl_builtins
 		self.builtins = PyObjectLL(hl_builtins, self)
 		self.builtins.declare(is_global=True, quals=['static'])
-		self.builtin_refs = {}
-		#FIXME: only load builtins that we actually use
-		#for name in PY_BUILTINS:
-		#	self.builtin_refs[name] = PyObjectLL(self.hl_builtins.lookup(name), self)
-		#	self.builtin_refs[name].declare(is_global=True, quals=['static'])
-		#self.none = self.builtin_refs['None']
+		# with static_builtins, each builtin we use is looked up once, in main, and referenced directly after
+		self.builtin_refs = {} # {str: PyObjectLL}
 		self.none = PyObjectLL(self.hl_builtins.lookup('None'), self)
 		self.none.declare(is_global=True, quals=['static'])
 
@@ -210,9 +242,12 @@ class Py2C(ASTVisitor):
 					c.Assignment('=', c.ID(self.builtins.name), c.FuncCall(c.ID('PyImport_ImportModule'), c.ExprList(c.Constant('string', 'builtins')))),
 			)
 		)
-		#for name in PY_BUILTINS:
-		#	self.main.body.add(c.Assignment('=', c.ID(self.builtin_refs[name].name), c.FuncCall(c.ID('PyObject_GetAttrString'), c.ExprList(c.ID(self.builtins.name), c.Constant('string', name)))))
 		self.main.body.add(c.Assignment('=', c.ID(self.none.name), c.FuncCall(c.ID('PyObject_GetAttrString'), c.ExprList(c.ID(self.builtins.name), c.Constant('string', 'None')))))
+		self.builtins_init = self.main.body.add(c.Compound())
+
+		# literals are created once, in main before any module is built, and shared by every use
+		self.constants = {} # {(str, object): PyObjectLL}
+		self.constants_init = self.main.body.add(c.Compound())
 
 		self.tu.add_fwddecl(self.main.decl)
 		self.tu.add(c.Comment(' ***Entry Point*** '))
@@ -348,6 +383,246 @@ class Py2C(ASTVisitor):
 		return inst
 
 
+	def get_constant(self, kind:str, value) -> PyObjectLL:
+		'''
+		Return the global holding the pooled constant of kind ('int', 'float', 'str', 'bytes' or 'tuple') with
+		the given value, emitting its creation on first use.  For tuples, value is a tuple of pooled constants.
+		'''
+		key = (kind, repr(value) if kind == 'float' else value)
+		if key in self.constants:
+			return self.constants[key]
+
+		inst = PyObjectLL(None, self)
+		inst.declare(is_global=True, quals=['static'], name='const_' + kind)
+		if kind == 'tuple':
+			init = c.FuncCall(c.ID('PyTuple_Pack'), c.ExprList(c.Constant('integer', len(value)), *[c.ID(v.name) for v in value]))
+		else:
+			init = self.CONSTANT_TYPES[kind].initializer(value)
+		self.constants_init.add(c.Assignment('=', c.ID(inst.name), init))
+		self.constants_init.add(c.If(c.UnaryOp('!', c.ID(inst.name)), c.Compound(
+										c.FuncCall(c.ID('PyErr_Print'), c.ExprList()),
+										c.Return(c.Constant('integer', 1))), None))
+		if kind == 'str':
+			self.constants_init.add(c.FuncCall(c.ID('PyUnicode_InternInPlace'), c.ExprList(c.UnaryOp('&', c.ID(inst.name)))))
+
+		self.constants[key] = inst
+		return inst
+
+
+	def get_builtin(self, name:str) -> PyObjectLL:
+		'''Return the global holding the builtin name, looked up in main.  It is NULL if this python lacks the name.'''
+		if name == 'None':
+			return self.none
+		if name not in self.builtin_refs:
+			inst = PyObjectLL(None, self)
+			inst.declare(is_global=True, quals=['static'], name='builtin_' + name)
+			self.builtins_init.add(c.Assignment('=', c.ID(inst.name), c.FuncCall(c.ID('PyObject_GetAttrString'), c.ExprList(
+																		c.ID(self.builtins.name), c.Constant('string', name)))))
+			self.builtins_init.add(c.If(c.UnaryOp('!', c.ID(inst.name)), c.Compound(c.FuncCall(c.ID('PyErr_Clear'), c.ExprList())), None))
+			self.builtin_refs[name] = inst
+		return self.builtin_refs[name]
+
+
+	def load_builtin(self, name:str, out:PyObjectLL):
+		'''Load the builtin name into out, raising NameError if it does not exist.'''
+		error = "name '{}' is not defined".format(name)
+		if self.opt_static_builtins:
+			self.ctx.add(c.Assignment('=', c.ID(out.name), c.ID(self.get_builtin(name).name)))
+			out.except_if_null(out.name, 'PyExc_NameError', error)
+			out.incref()
+		else:
+			self.builtins.get_attr_string_with_exception(name, out, 'PyExc_NameError', error)
+
+
+	def get_name(self, name:str) -> PyObjectLL:
+		'''Return the pooled, interned str to use as the key when accessing the attribute or global name.'''
+		return self.get_constant('str', str(name))
+
+
+	def is_constant(self, node:py.AST) -> bool:
+		'''True if node is a literal, or a tuple of literals, that we can hoist into the constant pool.'''
+		if isinstance(node, py.Num):
+			return isinstance(node.n, (int, float))
+		if isinstance(node, (py.Str, py.Bytes)):
+			return True
+		if isinstance(node, py.Tuple) and node.ctx == py.Load:
+			return all(self.is_constant(e) for e in node.elts or [])
+		return False
+
+
+	def fold_constant(self, node:py.AST) -> PyObjectLL:
+		'''Return the pooled constant for a node that passes is_constant.'''
+		if isinstance(node, py.Num):
+			return self.get_constant('float' if isinstance(node.n, float) else 'int', node.n)
+		if isinstance(node, py.Str):
+			return self.get_constant('str', PyStringType.dequote(node.s))
+		if isinstance(node, py.Bytes):
+			return self.get_constant('bytes', PyStringType.dequote(node.s))
+		return self.get_constant('tuple', tuple(self.fold_constant(e) for e in node.elts or []))
+
+
+	def load_constant(self, node:py.AST) -> PyObjectLL:
+		'''Take a new reference to the pooled constant for node in a fresh temporary.'''
+		inst = self.create_ll_instance(node.hl)
+		inst.declare_tmp()
+		inst.assign_constant(self.fold_constant(node))
+		return inst
+
+
+	def is_builtin(self, node:py.AST, name:str) -> bool:
+		'''True if node is a load of the builtin name and, with static_builtins, nothing can bind the name over it.'''
+		if not self.opt_static_builtins or not isinstance(node, py.Name) or str(node) != name:
+			return False
+		if not node.hl or node.hl.parent is not self.hl_builtins:
+			return False
+		return not self.hl_module.has_symbol(name) and self.global_escapes.is_static(self.hl_module, name)
+
+
+	def counted_loop(self, node:py.For) -> Nonable(str):
+		'''Return 'range' or 'enumerate' if node loops over a call to that builtin that we can count with a c long.'''
+		call = node.iter
+		if not isinstance(call, py.Call) or call.keywords or call.starargs or call.kwargs:
+			return None
+		nargs = len(call.args or [])
+		if self.is_builtin(call.func, 'range') and 1 <= nargs <= 3:
+			return 'range'
+		if self.is_builtin(call.func, 'enumerate') and isinstance(node.target, (py.Tuple, py.List)) and \
+				len(node.target.elts) == 2 and not any(isinstance(e, py.Starred) for e in node.target.elts):
+			# we count from a small constant start, so that the count can never outgrow the long
+			if nargs == 1:
+				return 'enumerate'
+			if nargs == 2 and isinstance(call.args[1], py.Num) and type(call.args[1].n) is int and abs(call.args[1].n) <= 2 ** 32:
+				return 'enumerate'
+		return None
+
+
+	def inline_consumer(self, node:py.Call) -> Nonable(str):
+		'''
+		Return the name of the builtin, or 'join' for a str literal's join, that node passes a generator expression
+		to as its only argument, when we know what the consumer does with it and can run the loop inline.
+		'''
+		if not isinstance(node, py.Call) or node.keywords or node.starargs or node.kwargs:
+			return None
+		if len(node.args or []) != 1 or not isinstance(node.args[0], py.GeneratorExp):
+			return None
+		for name in self.INLINE_CONSUMERS:
+			if self.is_builtin(node.func, name):
+				return name
+		if isinstance(node.func, py.Attribute) and isinstance(node.func.value, py.Str) and str(node.func.attr) == 'join':
+			return 'join'
+		return None
+
+
+	def find_local_callee(self, node:py.Call) -> Nonable(PyFunctionLL):
+		'''Return the ll of the project function that node calls by name, if we can call its runner directly.'''
+		if not isinstance(node.func, py.Name) or not node.func.hl:
+			return None
+		if node.keywords or node.starargs or node.kwargs:
+			return None
+		scope = node.func.hl.deref().scope
+		if not isinstance(scope, MpFunction) or not isinstance(scope.ll, PyFunctionLL):
+			return None
+		target = scope.ll
+		if target.direct_arity != len(node.args or []) or target.c_obj is None:
+			return None
+		return target
+
+
+	def probable_container(self, node:py.AST, inst:LLType) -> Nonable(type):
+		'''
+		Return the ll class of the container that the hl says node evaluates to, when inst is not already an
+		instance of it.  We cannot prove that such a name is never rebound, so its fast paths need a type check.
+		'''
+		if isinstance(inst, tuple(self.CONTAINER_TYPES.values())) or not getattr(node, 'hl', None):
+			return None
+		return self.CONTAINER_TYPES.get(node.hl.get_type().__class__)
+
+
+	def visit_item_key(self, node:py.AST, container:type, op:str):
+		'''Visit the key of a subscript; return an unboxed int if the container can take one for op.'''
+		if isinstance(node, py.Index) and op + '_long' in container.ITEM_HELPERS and self.unboxed_kind(node.value) == LONG:
+			return self.visit_unboxed(node.value)
+		return self.visit(node)
+
+
+	def _name_scope(self, node:py.Name):
+		'''Return the scope that holds the variable node names.
+			Note: the target of a store to a nonlocal can be parented under the function that declares it.'''
+		return node.hl.parent.owner_of(str(node))
+
+
+	def _unboxed_local(self, node:py.Name):
+		'''Return the ll of the local that node names, if we keep it unboxed.'''
+		if not node.hl or not node.hl.parent:
+			return None
+		return getattr(self._name_scope(node).ll, 'unboxed', {}).get(str(node))
+
+
+	def unboxed_kind(self, node:py.AST) -> Nonable(str):
+		'''Return LONG or DOUBLE if we can compute node without boxing, as arithmetic over unboxed locals.'''
+		if not getattr(self.scope.ll, 'unboxed', None):
+			return None
+		def name_kind(name):
+			inst = self._unboxed_local(name)
+			return inst.ctype if inst else None
+		return numeric_kind(node, name_kind)
+
+
+	def visit_unboxed(self, node:py.AST):
+		'''Compute a node that passes unboxed_kind into a c long or double.'''
+		kind = self.unboxed_kind(node)
+		assert kind is not None
+		if isinstance(node, py.Num):
+			inst = CLongLL(None, self) if kind == LONG else CDoubleLL(None, self)
+			inst.set_constant(node.n)
+			return inst
+		if isinstance(node, py.Name):
+			return self._unboxed_local(node)
+		if isinstance(node, py.UnaryOp):
+			operand = self.visit_unboxed(node.operand)
+			if node.op == py.UAdd:
+				return operand
+			if operand.constant is not None:
+				operand.set_constant(-operand.constant)
+				return operand
+			out = operand.__class__(None, self)
+			out.declare_tmp()
+			operand.negative(out)
+			operand.decref()
+			return out
+		return self._unboxed_binop(node.op, self.visit_unboxed(node.left), self.visit_unboxed(node.right), kind)
+
+
+	def _unboxed_binop(self, op, l, r, kind):
+		if kind == DOUBLE and op != py.Div:
+			l, r = self._unboxed_as_double(l), self._unboxed_as_double(r)
+		out = CLongLL(None, self) if kind == LONG else CDoubleLL(None, self)
+		out.declare_tmp()
+		if op == py.Div:
+			# ints divide to a float without converting first, so that we round like python does
+			if isinstance(l, CLongLL) != isinstance(r, CLongLL):
+				l, r = self._unboxed_as_double(l), self._unboxed_as_double(r)
+			l.true_divide(r, out)
+		else:
+			l.binop(op, r, out)
+		l.decref()
+		r.decref()
+		return out
+
+
+	def _unboxed_as_double(self, inst):
+		out = inst.as_double()
+		if out is not inst:
+			inst.decref()
+		return out
+
+
+	def _boxed(self, inst):
+		out = inst.as_pyobject()
+		inst.decref()
+		return out
+
+
 	def find_nearest_class_scope(self, err=''):
 		for s in reversed(self.scopes):
 			if isinstance(s, MpClass):
@@ -404,7 +679,8 @@ class Py2C(ASTVisitor):
 
 	def capture_error(self):
 		filename = self.hl_module.filename
-		try: context = self.scope.owner.name
+		# Note: name the frames of module level code as python does
+		try: context = self.scope.owner.name if not isinstance(self.scope, MpModule) else '<module>'
 		except IndexError: context = '<module>'
 		st = self._current_node.start
 		end = self._current_node.end
@@ -622,7 +898,7 @@ class Py2C(ASTVisitor):
 
 	def _delete_name(self, target):
 		assert isinstance(target, py.Name)
-		scope = target.hl.parent
+		scope = self._name_scope(target)
 		scope.ll.del_attr_string(str(target))
 
 
@@ -640,21 +916,21 @@ class Py2C(ASTVisitor):
 				if end: end.decref()
 				if step: step.decref()
 			else:
-				i = self.visit(node.slice)
-				o.set_item(i, src_inst)
+				probable = self.probable_container(node.value, o)
+				i = self.visit_item_key(node.slice, probable or o.__class__, 'set')
+				if isinstance(i, CLongLL):
+					o.set_item_long(i, src_inst, probable)
+				else:
+					o.set_item(i, src_inst, probable)
 				i.decref()
 			o.decref()
 		elif isinstance(node, py.Name):
 			self._store_name(node, src_inst)
 		elif isinstance(node, (py.Tuple, py.List)):
-			key = PyIntegerLL(None, self)
-			key.declare_tmp()
 			for i, elt in enumerate(node.elts):
-				key.set_constant(i)
-				tmp = src_inst.get_item(key)
+				tmp = src_inst.get_item(self.get_constant('int', i))
 				self._store_any(elt, tmp)
 				tmp.decref()
-			key.decref()
 		else:
 			raise NotImplementedError("Don't know how to assign to type: {}".format(type(node)))
 
@@ -666,7 +942,7 @@ class Py2C(ASTVisitor):
 			o = self.visit(source.value)
 			#FIXME: this could be a slice
 			i = self.visit(source.slice)
-			tgt_inst = o.get_item(i)
+			tgt_inst = o.get_item(i, probable=self.probable_container(source.value, o))
 			o.decref()
 			i.decref()
 		else:
@@ -686,8 +962,7 @@ class Py2C(ASTVisitor):
 		'''
 		assert isinstance(target, py.Name)
 
-		# NOTE: the hl Name or Ref will always be parented under the right scope
-		scope = target.hl.parent
+		scope = self._name_scope(target)
 		scope.ll.set_attr_string(str(target), val)
 
 		# Note: some nodes do not get a visit_Name pass, since we don't have any preceding rhs for the assignment
@@ -695,8 +970,8 @@ class Py2C(ASTVisitor):
 		#		value we actually created into the ll target for the hl slot so that future users of the hl instance will be able
 		#		to find the correct ll name to use, rather than re-creating it when that users happens to visit_Name on the
 		#		node with a missing ll slot.
-		if not scope.symbols[str(target)].ll:
-			scope.symbols[str(target)].ll = val
+		if not target.hl.parent.symbols[str(target)].ll:
+			target.hl.parent.symbols[str(target)].ll = val
 
 
 	def _load_name(self, source):
@@ -707,8 +982,9 @@ class Py2C(ASTVisitor):
 		tmp.declare_tmp()
 
 		# if we have a scope, load from it
-		if source.hl.parent.ll:
-			source.hl.parent.ll.get_attr_string(str(source), tmp)
+		scope = self._name_scope(source)
+		if scope.ll:
+			scope.ll.get_attr_string(str(source), tmp)
 		# otherwise, load from the global scope
 		else:
 			self.ll_module.get_attr_string(str(source), tmp)
@@ -735,6 +1011,20 @@ class Py2C(ASTVisitor):
 
 	def visit_Assign(self, node):
 		self.comment("Assign: {} = {}".format([str(t) for t in node.targets], str(node.value)))
+		if any(isinstance(t, py.Name) and self._unboxed_local(t) for t in node.targets):
+			val = self.visit_unboxed(node.value)
+			boxed = None
+			for target in node.targets:
+				if not isinstance(target, py.Name) or not self._unboxed_local(target):
+					boxed = boxed or val.as_pyobject()
+					self._store_any(target, boxed)
+				else:
+					self._store_any(target, val)
+			if boxed:
+				boxed.decref()
+			val.decref()
+			return
+
 		val = self.visit(node.value)
 		for target in node.targets:
 			self._store_any(target, val)
@@ -789,6 +1079,13 @@ class Py2C(ASTVisitor):
 
 	def visit_AugAssign(self, node):
 		self.comment('AugAssign: {} {} {}'.format(str(node.target), self.AUGASSIGN_PRETTY[node.op], str(node.value)))
+		if isinstance(node.target, py.Name) and self._unboxed_local(node.target):
+			tgt_inst = self._unboxed_local(node.target)
+			out_inst = self._unboxed_binop(node.op, tgt_inst, self.visit_unboxed(node.value), tgt_inst.ctype)
+			self._store_any(node.target, out_inst)
+			out_inst.decref()
+			return
+
 		val_inst = self.visit(node.value)
 		tgt_inst = self._load_any(node.target)
 
@@ -829,6 +1126,9 @@ class Py2C(ASTVisitor):
 
 
 	def visit_BinOp(self, node):
+		if self.unboxed_kind(node):
+			return self._boxed(self.visit_unboxed(node))
+
 		l = self.visit(node.left)
 		r = self.visit(node.right)
 
@@ -925,10 +1225,7 @@ class Py2C(ASTVisitor):
 
 
 	def visit_Bytes(self, node):
-		inst = self.create_ll_instance(node.hl)
-		inst.declare_tmp()
-		inst.new(PyStringType.dequote(node.s))
-		return inst
+		return self.load_constant(node)
 
 
 	def visit_Break(self, node):
@@ -967,8 +1264,28 @@ class Py2C(ASTVisitor):
 		def _call_builtin(self, node, funcinst):
 			raise NotImplementedError
 
-		def _call_local(self, node, funcinst):
-			raise NotImplementedError
+		def _call_local(self, node, funcinst, target):
+			args_insts = [self.visit(arg).as_pyobject() for arg in (node.args or [])]
+
+			self.comment('do call "{}"'.format(str(node.func)))
+			rv = PyObjectLL(None, self)
+			rv.declare_tmp(name='_call_rv')
+
+			# the name may have been rebound at runtime, so only go direct if we still have the function we compiled
+			is_target = self.ctx.add(c.If(c.BinaryOp('==', c.ID(funcinst.name), c.ID(target.c_obj.name)), c.Compound(), c.Compound()))
+			with self.new_context(is_target.iftrue):
+				target.call_direct(funcinst, args_insts, rv)
+			with self.new_context(is_target.iffalse):
+				args1 = PyTupleLL(None, self)
+				args1.declare_tmp(name='_args')
+				args1.pack(*args_insts)
+				funcinst.call(args1, None, rv)
+				args1.clear()
+
+			for inst in args_insts:
+				inst.decref()
+
+			return rv
 
 		def _call_remote(self, node, funcinst):
 			# if we are calling super with no args, we need to provide them, since this is the framework's responsibility
@@ -1039,6 +1356,11 @@ class Py2C(ASTVisitor):
 		#TODO: track "type" so we can dispatch to PyCFunction_Call or PyFunction_Call instead of PyObject_Call 
 		#TODO: track all call methods (callsite usage types) and see if we can't unpack into a direct c call
 
+		# a generator expression that goes straight into a consumer we know runs as a loop in our frame
+		consumer = self.inline_consumer(node)
+		if consumer:
+			return self.visit_inline_genexp(node.args[0], consumer, node)
+
 		# begin call output
 		self.comment('Call function "{}"'.format(str(node.func)))
 
@@ -1053,8 +1375,9 @@ class Py2C(ASTVisitor):
 		with self.scope.ll.maybe_recursive_call():
 			ty = node.hl.get_type()
 			ct = ty.call_type if isinstance(ty, PyFunctionType) else PyFunctionType.CALL_TYPE_UNKNOWN
-			if ct == PyFunctionType.CALL_TYPE_LOCAL:
-				rv = _call_local(self, node, funcinst)
+			target = self.find_local_callee(node)
+			if target is not None:
+				rv = _call_local(self, node, funcinst, target)
 			elif ct == PyFunctionType.CALL_TYPE_BUILTIN:
 				rv = _call_builtin(self, node, funcinst)
 			else:
@@ -1064,6 +1387,126 @@ class Py2C(ASTVisitor):
 		return rv
 
 
+	def visit_inline_genexp(self, genexp:py.GeneratorExp, consumer:str, call:py.Call) -> LLType:
+		'''
+		Run the generator expression that call passes to consumer as comprehension loops in our own frame, and fold
+		each item into the consumer's result as it is produced.  This does what the builtin would do with the items
+		of the generator, without creating the generator or switching to its stack for every item.
+		'''
+		self.comment('inline {} over a generator expression'.format(consumer))
+
+		# the names bound by the generator expression become c locals of ours
+		inst = PyComprehensionLL(genexp.hl, self)
+		genexp.hl.ll = inst
+		inst.prepare_locals()
+
+		def _item():
+			val = self.visit(genexp.elt)
+			obj = val.as_pyobject()
+			if obj is not val:
+				val.decref()
+			return obj
+
+		if consumer in ('any', 'all'):
+			# stop at the first item that decides the result, releasing the iterators of the loops we are leaving
+			out = CIntegerLL(None, self, is_a_bool=True)
+			out.declare_tmp(name='_' + consumer)
+			self.ctx.add(c.Assignment('=', c.ID(out.name), c.Constant('integer', 0 if consumer == 'any' else 1)))
+			done_label = self.scope.get_label('end_' + consumer)
+			depth = len(self.comp_iters)
+			def _set():
+				obj = _item()
+				truth = obj.is_true()
+				obj.decref()
+				test = c.ID(truth.name) if consumer == 'any' else c.UnaryOp('!', c.ID(truth.name))
+				decided = self.ctx.add(c.If(test, c.Compound(), None))
+				with self.new_context(decided.iftrue):
+					self.ctx.add(c.Assignment('=', c.ID(out.name), c.Constant('integer', 1 if consumer == 'any' else 0)))
+					for it in self.comp_iters[depth:]:
+						it.decref_only()
+					self.ctx.add(c.Goto(done_label))
+				truth.decref()
+			self.visit_comp_generators(genexp.generators, _set)
+			self.ctx.add(c.Label(done_label))
+			return out
+
+		if consumer == 'sum':
+			out = PyObjectLL(None, self)
+			out.declare_tmp(name='_sum')
+			out.assign_name(self.get_constant('int', 0))
+			def _set():
+				obj = _item()
+				total = PyObjectLL(None, self)
+				total.declare_tmp()
+				out.add(obj, total)
+				obj.decref()
+				out.decref_only()
+				self.ctx.add(c.Assignment('=', c.ID(out.name), c.ID(total.name)))
+				total.tmp_decref()
+			self.visit_comp_generators(genexp.generators, _set)
+			return out
+
+		if consumer in ('min', 'max'):
+			# like the builtin, replace the best item so far only with one that compares strictly better
+			out = PyObjectLL(None, self)
+			out.declare_tmp(name='_' + consumer)
+			self.ctx.add(c.Assignment('=', c.ID(out.name), c.ID('NULL')))
+			def _set():
+				obj = _item()
+				first = self.ctx.add(c.If(c.UnaryOp('!', c.ID(out.name)), c.Compound(), c.Compound()))
+				with self.new_context(first.iftrue):
+					self.ctx.add(c.Assignment('=', c.ID(out.name), c.ID(obj.name)))
+				with self.new_context(first.iffalse):
+					better = obj.rich_compare_bool(out, 'Py_LT' if consumer == 'min' else 'Py_GT')
+					replace = self.ctx.add(c.If(c.ID(better.name), c.Compound(), c.Compound()))
+					with self.new_context(replace.iftrue):
+						out.decref_only()
+						self.ctx.add(c.Assignment('=', c.ID(out.name), c.ID(obj.name)))
+					with self.new_context(replace.iffalse):
+						obj.decref_only()
+					better.decref()
+				obj.tmp_decref()
+			self.visit_comp_generators(genexp.generators, _set)
+			out.except_if_null(out.name, 'PyExc_ValueError', '{}() arg is an empty sequence'.format(consumer))
+			return out
+
+		if consumer == 'set':
+			out = PySetLL(None, self)
+			out.declare_tmp(name='_setcomp_')
+			out.new()
+			def _set():
+				obj = _item()
+				out.add(obj)
+				obj.decref()
+			self.visit_comp_generators(genexp.generators, _set)
+			return out
+
+		# list, tuple and join all collect the items in a list first, as the builtins do
+		sep = self.visit(call.func.value) if consumer == 'join' else None
+		items = PyListLL(None, self)
+		items.declare_tmp(name='_listcomp_')
+		items.new()
+		items.fail_if_null(items.name)
+		def _set():
+			obj = _item()
+			items.append(obj).decref()
+			obj.decref()
+		self.visit_comp_generators(genexp.generators, _set)
+		if consumer == 'list':
+			return items
+		if consumer == 'tuple':
+			out = items.sequence_as_tuple()
+			out.fail_if_null(out.name)
+		else:
+			out = PyStringLL(None, self)
+			out.declare_tmp()
+			self.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PyUnicode_Join'), c.ExprList(c.ID(sep.name), c.ID(items.name)))))
+			out.fail_if_null(out.name)
+			sep.decref()
+		items.decref()
+		return out
+
+
 	def visit_ClassDef(self, node):
 		# declare
 		docstring, body = self.split_docstring(node.body)
@@ -1114,7 +1557,7 @@ class Py2C(ASTVisitor):
 
 		build_class_inst = PyObjectLL(None, self)
 		build_class_inst.declare_tmp()
-		self.builtins.get_attr_string('__build_class__', build_class_inst)
+		self.load_builtin('__build_class__', build_class_inst)
 
 		base_insts = []
 		if node.bases:
@@ -1154,6 +1597,17 @@ class Py2C(ASTVisitor):
 		out = CIntegerLL(None, self, is_a_bool=True)
 		out.declare_tmp(name='_cmp_result')
 
+		# compare numbers we keep unboxed directly
+		if self._unboxed_comparable(node):
+			a = self.visit_unboxed(node.left)
+			b = self.visit_unboxed(node.comparators[0])
+			if a.ctype != b.ctype:
+				a, b = self._unboxed_as_double(a), self._unboxed_as_double(b)
+			a.rich_compare_bool(b, self.COMPARATORS_RICH[node.ops[0]], out)
+			a.decref()
+			b.decref()
+			return out
+
 		# Note: we need to initialize the output variable to 0 before the compare since compare can be
 		#		used in, for instance, loops, where we need to re-do the comparison correctly every time.
 		self.ctx.add(c.Assignment('=', c.ID(out.name), c.Constant('integer', 0)))
@@ -1164,17 +1618,17 @@ class Py2C(ASTVisitor):
 		# make each comparison in order
 		a = self.visit(node.left)
 		a = a.as_pyobject()
-		for op, b in zip(node.ops, node.comparators):
-			b = self.visit(b)
+		for op, comparator in zip(node.ops, node.comparators):
+			b = self.visit(comparator)
 			b = b.as_pyobject()
 
 			# do one compare; only continue to next scope if we succeed
 			if op in self.COMPARATORS_RICH:
 				rv = a.rich_compare_bool(b, self.COMPARATORS_RICH[op])
 			elif op == py.In:
-				rv = b.sequence_contains(a)
+				rv = b.sequence_contains(a, self.probable_container(comparator, b))
 			elif op == py.NotIn:
-				rv = b.sequence_contains(a)
+				rv = b.sequence_contains(a, self.probable_container(comparator, b))
 				rv = rv.not_()
 			elif op == py.Is:
 				rv = a.is_(b)
@@ -1204,12 +1658,23 @@ class Py2C(ASTVisitor):
 		return out
 
 
+	def _unboxed_comparable(self, node):
+		if len(node.ops) != 1 or node.ops[0] not in self.COMPARATORS_RICH:
+			return False
+		kinds = (self.unboxed_kind(node.left), self.unboxed_kind(node.comparators[0]))
+		if None in kinds:
+			return False
+		if kinds[0] == kinds[1]:
+			return True
+		# python compares ints and floats exactly, so we can only mix in ints that convert without rounding
+		as_long = node.left if kinds[0] == LONG else node.comparators[0]
+		return isinstance(as_long, py.Num) and abs(as_long.n) <= 2 ** 53
+
+
 	def visit_Continue(self, node):
 		self.comment('continue')
 		def loop_handler(label):
-			var = self.loop_vars[-1]
-			if var:
-				var.decref_only()
+			# Note: the loop variable is released after the continue label
 			self.ctx.add(c.Goto(label))
 			return True
 		self.handle_flowcontrol(continue_handler=loop_handler)
@@ -1274,25 +1739,38 @@ class Py2C(ASTVisitor):
 		break_label = self.scope.get_label('break_for')
 		continue_label = self.scope.get_label('continue_for')
 
-		# get the PyIter for the iteration object
-		iter_obj = self.visit(node.iter)
-		iter = PyObjectLL(None, self)
-		iter.declare_tmp()
-		iter_obj.get_iter(iter)
-		iter_obj.decref()
+		# the object we iterate with; we only release it after the break label, so that breaking does not leak it
+		it = PyObjectLL(None, self)
+		it.declare(name='_iter')
 
-		# the gets the object locally inside of the while expr; we do the full assignment inside the body
-		self.loop_vars.append(PyObjectLL(None, self))
-		self.loop_vars[-1].declare_tmp()
-		stmt = self.ctx.add(c.While(c.Assignment('=', c.ID(self.loop_vars[-1].name), c.FuncCall(c.ID('PyIter_Next'), c.ExprList(c.ID(iter.name)))), c.Compound()))
+		counted = self.counted_loop(node)
+		if counted == 'range' or self._is_range_call(node.iter):
+			item, next_call, store, counter = self._for_range(node, it, counted == 'range')
+		elif counted == 'enumerate':
+			item, next_call, store, counter = self._for_enumerate(node, it)
+		else:
+			item, next_call, store, counter = self._for_iter(node, it)
+
+		# the next helpers return 1 with an item, 0 at the end of the loop, and -1 on error
+		status = CIntegerLL(None, self)
+		status.declare_tmp(name='_next')
+		self.loop_vars.append(item)
+		stmt = self.ctx.add(c.While(c.Constant('integer', 1), c.Compound()))
 		with self.new_context(stmt.stmt):
+			self.ctx.add(c.Assignment('=', c.ID(status.name), next_call))
+			done = self.ctx.add(c.If(c.BinaryOp('!=', c.ID(status.name), c.Constant('integer', 1)), c.Compound(), None))
+			with self.new_context(done.iftrue):
+				status.fail_if_negative(status.name)
+				self.ctx.add(c.Break())
 			with self.new_label(break_label), self.new_label(continue_label):
-				self._store_any(node.target, self.loop_vars[-1])
+				store()
 				self.visit_nodelist(node.body)
 			self.ctx.add(c.Label(continue_label))
-			self.loop_vars[-1].decref()
+			item.decref()
+			if counter:
+				self.ctx.add(c.Assignment('+=', c.ID(counter.name), c.Constant('integer', 1)))
 		self.loop_vars.pop()
-		iter.decref()
+		status.decref()
 
 		# handle the no-break case: else
 		# if we don't jump to forloop, then we need to just run the else block
@@ -1300,6 +1778,116 @@ class Py2C(ASTVisitor):
 
 		# after else, we get the break target
 		self.ctx.add(c.Label(break_label))
+		it.clear()
+		if counter:
+			counter.decref()
+
+
+	def _is_range_call(self, node):
+		return isinstance(node, py.Call) and isinstance(node.func, py.Name) and str(node.func) == 'range' and \
+				not (node.keywords or node.starargs or node.kwargs) and 1 <= len(node.args or []) <= 3
+
+
+	def _declare_loop_state(self, ctype, name):
+		name = self.scope.ctx.reserve_name(name, self.tu)
+		self.scope.ctx.add_variable(c.Decl(name, c.TypeDecl(name, c.IdentifierType(ctype))), need_cleanup=False)
+		return name
+
+
+	def _store_unboxed(self, node, inst):
+		'''Store an unboxed number to node, boxing it unless node is a local we keep unboxed.'''
+		if isinstance(node, py.Name) and self._unboxed_local(node):
+			self._store_any(node, inst)
+			return
+		boxed = inst.as_pyobject()
+		self._store_any(node, boxed)
+		boxed.decref()
+
+
+	def _for_iter(self, node, it):
+		item, next_call = self._iter_sequence(node.iter, it)
+		return item, next_call, lambda: self._store_any(node.target, item), None
+
+
+	def _iter_sequence(self, seq, it):
+		'''Iterate any object; exact lists and tuples are indexed directly, instead of through an iterator.'''
+		index = self._declare_loop_state('Py_ssize_t', '_index')
+		iter_obj = self.visit(seq)
+		self.ctx.add(c.Assignment('=', c.ID(it.name), c.FuncCall(c.ID('MpIter_Get'), c.ExprList(c.ID(iter_obj.name)))))
+		it.fail_if_null(it.name)
+		iter_obj.decref()
+		self.ctx.add(c.Assignment('=', c.ID(index), c.Constant('integer', 0)))
+
+		item = PyObjectLL(None, self)
+		item.declare_tmp()
+		return item, c.FuncCall(c.ID('MpIter_Next'), c.ExprList(c.ID(it.name), c.UnaryOp('&', c.ID(index)), c.UnaryOp('&', c.ID(item.name))))
+
+
+	def _for_range(self, node, it, counted):
+		'''
+		Count over a call to range in c.  If we do not know that the name is the builtin, we check at runtime, and
+		we box each value.  Otherwise, we skip the load of range and hand the values out unboxed.
+		'''
+		r = self._declare_loop_state('MpRange', '_range')
+		args = node.iter.args
+		if counted:
+			range_inst = self.get_builtin('range')
+		else:
+			range_inst = self.visit(node.iter.func)
+
+		if counted and all(self.unboxed_kind(arg) == LONG for arg in args):
+			insts = [self.visit_unboxed(arg) for arg in args]
+			bounds = ([None] if len(insts) == 1 else []) + insts + [None] * (3 - max(len(insts), 2))
+			for i, default in zip((0, 2), (0, 1)):
+				if bounds[i] is None:
+					bounds[i] = CLongLL(None, self)
+					bounds[i].set_constant(default)
+			init = c.FuncCall(c.ID('MpRange_InitLong'), c.ExprList(c.UnaryOp('&', c.ID(r)), c.UnaryOp('&', c.ID(it.name)),
+										c.ID(range_inst.name), *itertools.chain(*((b.value(), b.boxed_value()) for b in bounds))))
+		else:
+			insts = [self.visit(arg).as_pyobject() for arg in args]
+			bounds = ([None] if len(insts) == 1 else []) + insts + [None] * (3 - max(len(insts), 2))
+			init = c.FuncCall(c.ID('MpRange_Init'), c.ExprList(c.UnaryOp('&', c.ID(r)), c.UnaryOp('&', c.ID(it.name)),
+										c.ID(range_inst.name), *[c.ID(b.name) if b else c.ID('NULL') for b in bounds]))
+
+		status = CIntegerLL(None, self)
+		status.declare_tmp()
+		self.ctx.add(c.Assignment('=', c.ID(status.name), init))
+		status.fail_if_negative(status.name)
+		status.decref()
+		for inst in insts:
+			inst.decref()
+		if not counted:
+			range_inst.decref()
+
+		if counted:
+			item = CLongLL(None, self)
+			item.declare_tmp()
+			next_call = c.FuncCall(c.ID('MpRange_NextLong'), c.ExprList(c.UnaryOp('&', c.ID(r)), c.ID(it.name),
+										c.UnaryOp('&', c.ID(item.name)), c.UnaryOp('&', c.ID(item.boxed.name))))
+			return item, next_call, lambda: self._store_unboxed(node.target, item), None
+
+		item = PyObjectLL(None, self)
+		item.declare_tmp()
+		next_call = c.FuncCall(c.ID('MpRange_Next'), c.ExprList(c.UnaryOp('&', c.ID(r)), c.ID(it.name), c.UnaryOp('&', c.ID(item.name))))
+		return item, next_call, lambda: self._store_any(node.target, item), None
+
+
+	def _for_enumerate(self, node, it):
+		'''Iterate the sequence given to the builtin enumerate, counting in a c long instead of building pairs.'''
+		call = node.iter
+		index_name, item_name = node.target.elts
+		item, next_call = self._iter_sequence(call.args[0], it)
+
+		counter = CLongLL(None, self)
+		counter.declare_tmp()
+		self.ctx.add(c.Assignment('=', c.ID(counter.name), c.Constant('integer', call.args[1].n if len(call.args) == 2 else 0)))
+		self.ctx.add(c.Assignment('=', c.ID(counter.boxed.name), c.ID('NULL')))
+
+		def store():
+			self._store_unboxed(index_name, counter)
+			self._store_any(item_name, item)
+		return item, next_call, store, counter
 
 
 	def visit_FunctionDef(self, node):
@@ -1310,6 +1898,8 @@ class Py2C(ASTVisitor):
 		docstring, body = self.split_docstring(node.body)
 		inst = self.create_ll_instance(node.hl)
 		inst.prepare()
+		if isinstance(inst, PyGeneratorLL) and self.opt_stackless_generators:
+			inst.stackless = StacklessCheck().scan(node)
 		inst.create_pystubfunc()
 		inst.create_runnerfunc(*full_args)
 
@@ -1346,6 +1936,8 @@ class Py2C(ASTVisitor):
 								node.args.kwarg)
 
 			# call the low-level runner function from the stub
+			if isinstance(inst, PyGeneratorLL):
+				inst.stacksize = StackEstimate(self.counted_loop).scan(node)
 			inst.transfer_to_runnerfunc(*full_args)
 
 			# emit cleanup and return code
@@ -1355,6 +1947,8 @@ class Py2C(ASTVisitor):
 		with self.new_scope(node.hl, inst.c_runner_func.body):
 			inst.runner_intro()
 			inst.runner_load_args(*full_args)
+			if inst.UNBOXED_LOCALS:
+				inst.unboxed_kinds = NumericLocals(self.counted_loop).scan(node)
 			inst.runner_load_locals()
 			self.comment('body')
 			self.visit_nodelist(body)
@@ -1395,6 +1989,8 @@ class Py2C(ASTVisitor):
 		# prepare the lowlevel
 		inst = self.create_ll_instance(node.hl)
 		inst.prepare()
+		if isinstance(inst, PyGeneratorLL) and self.opt_stackless_generators:
+			inst.stackless = StacklessCheck().scan(node)
 		inst.create_pystubfunc()
 		inst.create_runnerfunc(*full_args)
 
@@ -1410,6 +2006,7 @@ class Py2C(ASTVisitor):
 		with self.new_scope(node.hl, inst.c_pystub_func.body):
 			self.comment('Python interface stub function "{}"'.format(str(node.name)))
 			inst.stub_intro()
+			inst.stacksize = StackEstimate(self.counted_loop).scan(node)
 			inst.transfer_to_runnerfunc(*full_args)
 			inst.stub_outro()
 
@@ -1606,6 +2203,8 @@ class Py2C(ASTVisitor):
 		'''Called once for every module before we enter the emit phase.  We use this to acquire a ll builder name
 			for every module so that we can do things like triangular imports without running into problems.'''
 		node.hl.ll = self.create_ll_instance(node.hl)
+		if self.opt_static_globals or self.opt_static_builtins:
+			self.global_escapes.scan(node)
 
 
 	def visit_Module(self, node):
@@ -1647,9 +2246,11 @@ class Py2C(ASTVisitor):
 				tmp = PyObjectLL(None, self)
 				tmp.declare_tmp(name="_main_")
 				self.main.body.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID(self.ll_module.c_builder_name), c.ExprList())))
+				# Note: finalize, like python does after an uncaught exception, to flush the output that our code buffered
 				self.main.body.add(c.If(c.UnaryOp('!', c.ID(tmp.name)), c.Compound(
 										c.FuncCall(c.ID('__err_show_traceback__'), c.ExprList()),
 										c.FuncCall(c.ID('PyErr_Print'), c.ExprList()),
+										c.FuncCall(c.ID('Py_Finalize'), c.ExprList()),
 										c.Return(c.Constant('integer', 1),
 									)), None))
 				tmp.decref()
@@ -1678,10 +2279,12 @@ class Py2C(ASTVisitor):
 
 
 	def visit_Num(self, node):
-		inst = self.create_ll_instance(node.hl)
-		inst.declare_tmp()
-		inst.new(node.n)
-		return inst
+		if not self.is_constant(node):
+			inst = self.create_ll_instance(node.hl)
+			inst.declare_tmp()
+			inst.new(node.n)
+			return inst
+		return self.load_constant(node)
 
 
 	def visit_Pass(self, node):
@@ -1771,10 +2374,7 @@ class Py2C(ASTVisitor):
 
 
 	def visit_Str(self, node):
-		inst = self.create_ll_instance(node.hl)
-		inst.declare_tmp()
-		inst.new(PyStringType.dequote(node.s))
-		return inst
+		return self.load_constant(node)
 
 
 	def visit_Subscript(self, node):
@@ -1791,8 +2391,12 @@ class Py2C(ASTVisitor):
 				tgtinst.decref()
 				return out
 			else:
-				kinst = self.visit(node.slice)
-				tmp = tgtinst.get_item(kinst)
+				probable = self.probable_container(node.value, tgtinst)
+				kinst = self.visit_item_key(node.slice, probable or tgtinst.__class__, 'get')
+				if isinstance(kinst, CLongLL):
+					tmp = tgtinst.get_item_long(kinst, probable=probable)
+				else:
+					tmp = tgtinst.get_item(kinst, probable=probable)
 				kinst.decref()
 				tgtinst.decref()
 				return tmp
@@ -1854,6 +2458,10 @@ class Py2C(ASTVisitor):
 
 				# implement the body of the matching handler
 				with self.new_context(test.iftrue):
+					# the handler takes the exception, so forget the frames it unwound; the handler may leave by return
+					#		or continue, without reaching the clear at the end of the try
+					self.clear_exception()
+
 					# if we named the exception, fetch (or build it) from the cookie
 					if handler.name:
 						exc_val_inst = self.normalize_exception(exc_cookie)
@@ -1909,11 +2517,15 @@ class Py2C(ASTVisitor):
 			self.visit_nodelist(node.finalbody)
 
 		# if the top-level needs control back to complete, it will set __jmp_ctx__
+		# Note: nothing in the body may have needed to declare it, e.g. if it only loads constants
+		self.declare_jump_context()
 		self.ctx.add(c.If(c.ID('__jmp_ctx__'), c.Compound(c.Goto(c.UnaryOp('*', c.ID('__jmp_ctx__')))), None))
 
 
 	def visit_Tuple(self, node):
-		if node.ctx in [py.Load, py.Aug]:
+		if self.is_constant(node):
+			return self.load_constant(node)
+		elif node.ctx in [py.Load, py.Aug]:
 			inst = self.create_ll_instance(node.hl)
 			inst.declare_tmp()
 			to_pack = [self.visit(n) for n in node.elts] if node.elts else []
@@ -2043,6 +2655,9 @@ class Py2C(ASTVisitor):
 
 
 	def visit_UnaryOp(self, node):
+		if self.unboxed_kind(node):
+			return self._boxed(self.visit_unboxed(node))
+
 		o = self.visit(node.operand)
 
 		inst = PyObjectLL(None, self)
@@ -2086,30 +2701,30 @@ class Py2C(ASTVisitor):
 		# the gets the object locally inside of the while expr; we do the full assignment inside the body
 		tmp = PyObjectLL(None, self)
 		tmp.declare_tmp()
+		self.comp_iters.append(iter)
 		stmt = self.ctx.add(c.While(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyIter_Next'), c.ExprList(c.ID(iter.name)))), c.Compound()))
 		with self.new_context(stmt.stmt):
-			# set this loops variable
+			# set this loops variable; the target holds its own reference
 			self._store_any(node.target, tmp)
+			tmp.decref_only()
 
 			# if we have selectors on this generator, visit them recursively
 			if node.ifs:
-				rv = self.visit_comp_ifs(generators, 0, setter)
-				#iter.decref()
-				#tmp.decref()
-				return rv
+				self.visit_comp_ifs(generators, 0, setter)
 
 			# if we have more generators, visit them, otherwise set our targets
-			if len(generators) > 1:
-				rv = self.visit_comp_generators(generators[1:], setter)
-				#iter.decref()
-				#tmp.decref()
-				return rv
+			elif len(generators) > 1:
+				self.visit_comp_generators(generators[1:], setter)
 
 			# if out of generators, go to setting our result
-			setter()
+			else:
+				setter()
+		self.comp_iters.pop()
+		tmp.tmp_decref()
 
-			#tmp.decref()
-		#iter.decref()
+		# PyIter_Next also returns NULL when the iteration fails
+		iter.fail_if_error_occurred()
+		iter.decref()
 
 
 
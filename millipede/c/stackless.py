@@ -0,0 +1,148 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.c import ast as c
+from millipede.lang.visitor import ASTVisitor
+from millipede.py import ast as py
+
+
+class StacklessCheck(ASTVisitor):
+	'''
+	Find whether a generator can run stackless: as a step function that returns at each yield and jumps back
+	to it on the next call, instead of as a coroutine with its own stack.  A generator that yields inside a
+	try/finally or with block keeps its coroutine, so that we never jump into the middle of their exit paths.
+	'''
+	def __init__(self):
+		super().__init__()
+		self.guarded = 0
+		self.stackless = True
+
+
+	def scan(self, node:py.AST) -> bool:
+		'''Return whether the generator defined by node (a FunctionDef, Lambda or GeneratorExp) can run stackless.'''
+		if isinstance(node, py.GeneratorExp):
+			self.visit(node.elt)
+			self.visit_nodelist(node.generators)
+		elif isinstance(node, py.Lambda):
+			self.visit_nodelist(node.body)
+		else:
+			self.visit_nodelist(node.body)
+		return self.stackless
+
+
+	def visit_Yield(self, node):
+		if self.guarded:
+			self.stackless = False
+		self.generic_visit(node)
+
+
+	def visit_TryFinally(self, node):
+		self.guarded += 1
+		self.generic_visit(node)
+		self.guarded -= 1
+
+
+	def visit_With(self, node):
+		self.visit(node.context_expr)
+		self.guarded += 1
+		self.visit(node.optional_vars)
+		self.visit_nodelist(node.body)
+		self.guarded -= 1
+
+
+	# Note: the yields in nested functions and classes belong to them
+	def visit_FunctionDef(self, node):
+		self.visit_nodelist(node.decorator_list)
+		self.visit(node.args)
+
+
+	def visit_Lambda(self, node):
+		self.visit(node.args)
+
+
+	def visit_GeneratorExp(self, node):
+		self.visit(node.generators[0].iter)
+
+
+	def visit_ClassDef(self, node):
+		self.visit_nodelist(node.decorator_list)
+		self.visit_nodelist(node.bases)
+
+
+class FrameLocals:
+	'''
+	Move the variables of a stackless generator's runner into a struct on the heap, so that they keep their
+	values between the calls that run it.  The frame is zeroed when the generator is created, so the only
+	initializers we keep are the ones that are not zero; we run those after the resume check, on the first
+	call only.  Every use of a variable in the body is rewritten to go through the frame pointer.
+	'''
+	def __init__(self, struct_name, frame_name, param_name):
+		self.struct_name = struct_name
+		self.frame_name = frame_name
+		self.param_name = param_name
+		self.names = set()
+
+
+	def typedecl(self):
+		return c.TypeDecl(None, c.Struct(self.struct_name))
+
+
+	def lower(self, func:c.FuncDef, tu:c.TranslationUnit, resume_check:c.AST):
+		'''Move the variables declared at the top of func's body into the frame and add the frame struct to tu.'''
+		body = func.body
+		decls = body.block_items[:body._vars_pos]
+		stmts = body.block_items[body._vars_pos:]
+
+		fields = []
+		inits = []
+		for decl in decls:
+			self.names.add(decl.name)
+			fields.append(c.Decl(decl.name, decl.type, quals=decl.quals))
+			if decl.init is not None and not self._is_zero(decl.init):
+				inits.append(c.Assignment('=', c.ID(decl.name), decl.init))
+		tu.add_fwddecl(c.Struct(self.struct_name, *fields))
+
+		pos = stmts.index(resume_check) + 1
+		stmts[pos:pos] = inits
+		stmts = [self._replace(stmt) for stmt in stmts]
+
+		frame = c.Decl(self.frame_name, c.PtrDecl(self.typedecl()),
+						init=c.Cast(c.PtrDecl(self.typedecl()), c.ID(self.param_name)))
+		body.block_items = [frame] + stmts
+		body._vars_pos = 1
+
+
+	@staticmethod
+	def _is_zero(init):
+		if isinstance(init, c.ID):
+			return init.name == 'NULL'
+		return isinstance(init, c.Constant) and init.value in (0, '0')
+
+
+	def _replace(self, node):
+		if isinstance(node, c.ID):
+			if node.name in self.names:
+				return c.StructRef(c.ID(self.frame_name), '->', c.ID(node.name))
+			return node
+		if isinstance(node, c.StructRef):
+			# Note: the field names a member, not a variable
+			node.name = self._replace(node.name)
+			return node
+		if isinstance(node, c.UnaryOp) and node.op == '&&':
+			return node
+		if isinstance(node, c.Goto):
+			# Note: only computed goto's name a variable
+			if isinstance(node.name, c.AST):
+				node.name = self._replace(node.name)
+			return node
+		if isinstance(node, c.AST):
+			for f in node._fields:
+				value = getattr(node, f)
+				if isinstance(value, list):
+					value[:] = [self._replace(item) for item in value]
+				elif isinstance(value, tuple):
+					setattr(node, f, tuple(self._replace(item) for item in value))
+				elif isinstance(value, c.AST):
+					setattr(node, f, self._replace(value))
+		return node
@@ -0,0 +1,175 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.c.unboxing import NumericLocals, binop_kind, numeric_kind
+from millipede.lang.visitor import ASTVisitor
+from millipede.py import ast as py
+
+
+COMPARISONS = {py.Eq, py.NotEq, py.Lt, py.LtE, py.Gt, py.GtE}
+
+
+class StackEstimate(ASTVisitor):
+	'''
+	Estimate the coroutine stack that a generator's runner needs.  Any python code that the body runs, runs on
+	our stack and can go to any depth, and nearly everything can run python code: calls, but also operators,
+	comparisons, attribute and item access and iteration, through the type slots of the objects they work on,
+	and any decref, through __del__.  So we give the full default size unless the body is only arithmetic and
+	comparisons over literals and over locals that only ever hold ints or floats (see NumericLocals), counted
+	for loops over range and yields; the slots of ints and floats are all c.  Then the runner's frame, which
+	grows with the size of the body, and a fixed headroom for those slots are all we need.  The runtime rounds
+	the estimate up to its stack size classes.
+
+	counted_loop(node) returns 'range' for the for loops over the builtin range that we count in c.
+	'''
+	# the stack for generators that can run python code; the largest class in genobject.c
+	DEFAULT = 1024 * 1024
+
+	# the stack we leave for the c code of the int and float slots and the runtime
+	HEADROOM = 96 * 1024
+
+	# the runner frame we budget for each ast node in the body
+	NODE_BYTES = 64
+
+	def __init__(self, counted_loop=lambda node: None):
+		super().__init__()
+		self.counted_loop = counted_loop
+		self.kinds = {}
+		self.nodes = 0
+		self.shrink = True
+
+
+	def scan(self, node:py.AST) -> int:
+		'''Return the stack size to use for the generator defined by node (a FunctionDef, Lambda or GeneratorExp).'''
+		# Note: a genexp iterates an arbitrary object, and the objects passed as args are released on our stack
+		if isinstance(node, py.GeneratorExp):
+			return self.DEFAULT
+		args = node.args
+		if args.args or args.vararg or args.kwonlyargs or args.kwarg:
+			return self.DEFAULT
+
+		self.kinds = NumericLocals(self.counted_loop).scan(node)
+		self.visit_nodelist(node.body if isinstance(node.body, list) else [node.body])
+		if not self.shrink:
+			return self.DEFAULT
+		return min(self.DEFAULT, self.HEADROOM + self.nodes * self.NODE_BYTES)
+
+
+	def generic_visit(self, node):
+		# Note: anything we have not shown to stay in c may run python code
+		self.shrink = False
+
+
+	def _name_kind(self, node):
+		return self.kinds.get(str(node))
+
+
+	def _numeric(self, node):
+		'''Count node if it is arithmetic over literals and numeric locals; otherwise, give up on shrinking.'''
+		if numeric_kind(node, self._name_kind) is None:
+			self.shrink = False
+			return
+		self.nodes += self._size(node)
+
+
+	def _test(self, node):
+		'''Count node if it is a numeric value, or a comparison or boolean operation over them.'''
+		if isinstance(node, py.Compare):
+			if not all(op in COMPARISONS for op in node.ops):
+				self.shrink = False
+				return
+			self.nodes += 1
+			for operand in [node.left] + node.comparators:
+				self._numeric(operand)
+		elif isinstance(node, py.BoolOp):
+			self.nodes += 1
+			for value in node.values:
+				self._test(value)
+		elif isinstance(node, py.UnaryOp) and node.op == py.Not:
+			self.nodes += 1
+			self._test(node.operand)
+		else:
+			self._numeric(node)
+
+
+	def _size(self, node):
+		size = 1
+		for f in node._fields:
+			value = getattr(node, f)
+			if isinstance(value, py.AST):
+				size += self._size(value)
+		return size
+
+
+	def _store(self, target):
+		'''Count the store to target if it is a numeric local.'''
+		if not isinstance(target, py.Name) or str(target) not in self.kinds:
+			self.shrink = False
+			return
+		self.nodes += 1
+
+
+	def visit_Expr(self, node):
+		self.nodes += 1
+		if isinstance(node.value, py.Yield):
+			self.visit_Yield(node.value)
+		else:
+			self._numeric(node.value)
+
+
+	def visit_Yield(self, node):
+		self.nodes += 1
+		if node.value is not None:
+			self._numeric(node.value)
+
+
+	def visit_Assign(self, node):
+		self.nodes += 1
+		for target in node.targets:
+			self._store(target)
+		self._numeric(node.value)
+
+
+	def visit_AugAssign(self, node):
+		self.nodes += 1
+		self._store(node.target)
+		if binop_kind(node.op, self._name_kind(node.target), numeric_kind(node.value, self._name_kind)) is None:
+			self.shrink = False
+			return
+		self._numeric(node.value)
+
+
+	def visit_If(self, node):
+		self.nodes += 1
+		self._test(node.test)
+		self.visit_nodelist(node.body)
+		self.visit_nodelist(node.orelse)
+
+	visit_While = visit_If
+
+
+	def visit_For(self, node):
+		# Note: only a counted range never calls the __next__ of an object we do not know
+		if self.counted_loop(node) != 'range':
+			self.shrink = False
+			return
+		self.nodes += 1
+		self._store(node.target)
+		for arg in node.iter.args:
+			self._numeric(arg)
+		self.visit_nodelist(node.body)
+		self.visit_nodelist(node.orelse)
+
+
+	def visit_Return(self, node):
+		self.nodes += 1
+		if node.value is not None:
+			self._numeric(node.value)
+
+
+	def visit_Pass(self, node):
+		self.nodes += 1
+
+	visit_Break = visit_Pass
+	visit_Continue = visit_Pass
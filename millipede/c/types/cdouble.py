@@ -0,0 +1,104 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.c import ast as c
+from millipede.c.types.lltype import LLType
+from millipede.py import ast as py
+
+
+class CDoubleLL(LLType):
+	'''A python float kept unboxed in a c double.'''
+	ctype = 'double'
+
+	OPS = {
+		py.Add: '+',
+		py.Sub: '-',
+		py.Mult: '*',
+	}
+
+	COMPARATORS = {
+		'Py_LT': '<',
+		'Py_LE': '<=',
+		'Py_EQ': '==',
+		'Py_NE': '!=',
+		'Py_GT': '>',
+		'Py_GE': '>=',
+	}
+
+	def __init__(self, hlnode, visitor):
+		super().__init__(hlnode, visitor)
+		self.constant = None
+
+
+	def declare_tmp(self, *, name=None):
+		need_declare = super().declare_tmp(name=name)
+		if need_declare:
+			self.v.scope.ctx.add_variable(c.Decl(self.name, c.TypeDecl(self.name, c.IdentifierType('double'))), need_cleanup=False)
+
+
+	def declare(self, *, name=None):
+		super().declare(name=name)
+		self.v.scope.ctx.add_variable(c.Decl(self.name, c.TypeDecl(self.name, c.IdentifierType('double')), init=c.Constant('double', 0.0)), False)
+
+
+	def set_constant(self, f):
+		self.constant = f
+
+
+	def value(self):
+		if self.constant is not None:
+			return c.Constant('double', self.constant)
+		return c.ID(self.name)
+
+
+	def decref(self):
+		self.tmp_decref()
+
+
+	def box(self, out):
+		'''Store a new python float with our value in out.'''
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PyFloat_FromDouble'), c.ExprList(self.value()))))
+		self.fail_if_null(out.name)
+
+
+	def as_pyobject(self):
+		out = PyFloatLL(None, self.v)
+		out.declare_tmp()
+		self.box(out)
+		return out
+
+
+	def as_double(self):
+		return self
+
+
+	def assign(self, other):
+		assert isinstance(other, CDoubleLL)
+		self.v.ctx.add(c.Assignment('=', c.ID(self.name), other.value()))
+
+
+	def binop(self, op, other, out):
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.BinaryOp(self.OPS[op], self.value(), other.value())))
+
+
+	def negative(self, out):
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.UnaryOp('-', self.value())))
+
+
+	def true_divide(self, other, out):
+		# dividing by zero goes through the float type, so that the error matches the interpreter's
+		check = self.v.ctx.add(c.If(c.FuncCall(c.ID('unlikely'), c.ExprList(
+										c.BinaryOp('==', c.FuncCall(c.ID('MpFloat_TrueDivide'), c.ExprList(
+											self.value(), other.value(), c.UnaryOp('&', c.ID(out.name)))),
+										c.Constant('integer', -1)))), c.Compound(), None))
+		with self.v.new_context(check.iftrue):
+			self.v.capture_error()
+			self.v.exit_with_exception()
+
+
+	def rich_compare_bool(self, other, opid, out_inst):
+		self.v.ctx.add(c.Assignment('=', c.ID(out_inst.name), c.BinaryOp(self.COMPARATORS[opid], self.value(), other.value())))
+
+
+from millipede.c.types.pyfloat import PyFloatLL
@@ -0,0 +1,154 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.c import ast as c
+from millipede.c.types.lltype import LLType
+from millipede.c.types.pyobject import PyObjectLL
+from millipede.py import ast as py
+
+
+class CLongLL(LLType):
+	'''
+	A python int kept unboxed in a c long.  If the value outgrows the long, it is kept in the boxed python int
+	instead; the boxed slot is NULL whenever the long holds the value.  Constants have no boxed slot.
+	'''
+	ctype = 'long'
+
+	# {op: (fast c helper, python number api fallback)}
+	OPS = {
+		py.Add: ('MpLong_Add', 'PyNumber_Add'),
+		py.Sub: ('MpLong_Subtract', 'PyNumber_Subtract'),
+		py.Mult: ('MpLong_Multiply', 'PyNumber_Multiply'),
+		py.FloorDiv: ('MpLong_FloorDivide', 'PyNumber_FloorDivide'),
+		py.Mod: ('MpLong_Remainder', 'PyNumber_Remainder'),
+		py.BitAnd: ('MpLong_And', 'PyNumber_And'),
+		py.BitOr: ('MpLong_Or', 'PyNumber_Or'),
+		py.BitXor: ('MpLong_Xor', 'PyNumber_Xor'),
+	}
+
+	def __init__(self, hlnode, visitor):
+		super().__init__(hlnode, visitor)
+		self.boxed = None
+		self.constant = None
+
+
+	def declare_tmp(self, *, name=None):
+		need_declare = super().declare_tmp(name=name)
+		if need_declare:
+			self.v.scope.ctx.add_variable(c.Decl(self.name, c.TypeDecl(self.name, c.IdentifierType('long'))), need_cleanup=False)
+		# Note: the leading underscore keeps other tmps from taking the slot over while it is free
+		self.boxed = PyObjectLL(None, self.v)
+		self.boxed.declare_tmp(name='_' + self.name + '_boxed')
+
+
+	def declare(self, *, name=None):
+		super().declare(name=name)
+		self.v.scope.ctx.add_variable(c.Decl(self.name, c.TypeDecl(self.name, c.IdentifierType('long')), init=c.Constant('integer', 0)), False)
+		self.boxed = PyObjectLL(None, self.v)
+		self.boxed.declare(name=self.name + '_boxed')
+
+
+	def set_constant(self, n):
+		self.constant = n
+
+
+	def value(self):
+		if self.constant is not None:
+			return c.Constant('integer', self.constant)
+		return c.ID(self.name)
+
+
+	def boxed_value(self):
+		return c.ID(self.boxed.name) if self.boxed else c.ID('NULL')
+
+
+	def decref(self):
+		if self.is_tmp:
+			self.v.ctx.add(c.FuncCall(c.ID('Py_CLEAR'), c.ExprList(c.ID(self.boxed.name))))
+			self.boxed.tmp_decref()
+		self.tmp_decref()
+	def decref_only(self):
+		if self.boxed:
+			self.v.ctx.add(c.FuncCall(c.ID('Py_CLEAR'), c.ExprList(c.ID(self.boxed.name))))
+
+
+	def _fail_if_error(self, call):
+		check = self.v.ctx.add(c.If(c.FuncCall(c.ID('unlikely'), c.ExprList(
+										c.BinaryOp('==', call, c.Constant('integer', -1)))), c.Compound(), None))
+		with self.v.new_context(check.iftrue):
+			self.v.capture_error()
+			self.v.exit_with_exception()
+
+
+	def box(self, out):
+		'''Store a new python int with our value in out.'''
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('MpLong_Box'), c.ExprList(self.value(), self.boxed_value()))))
+		self.fail_if_null(out.name)
+
+
+	def as_pyobject(self):
+		out = PyIntegerLL(None, self.v)
+		out.declare_tmp()
+		self.box(out)
+		return out
+
+
+	def as_double(self):
+		'''Return a new CDoubleLL holding this value; raises OverflowError, like python, if it does not fit.'''
+		out = CDoubleLL(None, self.v)
+		if self.constant is not None:
+			out.set_constant(float(self.constant))
+			return out
+		out.declare_tmp()
+		self._fail_if_error(c.FuncCall(c.ID('MpLong_AsDouble'), c.ExprList(
+										self.value(), self.boxed_value(), c.UnaryOp('&', c.ID(out.name)))))
+		return out
+
+
+	def assign(self, other):
+		'''Store the value of other, taking a reference to its boxed value, if any.'''
+		assert isinstance(other, CLongLL)
+		self.v.ctx.add(c.Assignment('=', c.ID(self.name), other.value()))
+		self.v.ctx.add(c.FuncCall(c.ID('Py_XDECREF'), c.ExprList(c.ID(self.boxed.name))))
+		self.v.ctx.add(c.Assignment('=', c.ID(self.boxed.name), other.boxed_value()))
+		if other.boxed:
+			self.v.ctx.add(c.FuncCall(c.ID('Py_XINCREF'), c.ExprList(c.ID(self.boxed.name))))
+
+
+	def binop(self, op, other, out):
+		fast, slow = self.OPS[op]
+		self.v.ctx.add(c.Assignment('=', c.ID(out.boxed.name), c.ID('NULL')))
+
+		# we can only take the fast path if neither side is boxed and the result fits
+		cond = c.FuncCall(c.ID(fast), c.ExprList(self.value(), other.value(), c.UnaryOp('&', c.ID(out.name))))
+		for inst in (other, self) if other is not self else (self,):
+			if inst.boxed:
+				cond = c.BinaryOp('||', c.ID(inst.boxed.name), cond)
+		slow_path = self.v.ctx.add(c.If(c.FuncCall(c.ID('unlikely'), c.ExprList(cond)), c.Compound(), None))
+		with self.v.new_context(slow_path.iftrue):
+			self._fail_if_error(c.FuncCall(c.ID('MpLong_Slow'), c.ExprList(c.ID(slow),
+										self.value(), self.boxed_value(), other.value(), other.boxed_value(),
+										c.UnaryOp('&', c.ID(out.name)), c.UnaryOp('&', c.ID(out.boxed.name)))))
+
+
+	def negative(self, out):
+		zero = CLongLL(None, self.v)
+		zero.set_constant(0)
+		zero.binop(py.Sub, self, out)
+
+
+	def true_divide(self, other, out):
+		self._fail_if_error(c.FuncCall(c.ID('MpLong_TrueDivide'), c.ExprList(
+										self.value(), self.boxed_value(), other.value(), other.boxed_value(),
+										c.UnaryOp('&', c.ID(out.name)))))
+
+
+	def rich_compare_bool(self, other, opid, out_inst):
+		self.v.ctx.add(c.Assignment('=', c.ID(out_inst.name), c.FuncCall(c.ID('MpLong_RichCompare'), c.ExprList(
+										self.value(), self.boxed_value(), other.value(), other.boxed_value(), c.ID(opid)))))
+		self.fail_if_negative(out_inst.name)
+
+
+from millipede.c.types.cdouble import CDoubleLL
+from millipede.c.types.pyinteger import PyIntegerLL
@@ -20,14 +20,18 @@ class PyBytesLL(PyObjectLL):
 		return len(b)
 
 
+	@classmethod
+	def initializer(cls, py_init):
+		'''Return a C expression that creates a new bytes for the (dequoted) python literal py_init.'''
+		init = cls.bytes2c(py_init)
+		strlen = cls.strlen(init)
+		assert all(map(lambda x: ord(x) < 256 and ord(x) >= 0, init)), 'Out of range character for char in: {}'.format(init)
+		return c.FuncCall(c.ID('PyBytes_FromStringAndSize'), c.ExprList(c.Constant('string', init), c.Constant('integer', strlen)))
+
+
 	def new(self, py_init):
 		super().new()
-		init = self.bytes2c(py_init)
-		strlen = self.strlen(init)
-		assert all(map(lambda x: ord(x) < 256 and ord(x) >= 0, init)), 'Out of range character for char in: {}'.format(init)
-		self.v.ctx.add(c.Assignment('=', c.ID(self.name), c.FuncCall(c.ID('PyBytes_FromStringAndSize'), c.ExprList(
-											c.Constant('string', init),
-											c.Constant('integer', strlen)))))
+		self.v.ctx.add(c.Assignment('=', c.ID(self.name), self.initializer(py_init)))
 		self.fail_if_null(self.name)
 
 
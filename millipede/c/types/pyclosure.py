@@ -4,6 +4,7 @@ All rights reserved.
 '''
 from contextlib import contextmanager
 from millipede.c import ast as c
+from millipede.c.capture import CaptureScan
 from millipede.c.types.integer import CIntegerLL
 from millipede.c.types.pydict import PyDictLL
 from millipede.c.types.pyfunction import PyFunctionLL
@@ -18,20 +19,28 @@ class PyClosureLL(PyFunctionLL):
 	Creation:
 		- create in context with MpFunction_New
 		- create a new stack (MpStack*) of len(list(self.each_func_scope()))
-		- copy from __locals__ of creator (should be local) to new array in positions 0->n-1
+		- for our creator's level, n-1, create a new MpLocals holding only the cells we use from our creator
+		- share our creator's captures for the levels below that which we use, in positions 0->n-2
 		- set the locals on the new function object
 	PyStub:
 		<same>
 	Runner:
 		- on entry, grab the "locals" out of __self__ and put into local __locals__
-		- create a MpLocals* for this run of the function, set on __locals__ at position n
+		- create a MpLocals* for this run of the function, set on __locals__ at position n; except in generators,
+			the storage lives in the runner's c frame, since nested functions only ever hold cells
+		- give each local that a nested function uses a cell
 		- put all args into the new MpLocals array, no further decl required for locals
-		- modified get/set attribute to assign into the locals according to the locals_map
+		- modified get/set attribute to assign into the locals according to the locals_map, going through
+			the cell for captured locals
 		- on exit, free __locals__[n]
 	Call Time:
 		- before: nothing
 		- after: restore __locals__[n], they may have been overridden by a recursive call 
 	'''
+	UNBOXED_LOCALS = False
+
+	# keep the locals of a call in the runner's c frame
+	FRAME_LOCALS = True
 
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -39,6 +48,14 @@ class PyClosureLL(PyFunctionLL):
 		# the c instance representing the array of local variables
 		self.stack_name = None
 		self.locals_name = None
+		self.cell_name = None
+
+		# our locals that functions nested in ours use, in the order of their slots; these are held in cells and
+		#		functions that capture them find them at their position in this list
+		self.captured = []
+
+		# the names of each function scope around us that we, or a function nested in us, use
+		self.free_names = {} # {MpFunction: {str}}
 
 
 	@staticmethod
@@ -61,18 +78,29 @@ class PyClosureLL(PyFunctionLL):
 
 	def prepare(self):
 		# build the "locals" map:
-		# The locals pointer contains all of the names accessible from the current function, not just the really locals.
-		# The top level of indirection points to a set of PyObject*[] containing the locals for ourself and for all lower
-		#	frames, in order.  Some variable names will mask others below them.  Since we can know this pattern
-		#	of masking, inheritance, etc statically, we discover this here and encode the info into variable accesses
-		#	that are made in this scope.
+		# The top level of indirection (the stack) points to a set of PyObject*[] for ourself and for all lower
+		#	frames, in order.  Our own level holds all of our locals, with the ones that nested functions use held
+		#	in cells.  The lower levels only hold the cells that we capture from that frame, at their position
+		#	in the owning function's captured list, so a closure does not keep alive anything it does not use.
+		#	Since variable masking is static, names are always accessed through the ll of the scope that owns them.
+		scopes = list(reversed(list(self.each_func_scope())))
+		self.own_scope_offset = len(scopes) - 1
 		self.locals_map = {} # {str: (int, int)}
-		for i, scope in enumerate(reversed(list(self.each_func_scope()))):
-			names = list(scope.symbols.keys())
-			local_names = [n for n in names if not isinstance(scope.symbols[n], NameRef)]
-			for j, name in enumerate(local_names):
-				self.locals_map[name] = (i, j)
-		self.own_scope_offset = len(list(self.each_func_scope())) - 1
+		local_names = [n for n, sym in self.hlnode.symbols.items() if not isinstance(sym, NameRef)]
+		for j, name in enumerate(local_names):
+			self.locals_map[name] = (self.own_scope_offset, j)
+
+		used, nested = CaptureScan(self.v.inline_consumer).scan(self.hlnode.ast)
+		self.captured = [n for n in local_names if n in nested.get(self.hlnode, ())]
+		self.free_names = {scope: used[scope] for scope in scopes[:-1] if scope in used}
+
+
+	def _in_own_runner(self) -> bool:
+		'''True if the code we are emitting runs in our own runner, rather than in a function nested in ours.'''
+		scope = self.v.scope
+		while scope and not isinstance(scope, MpFunction):
+			scope = scope.owner.parent
+		return scope is self.hlnode
 
 
 	def declare_function_object(self, docstring):
@@ -100,11 +128,16 @@ class PyClosureLL(PyFunctionLL):
 		else:
 			c_parent_stack = c.ID('__stack__')
 
-		for i in range(self.own_scope_offset):
+		scopes = list(reversed(list(self.each_func_scope())))
+		for i in range(self.own_scope_offset - 1):
+			if not self.free_names.get(scopes[i]):
+				continue
 			self.v.ctx.add(c.FuncCall(c.ID('MpStack_SetLocals'), c.ExprList(
 																		c.ID(stack_name),
 																		c.Constant('integer', i),
 																		c.ArrayRef(c_parent_stack, c.Constant('integer', i)))))
+		if self.own_scope_offset > 0:
+			self._capture_from_parent(scopes[-2], stack_name, c_parent_stack)
 
 		# set the locals on the new function object
 		self.v.ctx.add(c.FuncCall(c.ID('MpFunction_SetStack'), c.ExprList(
@@ -115,6 +148,27 @@ class PyClosureLL(PyFunctionLL):
 		return self.c_obj
 
 
+	def _capture_from_parent(self, parent, stack_name, c_parent_stack):
+		'''Build the level of our stack for the function defining us, from the cells of its that we use.'''
+		level = self.own_scope_offset - 1
+		names = [n for n in parent.ll.captured if n in self.free_names.get(parent, ())]
+		if not names:
+			return
+		captures = self.v.scope.ctx.tmpname(self.v.tu)
+		self.v.scope.ctx.add_variable(c.Decl(captures, self.locals_typedecl(captures)), False)
+		self.v.ctx.add(c.Assignment('=', c.ID(captures), c.FuncCall(c.ID('MpLocals_Create'), c.ExprList(
+																							c.Constant('integer', len(parent.ll.captured))))))
+		self.fail_if_null(captures)
+		for name in names:
+			self.v.ctx.add(c.FuncCall(c.ID('MpLocals_Capture'), c.ExprList(
+																	c.ID(captures),
+																	c.Constant('integer', parent.ll.captured.index(name)),
+																	c.ArrayRef(c_parent_stack, c.Constant('integer', level)),
+																	c.Constant('integer', parent.ll.locals_map[name][1]))))
+		self.v.ctx.add(c.FuncCall(c.ID('MpStack_SetLocals'), c.ExprList(
+																	c.ID(stack_name), c.Constant('integer', level), c.ID(captures))))
+
+
 	@contextmanager
 	def maybe_recursive_call(self):
 		yield
@@ -139,13 +193,39 @@ class PyClosureLL(PyFunctionLL):
 		# create a MpLocals* for this run of the function, set on __locals__ at position n
 		self.locals_name = self.v.scope.ctx.reserve_name('__locals__', self.v.tu)
 		self.v.scope.ctx.add_variable(c.Decl(self.locals_name, self.locals_typedecl(self.locals_name)), False)
-		self.v.ctx.add(c.Assignment('=', c.ID(self.locals_name), c.FuncCall(c.ID('MpLocals_Create'), c.ExprList(c.Constant('integer', len(self.local_syms))))))
-		self.fail_if_null(self.locals_name)
+		if self.FRAME_LOCALS:
+			self._frame_locals()
+		else:
+			self.v.ctx.add(c.Assignment('=', c.ID(self.locals_name), c.FuncCall(c.ID('MpLocals_Create'), c.ExprList(c.Constant('integer', len(self.local_syms))))))
+			self.fail_if_null(self.locals_name)
 		self.v.ctx.add(c.FuncCall(c.ID('MpStack_SetLocals'), c.ExprList(
 															c.ID(self.stack_name),
 															c.Constant('integer', self.own_scope_offset),
 															c.ID(self.locals_name))))
 
+		# give each local that a nested function uses its cell
+		if self.captured:
+			self.cell_name = self.v.scope.ctx.reserve_name('__cell__', self.v.tu)
+			self.v.scope.ctx.add_variable(c.Decl(self.cell_name, PyObjectLL.typedecl(self.cell_name), init=c.ID('NULL')), False)
+		for name in self.captured:
+			self.v.ctx.add(c.Assignment('=', c.ID(self.cell_name), c.FuncCall(c.ID('PyCell_New'), c.ExprList(c.ID('NULL')))))
+			self.fail_if_null(self.cell_name)
+			self.v.ctx.add(c.Assignment('=', self._slot(*self.locals_map[name]), c.ID(self.cell_name)))
+
+
+	def _frame_locals(self):
+		'''Keep our locals in the runner's frame; nothing else can hold them after we clean them up.'''
+		frame = self.v.scope.ctx.reserve_name('__locals_frame__', self.v.tu)
+		self.v.scope.ctx.add_variable(c.Decl(frame, c.TypeDecl(frame, c.IdentifierType('MpLocals'))), False)
+		if self.local_syms:
+			items = self.v.scope.ctx.reserve_name('__locals_items__', self.v.tu)
+			self.v.scope.ctx.add_variable(c.Decl(items, c.ArrayDecl(PyObjectLL.typedecl(items), len(self.local_syms))), False)
+			c_items = c.ID(items)
+		else:
+			c_items = c.ID('NULL')
+		self.v.ctx.add(c.Assignment('=', c.ID(self.locals_name), c.FuncCall(c.ID('MpLocals_Init'), c.ExprList(
+															c.UnaryOp('&', c.ID(frame)), c_items, c.Constant('integer', len(self.local_syms))))))
+
 
 	def runner_load_args(self, args, vararg, kwonlyargs, kwarg):
 		# put all args into the new MpLocals array, no further decl required for locals
@@ -170,26 +250,48 @@ class PyClosureLL(PyFunctionLL):
 																					c.ID(self.stack_name), c.Constant('integer', self.own_scope_offset))))
 
 
-	def del_attr_string(self, attrname):
+	def _slot(self, i, j):
+		return c.ArrayRef(c.StructRef(c.ArrayRef(c.ID(self.stack_name), c.Constant('integer', i)), '->', c.ID('locals')), c.Constant('integer', j))
+
+
+	def _ref(self, attrname):
+		'''Return the c slot that holds attrname in the code we are emitting, and whether the slot holds a cell.'''
 		i, j = self.locals_map[attrname]
-		ref = c.ArrayRef(c.StructRef(c.ArrayRef(c.ID(self.stack_name), c.Constant('integer', i)), '->', c.ID('locals')), c.Constant('integer', j))
-		self.v.ctx.add(c.FuncCall(c.ID('Py_CLEAR'), c.ExprList(ref)))
+		if self._in_own_runner():
+			return self._slot(i, j), attrname in self.captured
+		return self._slot(i, self.captured.index(attrname)), True
+
+
+	def del_attr_string(self, attrname):
+		ref, is_cell = self._ref(attrname)
+		if is_cell:
+			self.v.ctx.add(c.FuncCall(c.ID('PyCell_Set'), c.ExprList(ref, c.ID('NULL'))))
+		else:
+			self.v.ctx.add(c.FuncCall(c.ID('Py_CLEAR'), c.ExprList(ref)))
 
 
 	def set_attr_string(self, attrname, val):
-		i, j = self.locals_map[attrname]
-		ref = c.ArrayRef(c.StructRef(c.ArrayRef(c.ID(self.stack_name), c.Constant('integer', i)), '->', c.ID('locals')), c.Constant('integer', j))
-		self.v.ctx.add(c.FuncCall(c.ID('Py_XDECREF'), c.ExprList(ref)))
+		ref, is_cell = self._ref(attrname)
 		val = val.as_pyobject()
+		if is_cell:
+			self.v.ctx.add(c.FuncCall(c.ID('PyCell_Set'), c.ExprList(ref, c.ID(val.name))))
+			return
+		self.v.ctx.add(c.FuncCall(c.ID('Py_XDECREF'), c.ExprList(ref)))
 		val.incref()
 		self.v.ctx.add(c.Assignment('=', ref, c.ID(val.name)))
 
 
 	def get_attr_string(self, attrname, outvar):
-		i, j = self.locals_map[attrname]
-		ref = c.ArrayRef(c.StructRef(c.ArrayRef(c.ID(self.stack_name), c.Constant('integer', i)), '->', c.ID('locals')), c.Constant('integer', j))
-		self.v.ctx.add(c.Assignment('=', c.ID(outvar.name), ref))
-		self.except_if_null(outvar.name, 'PyExc_UnboundLocalError', "local variable '{}' referenced before assignment".format(attrname))
+		ref, is_cell = self._ref(attrname)
+		if not is_cell:
+			self.v.ctx.add(c.Assignment('=', c.ID(outvar.name), ref))
+			self.except_if_null(outvar.name, 'PyExc_UnboundLocalError', "local variable '{}' referenced before assignment".format(attrname))
+		else:
+			self.v.ctx.add(c.Assignment('=', c.ID(outvar.name), c.FuncCall(c.ID('PyCell_GET'), c.ExprList(ref))))
+			if self._in_own_runner():
+				self.except_if_null(outvar.name, 'PyExc_UnboundLocalError', "local variable '{}' referenced before assignment".format(attrname))
+			else:
+				self.except_if_null(outvar.name, 'PyExc_NameError', "free variable '{}' referenced before assignment in enclosing scope".format(attrname))
 		outvar.incref()
 
 
@@ -8,6 +8,12 @@ from millipede.c.types.pyobject import PyObjectLL
 
 
 class PyDictLL(PyObjectLL):
+	ITEM_HELPERS = {
+		'get': ('MpDict_GetItem', 'MpDict_GetItemIfExact'),
+		'set': ('PyDict_SetItem', 'MpDict_SetItemIfExact'),
+		'contains': ('PyDict_Contains', 'MpDict_ContainsIfExact'),
+	}
+
 	def new(self):
 		super().new()
 		self.v.ctx.add(c.Assignment('=', c.ID(self.name), c.FuncCall(c.ID('PyDict_New'), c.ExprList())))
@@ -17,7 +23,8 @@ class PyDictLL(PyObjectLL):
 	def del_item_string(self, name:str):
 		tmp = CIntegerLL(None, self.v)
 		tmp.declare_tmp(name='_del_rv')
-		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyDict_DelItemString'), c.ExprList(c.ID(self.name), c.Constant('string', name)))))
+		key = self.v.get_name(name)
+		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyDict_DelItem'), c.ExprList(c.ID(self.name), c.ID(key.name)))))
 		self.fail_if_nonzero(tmp.name)
 
 
@@ -26,34 +33,26 @@ class PyDictLL(PyObjectLL):
 		tmp.declare_tmp(name='_set_str_rv')
 		var = var.as_pyobject()
 		#var.incref()
-		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyDict_SetItemString'), c.ExprList(
-											c.ID(self.name), c.Constant('string', name), c.ID(var.name)))))
-		self.fail_if_nonzero(tmp.name)
-		tmp.decref()
-
-
-	def set_item(self, key:PyObjectLL, val:PyObjectLL):
-		tmp = CIntegerLL(None, self.v)
-		tmp.declare_tmp(name='_set_rv')
-		#key.incref()
-		#val.incref()
+		key = self.v.get_name(name)
 		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyDict_SetItem'), c.ExprList(
-											c.ID(self.name), c.ID(key.name), c.ID(val.name)))))
+											c.ID(self.name), c.ID(key.name), c.ID(var.name)))))
 		self.fail_if_nonzero(tmp.name)
 		tmp.decref()
 
 
 	def get_item_string(self, name:str, out:PyObjectLL, error_type='PyExc_KeyError', error_str=None):
-		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PyDict_GetItemString'), c.ExprList(
-												c.ID(self.name), c.Constant('string', name)))))
+		key = self.v.get_name(name)
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PyDict_GetItem'), c.ExprList(
+												c.ID(self.name), c.ID(key.name)))))
 		self.except_if_null(out.name, error_type, error_str)
 		out.incref()
 		return out
 
 
 	def get_item_string_nofail(self, name:str, out:PyObjectLL):
-		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PyDict_GetItemString'), c.ExprList(
-												c.ID(self.name), c.Constant('string', name)))))
+		key = self.v.get_name(name)
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PyDict_GetItem'), c.ExprList(
+												c.ID(self.name), c.ID(key.name)))))
 		out.xincref()
 		return out
 
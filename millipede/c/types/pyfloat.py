@@ -7,9 +7,16 @@ from millipede.c.types.pyobject import PyObjectLL
 
 
 class PyFloatLL(PyObjectLL):
+	@staticmethod
+	def initializer(n):
+		'''Return a C expression that creates a new float for the python constant n.'''
+		return c.FuncCall(c.ID('PyFloat_FromDouble'), c.ExprList(c.Constant('double', n)))
+
+
 	def new(self, n):
 		super().new()
-		return self._new_from_double(c.Constant('double', n))
+		self.v.ctx.add(c.Assignment('=', c.ID(self.name), self.initializer(n)))
+		self.fail_if_null(self.name)
 
 
 	def _new_from_double(self, c_n):
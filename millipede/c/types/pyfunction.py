@@ -4,6 +4,8 @@ All rights reserved.
 '''
 from contextlib import contextmanager
 from millipede.c import ast as c
+from millipede.c.types.cdouble import CDoubleLL
+from millipede.c.types.clong import CLongLL
 from millipede.c.types.integer import CIntegerLL
 from millipede.c.types.pydict import PyDictLL
 from millipede.c.types.pyinteger import PyIntegerLL
@@ -14,6 +16,9 @@ from millipede.hl.nodes.name import Name
 
 
 class PyFunctionLL(PyObjectLL):
+	# the runner keeps locals in plain c variables, so locals that only ever hold numbers can be unboxed
+	UNBOXED_LOCALS = True
+
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
 
@@ -36,6 +41,13 @@ class PyFunctionLL(PyObjectLL):
 		self.stub_kwargs_dict = None
 		self.stub_arg_insts = []
 
+		# the number of positional args the runner takes when callers can skip the stub and call it directly
+		self.direct_arity = None
+
+		# the kinds of the locals we keep unboxed, and their ll instances once declared
+		self.unboxed_kinds = {} # {str: str}
+		self.unboxed = {} # {str: CLongLL or CDoubleLL}
+
 
 	def prepare(self):
 		pass
@@ -172,50 +184,63 @@ class PyFunctionLL(PyObjectLL):
 				arg_insts[i] = PyObjectLL(arg.arg.hl, self.v)
 				arg_insts[i].declare()
 
-				# query if in positional args
-				self.v.ctx.add(c.Comment("Grab arg {}".format(str(arg.arg))))
-				query_inst = self.v.ctx.add(c.If(c.BinaryOp('>', c.ID(c_args_size.name), c.Constant('integer', i)), c.Compound(), c.Compound()))
-
-				## get the positional arg on the true side
-				with self.v.new_context(query_inst.iftrue):
-					args_tuple.get_unchecked(i, arg_insts[i])
-
-				## get the keyword arg on the false side
-				with self.v.new_context(query_inst.iffalse):
-					have_kwarg = self.v.ctx.add(c.If(c.ID('kwargs'), c.Compound(), None))
-
-					### if we took kwargs, then get it directly
-					with self.v.new_context(have_kwarg.iftrue):
-						kwargs_dict.get_item_string_nofail(str(arg.arg), arg_insts[i])
-
-					### if no kwargs passed or the item was not in the kwargs, load the default from defaults
-					query_default_inst = self.v.ctx.add(c.If(c.UnaryOp('!', c.ID(arg_insts[i].name)), c.Compound(), c.Compound()))
-					with self.v.new_context(query_default_inst.iftrue):
-						kwstartoffset = len(args) - len(defaults)
-						if i >= kwstartoffset:
-							# try loading from defaults
-							default_offset = i - kwstartoffset
-							tmp = PyTupleLL(None, self.v)
-							tmp.declare_tmp()
-							self.c_obj.get_attr_string('__defaults__', tmp)
-							#self.v.ctx.add(c.Assignment('=', c.ID(tmp.name),
-							#		c.FuncCall(c.ID('PyObject_GetAttrString'), c.ExprList(c.ID(self.c_obj.name), c.Constant('string', '__defaults__')))))
-							#
-							tmp.get_unchecked(default_offset, arg_insts[i])
-							#self.v.ctx.add(c.Assignment('=', c.ID(arg_insts[i].name),
-							#		c.FuncCall(c.ID('PyTuple_GetItem'), c.ExprList(c.ID(tmp.name), c.Constant('integer', default_offset)))))
-							arg_insts[i].incref()
-							tmp.decref()
-							#self.v.ctx.add(c.FuncCall(c.ID('Py_INCREF'), c.ID(arg_insts[i].name)))
-						else:
-							# emit an error for an unpassed arg
-							with self.v.new_context(query_default_inst.iftrue):
-								self.fail('PyExc_TypeError', 'Missing arg {}'.format(str(arg)))
-
-					### if we did get the item out of the kwargs, delete it from the inst copy so it's not duped in the args we pass 
-					with self.v.new_context(query_default_inst.iffalse):
-						if kwargs_inst:
-							kwargs_inst.del_item_string(str(arg.arg))
+			# without keywords, the runtime can bind the positional args and defaults in one go
+			self.v.ctx.add(c.Comment("Bind positional args"))
+			positional = self.v.scope.ctx.reserve_name('__positional__', self.v.tu)
+			self.v.scope.ctx.add_variable(c.Decl(positional, c.ArrayDecl(PyObjectLL.typedecl(positional), len(args))), False)
+			bound = CIntegerLL(None, self.v)
+			bound.declare_tmp(name='_bound')
+			bound.set_constant(-1)
+			no_keywords = c.BinaryOp('||', c.UnaryOp('!', c.ID('kwargs')),
+									c.BinaryOp('==', c.FuncCall(c.ID('PyDict_Size'), c.ExprList(c.ID('kwargs'))), c.Constant('integer', 0)))
+			self.v.ctx.add(c.If(no_keywords, c.Compound(
+									c.Assignment('=', c.ID(bound.name), c.FuncCall(c.ID('MpFunction_BindPositional'), c.ExprList(
+											c.ID(self.stub_self_inst.name), c.ID(args_tuple.name), c.Constant('integer', len(args)),
+											c.Constant('integer', 1 if vararg else 0), c.ID(positional))))), None))
+			is_bound = self.v.ctx.add(c.If(c.BinaryOp('==', c.ID(bound.name), c.Constant('integer', 0)), c.Compound(), c.Compound()))
+			bound.decref()
+			with self.v.new_context(is_bound.iftrue):
+				for i, inst in enumerate(arg_insts):
+					self.v.ctx.add(c.Assignment('=', c.ID(inst.name), c.ArrayRef(c.ID(positional), c.Constant('integer', i))))
+
+			# otherwise, look for each arg by position, then keyword, then default
+			with self.v.new_context(is_bound.iffalse):
+				for i, arg in enumerate(args):
+					# query if in positional args
+					self.v.ctx.add(c.Comment("Grab arg {}".format(str(arg.arg))))
+					query_inst = self.v.ctx.add(c.If(c.BinaryOp('>', c.ID(c_args_size.name), c.Constant('integer', i)), c.Compound(), c.Compound()))
+
+					## get the positional arg on the true side
+					with self.v.new_context(query_inst.iftrue):
+						args_tuple.get_unchecked(i, arg_insts[i])
+
+					## get the keyword arg on the false side
+					with self.v.new_context(query_inst.iffalse):
+						have_kwarg = self.v.ctx.add(c.If(c.ID('kwargs'), c.Compound(), None))
+
+						### if we took kwargs, then get it directly
+						with self.v.new_context(have_kwarg.iftrue):
+							kwargs_dict.get_item_string_nofail(str(arg.arg), arg_insts[i])
+
+						### if no kwargs passed or the item was not in the kwargs, load the default from defaults
+						query_default_inst = self.v.ctx.add(c.If(c.UnaryOp('!', c.ID(arg_insts[i].name)), c.Compound(), c.Compound()))
+						with self.v.new_context(query_default_inst.iftrue):
+							kwstartoffset = len(args) - len(defaults)
+							if i >= kwstartoffset:
+								# try loading from defaults
+								default_offset = i - kwstartoffset
+								self.v.ctx.add(c.Assignment('=', c.ID(arg_insts[i].name), c.FuncCall(c.ID('MpFunction_GetDefault'), c.ExprList(
+																		c.ID(self.stub_self_inst.name), c.Constant('integer', default_offset)))))
+								self.fail_if_null(arg_insts[i].name)
+							else:
+								# emit an error for an unpassed arg
+								with self.v.new_context(query_default_inst.iftrue):
+									self.fail('PyExc_TypeError', 'Missing arg {}'.format(str(arg)))
+
+						### if we did get the item out of the kwargs, delete it from the inst copy so it's not duped in the args we pass 
+						with self.v.new_context(query_default_inst.iffalse):
+							if kwargs_inst:
+								kwargs_inst.del_item_string(str(arg.arg))
 			self.stub_arg_insts.extend(arg_insts)
 
 		# add unused args to varargs and pass if in taken args or error if not
@@ -250,7 +275,7 @@ class PyFunctionLL(PyObjectLL):
 					with self.v.new_context(need_default.iftrue):
 						kwdefaults0 = PyDictLL(None, self.v)
 						kwdefaults0.declare_tmp(name='_kwdefaults')
-						self.c_obj.get_attr_string('__kwdefaults__', kwdefaults0)
+						self.stub_self_inst.get_attr_string('__kwdefaults__', kwdefaults0)
 						kwdefaults0.get_item_string(str(arg.arg), kwarg_insts[i])
 						kwdefaults0.decref()
 					### found in kwdict, means we need to delete from kwdict to avoid passing duplicate arg in kwargs
@@ -264,7 +289,7 @@ class PyFunctionLL(PyObjectLL):
 			with self.v.new_context(have_kwarg.iffalse):
 				kwdefaults1 = PyDictLL(None, self.v)
 				kwdefaults1.declare_tmp(name='_kwdefaults')
-				self.c_obj.get_attr_string('__kwdefaults__', kwdefaults1)
+				self.stub_self_inst.get_attr_string('__kwdefaults__', kwdefaults1)
 				for i, arg in enumerate(kwonlyargs):
 					#have_kwarg.iffalse.add(c.Assignment('=', c.ID(kwdefaults1.name),
 					#	c.FuncCall(c.ID('PyObject_GetAttrString'), c.ExprList(c.ID(self.c_obj.name), c.Constant('string', '__kwdefaults__')))))
@@ -356,6 +381,10 @@ class PyFunctionLL(PyObjectLL):
 		param_list = c.ParamList(base_decl, *(arg_decls + kw_decls))
 		self._create_runner_common(param_list, PyObjectLL.typedecl(), body)
 
+		# with only positional args, the runner's parameters are exactly what a positional call site passes
+		if not (vararg or kwonlyargs or kwarg):
+			self.direct_arity = len(args)
+
 
 	def _create_runner_common(self, param_list, return_ty, body):
 		name = self.v.tu.reserve_global_name(self.hlnode.owner.global_c_name + '_runner')
@@ -367,6 +396,13 @@ class PyFunctionLL(PyObjectLL):
 		self.v.tu.add(self.c_runner_func)
 
 
+	def call_direct(self, func_inst, arg_insts, out_var):
+		'''Call our runner with positional args, skipping the stub.  func_inst must be our function object.'''
+		self.v.ctx.add(c.Assignment('=', c.ID(out_var.name), c.FuncCall(c.ID(self.c_runner_func.decl.name),
+															c.ExprList(c.ID(func_inst.name), *[c.ID(inst.name) for inst in arg_insts]))))
+		self.fail_if_null(out_var.name)
+
+
 	def runner_load_args(self, args, vararg, kwonlyargs, kwarg):
 		# load args from parameter list into the locals
 		for arg in args:
@@ -391,8 +427,14 @@ class PyFunctionLL(PyObjectLL):
 		for name, sym in self.hlnode.symbols.items():
 			#if name not in self.locals_map and isinstance(sym, Name):
 			if name not in self.locals_map and sym.parent.ll is self:
-				arg_inst = self.v.create_ll_instance(sym)
-				arg_inst.declare()
+				if name in self.unboxed_kinds:
+					arg_inst = (CLongLL if self.unboxed_kinds[name] == CLongLL.ctype else CDoubleLL)(sym, self.v)
+					arg_inst.declare()
+					sym.ll = arg_inst
+					self.unboxed[name] = arg_inst
+				else:
+					arg_inst = self.v.create_ll_instance(sym)
+					arg_inst.declare()
 				self.locals_map[name] = arg_inst.name
 
 
@@ -434,6 +476,9 @@ class PyFunctionLL(PyObjectLL):
 
 
 	def set_attr_string(self, attrname, val):
+		if attrname in self.unboxed:
+			self.unboxed[attrname].assign(val)
+			return
 		self.v.ctx.add(c.FuncCall(c.ID('Py_XDECREF'), c.ExprList(c.ID(self.locals_map[attrname]))))
 		val = val.as_pyobject()
 		val.incref()
@@ -441,6 +486,10 @@ class PyFunctionLL(PyObjectLL):
 
 
 	def get_attr_string(self, attrname, outvar):
+		if attrname in self.unboxed:
+			# Note: these are always assigned before they can be read, so cannot be unbound
+			self.unboxed[attrname].box(outvar)
+			return
 		self.v.ctx.add(c.Assignment('=', c.ID(outvar.name), c.ID(self.locals_map[attrname])))
 		self.except_if_null(outvar.name, 'PyExc_UnboundLocalError', "local variable '{}' referenced before assignment".format(attrname))
 		outvar.incref()
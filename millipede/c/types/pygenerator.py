@@ -3,6 +3,7 @@ Copyright (c) 2011, Terrence Cole.
 All rights reserved.
 '''
 from millipede.c import ast as c
+from millipede.c.stackless import FrameLocals
 from millipede.c.types.integer import CIntegerLL
 from millipede.c.types.pyfunction import PyFunctionLL
 from millipede.c.types.pyobject import PyObjectLL
@@ -18,13 +19,22 @@ class PyGeneratorLL(PyFunctionLL):
 
 	N_EXTRA_PARAMS = 4
 
+	# the coroutine stack size to use when we do not have an estimate; see StackEstimate
 	STACKSIZE = 1024 * 1024 * 1
 
+	UNBOXED_LOCALS = False
+
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
 		self.args_name = None
 		self.self_inst = None
 		self.gen_inst = None
+		self.stacksize = self.STACKSIZE
+
+		# set before create_runnerfunc to run as a step function with its locals in a heap frame; see StacklessCheck
+		self.stackless = False
+		self.frame = None
+		self.resume_check = None
 
 
 	def create_runnerfunc(self, args, vararg, kwonlyargs, kwarg):
@@ -47,6 +57,12 @@ class PyGeneratorLL(PyFunctionLL):
 
 
 		param_list = c.ParamList(c.Decl('gen_args', c.PtrDecl(c.TypeDecl('gen_args', c.IdentifierType('void')))))
+		if self.stackless:
+			body.reserve_name('frame', self.v.tu)
+			body.reserve_name('__frame__', self.v.tu)
+			struct_name = self.v.tu.reserve_global_name(self.hlnode.owner.global_c_name + '_frame')
+			self.frame = FrameLocals(struct_name, '__frame__', 'frame')
+			param_list.params.append(c.Decl('frame', c.PtrDecl(c.TypeDecl('frame', c.IdentifierType('void')))))
 		return_ty = c.TypeDecl(None, c.IdentifierType('void'))
 		self._create_runner_common(param_list, return_ty, body)
 
@@ -71,12 +87,14 @@ class PyGeneratorLL(PyFunctionLL):
 			self.v.ctx.add(c.Assignment('=', c.ArrayRef(c.ID(argsname), c.Constant('integer', i)), c.ID(arg_inst.name)))
 			self.v.ctx.add(c.FuncCall(c.ID('Py_XINCREF'), c.ExprList(c.ID(arg_inst.name))))
 
-		self.v.ctx.add(c.Assignment('=', c.ID('__return_value__'), c.FuncCall(c.ID('MpGenerator_New'), c.ExprList(
-												c.FuncCall(c.ID('strdup'), c.ExprList(c.Constant('string', PyStringLL.name_to_c_string(self.hlnode.owner.name)))),
-												c.ID(self.c_runner_func.decl.name),
-												c.ID(argsname),
-												c.Constant('integer', self.STACKSIZE) #FIXME: try to discover and set a good size for the stack
-											))))
+		name = c.FuncCall(c.ID('strdup'), c.ExprList(c.Constant('string', PyStringLL.name_to_c_string(self.hlnode.owner.name))))
+		if self.stackless:
+			gen = c.FuncCall(c.ID('MpGenerator_NewStackless'), c.ExprList(name, c.ID(self.c_runner_func.decl.name), c.ID(argsname),
+											c.FuncCall(c.ID('sizeof'), c.ExprList(self.frame.typedecl()))))
+		else:
+			gen = c.FuncCall(c.ID('MpGenerator_New'), c.ExprList(name, c.ID(self.c_runner_func.decl.name), c.ID(argsname),
+											c.Constant('integer', self.stacksize)))
+		self.v.ctx.add(c.Assignment('=', c.ID('__return_value__'), gen))
 		self.fail_if_null('__return_value__')
 		self.v.ctx.add(c.Assignment('=', c.ArrayRef(c.ID(argsname), c.Constant('integer', self.GENERATOR_INDEX)), c.ID('__return_value__')))
 
@@ -95,7 +113,15 @@ class PyGeneratorLL(PyFunctionLL):
 
 
 	def runner_intro(self):
-		'''Set the generator context on the TLS so that we can get to it from generators we call into.'''
+		'''Set the generator context on the TLS so that we can get to it from generators we call into.  Stackless
+			generators run on their caller's stack, so they have no context to set, but have to jump back to
+			where they left off instead.'''
+		if self.stackless:
+			self.v.ctx.add(c.Comment('resume after the last yield'))
+			self.v.scope.ctx.names.add('__resume__')
+			self.v.scope.ctx.add_variable(c.Decl('__resume__', c.PtrDecl(c.TypeDecl('__resume__', c.IdentifierType('void'))), init=c.ID('NULL')), False)
+			self.resume_check = self.v.ctx.add(c.If(c.ID('__resume__'), c.Compound(c.Goto(c.UnaryOp('*', c.ID('__resume__')))), None))
+
 		self.v.ctx.add(c.Comment('cast args to PyObject**'))
 		self.args_name = self.v.scope.ctx.reserve_name('__args__', self.v.tu)
 		self.v.scope.ctx.add_variable(c.Decl(self.args_name, c.PtrDecl(c.PtrDecl(c.TypeDecl(self.args_name, c.IdentifierType('PyObject')))), init=c.ID('NULL')), False)
@@ -118,6 +144,8 @@ class PyGeneratorLL(PyFunctionLL):
 		self.fail_if_null(self.gen_inst.name)
 
 		super().runner_intro()
+		if self.stackless:
+			return
 
 		self.v.ctx.add(c.Comment('mark us as in the generator'))
 		tmp = CIntegerLL(None, self.v)
@@ -129,13 +157,19 @@ class PyGeneratorLL(PyFunctionLL):
 
 	def _runner_cleanup(self):
 		'''Make sure to leave the __gen__ context before we decref it.'''
-		self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_LeaveContext'), c.ExprList(c.ID(self.gen_inst.name))))
+		if not self.stackless:
+			self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_LeaveContext'), c.ExprList(c.ID(self.gen_inst.name))))
 		super()._runner_cleanup()
 
 	def _runner_leave(self):
 		'''In order to leave a coroutine, we set the return context to NULL and transfer back.  The generator will
-			raise a StopError in the owning context for us.'''
+			raise a StopError in the owning context for us.  A stackless generator returns instead; since this is
+			the last code in the runner, this is also where we move its locals into the frame.'''
 		self.v.ctx.add(c.Assignment('=', c.ArrayRef(c.ID(self.args_name), c.Constant('integer', self.RETURN_INDEX)), c.ID('NULL')))
+		if self.stackless:
+			self.v.ctx.add(c.Return(None))
+			self.frame.lower(self.c_runner_func, self.v.tu, self.resume_check)
+			return
 		self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_Yield'), c.ExprList(c.ID(self.gen_inst.name))))
 
 
@@ -150,10 +184,17 @@ class PyGeneratorLL(PyFunctionLL):
 		self.v.ctx.add(c.Assignment('=', ret_ref, c.ID(rv_inst.name)))
 
 		with self.v.scope.ll.maybe_recursive_call():
-			# transfer control back to originator
-			self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_LeaveContext'), c.ExprList(c.ID(self.gen_inst.name))))
-			self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_Yield'), c.ExprList(c.ID(self.gen_inst.name))))
-			self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_EnterContext'), c.ExprList(c.ID(self.gen_inst.name))))
+			if self.stackless:
+				# return to our caller and pick up after the label on the next call
+				label = self.v.scope.get_label('resume')
+				self.v.ctx.add(c.Assignment('=', c.ID('__resume__'), c.UnaryOp('&&', c.ID(label))))
+				self.v.ctx.add(c.Return(None))
+				self.v.ctx.add(c.Label(label))
+			else:
+				# transfer control back to originator
+				self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_LeaveContext'), c.ExprList(c.ID(self.gen_inst.name))))
+				self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_Yield'), c.ExprList(c.ID(self.gen_inst.name))))
+				self.v.ctx.add(c.FuncCall(c.ID('MpGenerator_EnterContext'), c.ExprList(c.ID(self.gen_inst.name))))
 
 		# check for dealloc and jump to cleanup
 		if_exhausted = self.v.ctx.add(c.If(
@@ -15,13 +15,19 @@ class PyGeneratorClosureLL(PyClosureLL, PyGeneratorLL):
 	For the most part, generators and closures do not intersect, except during handling of arg loading 
 	in the runner, where we need to copy into the frame from the gen_args pointer, rather than off the C stack.
 	'''
+	# Note: we keep generator locals on the heap, since their runner's frame lives on a pooled coroutine stack
+	FRAME_LOCALS = False
+
 	def runner_load_args(self, args, vararg, kwonlyargs, kwarg):
 		# put all args into the new MpLocals array, no further decl required for locals
 		args = self._buildargs(args, vararg, kwonlyargs, kwarg)
 		for offset, arg in enumerate(args, self.ARGS_INDEX):
 			self.v.ctx.add(c.Comment("set arg '{}'".format(str(arg.arg))))
-			i, j = self.locals_map[str(arg.arg)]
-			tgt = c.ArrayRef(c.StructRef(c.ArrayRef(c.ID(self.stack_name), c.Constant('integer', i)), '->', c.ID('locals')), c.Constant('integer', j))
 			src = c.ArrayRef(c.ID(self.args_name), c.Constant('integer', offset))
-			self.v.ctx.add(c.Assignment('=', tgt, src))
+			if str(arg.arg) in self.captured:
+				# Note: the cell takes its own reference, so release the one the stub left for us
+				self.v.ctx.add(c.FuncCall(c.ID('PyCell_Set'), c.ExprList(self._slot(*self.locals_map[str(arg.arg)]), src)))
+				self.v.ctx.add(c.FuncCall(c.ID('Py_DECREF'), c.ExprList(src)))
+				continue
+			self.v.ctx.add(c.Assignment('=', self._slot(*self.locals_map[str(arg.arg)]), src))
 
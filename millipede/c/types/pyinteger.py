@@ -7,12 +7,19 @@ from millipede.c.types.pyobject import PyObjectLL
 
 
 class PyIntegerLL(PyObjectLL):
-	def new(self, n):
+	@staticmethod
+	def initializer(n):
+		'''Return a C expression that creates a new int for the python constant n.'''
 		#FIXME: need a way to get the target architecture word size for this!
 		if n < 2 ** 63 - 1:
-			return self._new_from_long(c.Constant('integer', n))
-		else:
-			return self._new_from_string(c.Constant('string', str(n)))
+			return c.FuncCall(c.ID('PyLong_FromLong'), c.ExprList(c.Constant('integer', n)))
+		return c.FuncCall(c.ID('PyLong_FromString'), c.ExprList(c.Constant('string', str(n)), c.ID('NULL'), c.Constant('integer', 0)))
+
+
+	def new(self, n):
+		super().new()
+		self.v.ctx.add(c.Assignment('=', c.ID(self.name), self.initializer(n)))
+		self.fail_if_null(self.name)
 
 
 	def set_constant(self, n):
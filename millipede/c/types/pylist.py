@@ -8,6 +8,14 @@ from millipede.c.types.pyobject import PyObjectLL
 
 
 class PyListLL(PyObjectLL):
+	ITEM_HELPERS = {
+		'get': ('MpList_GetItem', 'MpList_GetItemIfExact'),
+		'get_long': ('MpList_GetItemLong', 'MpList_GetItemLongIfExact'),
+		'set': ('MpList_SetItem', 'MpList_SetItemIfExact'),
+		'set_long': ('MpList_SetItemLong', 'MpList_SetItemLongIfExact'),
+		'contains': ('MpList_Contains', 'MpList_ContainsIfExact'),
+	}
+
 	def new(self):
 		super().new()
 		self.v.ctx.add(c.Assignment('=', c.ID(self.name), c.FuncCall(c.ID('PyList_New'), c.ExprList(c.Constant('integer', 0)))))
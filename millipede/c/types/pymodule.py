@@ -23,6 +23,9 @@ class PyModuleLL(PyObjectLL):
 		self.c_builder_name = self.v.tu.reserve_global_name(self.hlnode.name + '_builder')
 		self.c_builder_func = None
 
+		# with static_globals, the c-level mirror of each global that only this module's code can write
+		self.static_slots = {} # {str: str}
+
 
 	def declare(self):
 		# create the namespace dict
@@ -113,8 +116,23 @@ class PyModuleLL(PyObjectLL):
 		yield
 
 
+	def get_static_slot(self, name:str):
+		'''Return the name of the c global mirroring the module global name, or None if it must live in the dict only.'''
+		if not self.v.opt_static_globals or not self.hlnode.has_symbol(name) or \
+				not self.v.global_escapes.is_static(self.hlnode, name):
+			return None
+		if name not in self.static_slots:
+			slot = self.v.tu.reserve_global_name(self.hlnode.name + '_global_' + name)
+			self.v.tu.add_variable(c.Decl(slot, self.typedecl(slot), quals=['static'], init=c.ID('NULL')))
+			self.static_slots[name] = slot
+		return self.static_slots[name]
+
+
 	def del_attr_string(self, name:str):
 		self.ll_dict.del_item_string(name)
+		slot = self.get_static_slot(name)
+		if slot:
+			self.v.ctx.add(c.FuncCall(c.ID('Py_CLEAR'), c.ExprList(c.ID(slot))))
 
 
 	def set_attr_string(self, name:str, val:LLType):
@@ -122,20 +140,43 @@ class PyModuleLL(PyObjectLL):
 		#FIXME: do we really need both dict and attr?  don't these go to the same place?
 		#super().set_attr_string(name, val)
 
+		# keep the static mirror in sync; release the old value last, since its destructor may read the global
+		slot = self.get_static_slot(name)
+		if slot:
+			val = val.as_pyobject()
+			old = PyObjectLL(None, self.v)
+			old.declare_tmp(name='_old_global')
+			self.v.ctx.add(c.Assignment('=', c.ID(old.name), c.ID(slot)))
+			val.incref()
+			self.v.ctx.add(c.Assignment('=', c.ID(slot), c.ID(val.name)))
+			old.xdecref()
+
 
 	def get_attr_string(self, attrname:str, out:LLType):
-		if str(attrname) in PY_BUILTINS:
+		attrname = str(attrname)
+		if attrname in PY_BUILTINS:
 			mode = 'likely'
 		else:
 			mode = 'unlikely'
 
+		# with static_builtins, a builtin name that nothing can bind in our namespace goes straight to the builtin
+		if self.v.opt_static_builtins and attrname in PY_BUILTINS and not self.hlnode.has_symbol(attrname) and \
+				self.v.global_escapes.is_static(self.hlnode, attrname):
+			self.v.load_builtin(attrname, out)
+			return
+
 		# access globals first, fall back to builtins -- remember to ref the global if we get it, since dict get item borrows
 		#out.xdecref()
-		self.ll_dict.get_item_string_nofail(attrname, out)
+		slot = self.get_static_slot(attrname)
+		if slot:
+			self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.ID(slot)))
+			out.xincref()
+		else:
+			self.ll_dict.get_item_string_nofail(attrname, out)
 		frombuiltins = self.v.ctx.add(c.If(c.FuncCall(c.ID(mode),
 				c.ExprList(c.UnaryOp('!', c.ID(out.name)))), c.Compound(), None))
 		with self.v.new_context(frombuiltins.iftrue):
-			self.v.builtins.get_attr_string_with_exception(attrname, out, 'PyExc_NameError', "name '{}' is not defined".format(attrname))
+			self.v.load_builtin(attrname, out)
 			#self.except_if_null(out.name, 'PyExc_NameError', "name '{}' is not defined".format(attrname))
 		#with self.v.new_context(frombuiltins.iffalse):
 		#	out.incref()
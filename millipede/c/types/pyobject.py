@@ -7,6 +7,14 @@ from millipede.c.types.lltype import LLType
 
 
 class PyObjectLL(LLType):
+	# the c functions for the item protocol, as {op: (function, function behind an exact type check)}; the
+	#	containers replace these with fast paths for their exact type, where the _long ops take an unboxed int key
+	ITEM_HELPERS = {
+		'get': ('PyObject_GetItem', None),
+		'set': ('PyObject_SetItem', None),
+		'contains': ('PySequence_Contains', None),
+	}
+
 	@staticmethod
 	def typename():
 		return 'PyObject'
@@ -79,6 +87,13 @@ class PyObjectLL(LLType):
 		self.v.ctx.add(c.Assignment('=', c.ID(self.name), c.ID(self.v.none.name)))
 
 
+	def assign_constant(self, const):
+		'''Take a new reference to a global from the constant pool.'''
+		self.tmp_incref()
+		const.incref()
+		self.v.ctx.add(c.Assignment('=', c.ID(self.name), c.ID(const.name)))
+
+
 	def assign_null(self):
 		self.v.ctx.add(c.Assignment('=', c.ID(self.name), c.ID('NULL')))
 
@@ -99,14 +114,16 @@ class PyObjectLL(LLType):
 
 
 	def get_attr_string(self, attrname, out_var):
-		self.v.ctx.add(c.Assignment('=', c.ID(out_var.name), c.FuncCall(c.ID('PyObject_GetAttrString'), c.ExprList(
-														c.ID(self.name), c.Constant('string', attrname)))))
+		key = self.v.get_name(attrname)
+		self.v.ctx.add(c.Assignment('=', c.ID(out_var.name), c.FuncCall(c.ID('PyObject_GetAttr'), c.ExprList(
+														c.ID(self.name), c.ID(key.name)))))
 		self.fail_if_null(out_var.name)
 
 
 	def get_attr_string_with_exception(self, attrname, out_var, exc_name, exc_str=None):
-		self.v.ctx.add(c.Assignment('=', c.ID(out_var.name), c.FuncCall(c.ID('PyObject_GetAttrString'), c.ExprList(
-														c.ID(self.name), c.Constant('string', attrname)))))
+		key = self.v.get_name(attrname)
+		self.v.ctx.add(c.Assignment('=', c.ID(out_var.name), c.FuncCall(c.ID('PyObject_GetAttr'), c.ExprList(
+														c.ID(self.name), c.ID(key.name)))))
 		failed = self.v.ctx.add(c.If(c.UnaryOp('!', c.ID(out_var.name)), c.Compound(), None))
 		with self.v.new_context(failed.iftrue):
 			self.v.ctx.add(c.FuncCall(c.ID('PyErr_Clear'), c.ExprList()))
@@ -122,8 +139,9 @@ class PyObjectLL(LLType):
 		tmp = CIntegerLL(None, self.v)
 		tmp.declare_tmp(name="_setattr_rv")
 		attrval = attrval.as_pyobject()
-		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyObject_SetAttrString'), c.ExprList(
-															c.ID(self.name), c.Constant('string', attrname), c.ID(attrval.name)))))
+		key = self.v.get_name(attrname)
+		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyObject_SetAttr'), c.ExprList(
+															c.ID(self.name), c.ID(key.name), c.ID(attrval.name)))))
 		self.fail_if_nonzero(tmp.name)
 		tmp.decref()
 
@@ -140,31 +158,65 @@ class PyObjectLL(LLType):
 	def del_attr_string(self, attrname):
 		tmp = CIntegerLL(None, self.v)
 		tmp.declare_tmp()
-		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyObject_DelAttrString'), c.ExprList(
-															c.ID(self.name), c.Constant('string', attrname)))))
+		key = self.v.get_name(attrname)
+		self.v.ctx.add(c.Assignment('=', c.ID(tmp.name), c.FuncCall(c.ID('PyObject_DelAttr'), c.ExprList(
+															c.ID(self.name), c.ID(key.name)))))
 		self.fail_if_nonzero(tmp.name)
 		tmp.decref()
 
 
-	def get_item(self, key, out_inst=None):
+	def _item_helper(self, op, probable):
+		'''
+		Return the c function for item protocol op.  If we are probably, but not provably, the container
+		probable, use its fast path behind an exact type check.
+		'''
+		if probable and op in probable.ITEM_HELPERS:
+			return probable.ITEM_HELPERS[op][1]
+		if op in self.ITEM_HELPERS:
+			return self.ITEM_HELPERS[op][0]
+		return PyObjectLL.ITEM_HELPERS[op][0]
+
+
+	def get_item(self, key, out_inst=None, probable=None):
 		if not out_inst:
 			out_inst = PyObjectLL(None, self.v)
 			out_inst.declare_tmp(name="_item")
-		self.v.ctx.add(c.Assignment('=', c.ID(out_inst.name), c.FuncCall(c.ID('PyObject_GetItem'), c.ExprList(
+		self.v.ctx.add(c.Assignment('=', c.ID(out_inst.name), c.FuncCall(c.ID(self._item_helper('get', probable)), c.ExprList(
 															c.ID(self.name), c.ID(key.name)))))
 		self.fail_if_null(out_inst.name)
 		return out_inst
 
 
-	def set_item(self, key, val):
+	def get_item_long(self, key, out_inst=None, probable=None):
+		'''Index with an unboxed int key; only for the containers with a get_long helper.'''
+		if not out_inst:
+			out_inst = PyObjectLL(None, self.v)
+			out_inst.declare_tmp(name="_item")
+		self.v.ctx.add(c.Assignment('=', c.ID(out_inst.name), c.FuncCall(c.ID(self._item_helper('get_long', probable)), c.ExprList(
+															c.ID(self.name), key.value(), key.boxed_value()))))
+		self.fail_if_null(out_inst.name)
+		return out_inst
+
+
+	def set_item(self, key, val, probable=None):
 		out = CIntegerLL(None, self.v)
 		out.declare_tmp()
-		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PyObject_SetItem'), c.ExprList(
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID(self._item_helper('set', probable)), c.ExprList(
 															c.ID(self.name), c.ID(key.name), c.ID(val.name)))))
 		self.fail_if_nonzero(out.name)
 		out.decref()
 
 
+	def set_item_long(self, key, val, probable=None):
+		'''Store with an unboxed int key; only for the containers with a set_long helper.'''
+		out = CIntegerLL(None, self.v)
+		out.declare_tmp()
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID(self._item_helper('set_long', probable)), c.ExprList(
+															c.ID(self.name), key.value(), key.boxed_value(), c.ID(val.name)))))
+		self.fail_if_nonzero(out.name)
+		out.decref()
+
+
 	def del_item(self, key):
 		out = CIntegerLL(None, self.v)
 		out.declare_tmp()
@@ -361,10 +413,10 @@ class PyObjectLL(LLType):
 	### End Mapping
 
 	### Sequence
-	def sequence_contains(self, item):
+	def sequence_contains(self, item, probable=None):
 		out = CIntegerLL(None, self.v)
 		out.declare_tmp()
-		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID('PySequence_Contains'), c.ExprList(
+		self.v.ctx.add(c.Assignment('=', c.ID(out.name), c.FuncCall(c.ID(self._item_helper('contains', probable)), c.ExprList(
 																				c.ID(self.name), c.ID(item.name)))))
 		self.fail_if_negative(out.name)
 		return out
@@ -142,14 +142,20 @@ class PyStringLL(PyObjectLL):
 		return total - num_escapes
 
 
-	def new(self, py_init):
-		super().new()
+	@classmethod
+	def initializer(cls, py_init):
+		'''Return a C expression that creates a new str for the (dequoted) python literal py_init.'''
 		# wchar_t is a signed type (!?!), so we need to do some checking here
-		init = self.python_to_c_string(py_init)
-		strlen = self.strlen(init)
+		init = cls.python_to_c_string(py_init)
+		strlen = cls.strlen(init)
 		assert all(map(lambda x: ord(x) < 2 ** 31 and ord(x) >= 0, init)), 'Out of range character for wchar in: {}'.format(init)
-		self.v.ctx.add(c.Assignment('=', c.ID(self.name), c.FuncCall(c.ID('PyUnicode_FromUnicode'), c.ExprList(
-											c.Cast(c.PtrDecl(c.TypeDecl(self.name, c.IdentifierType('Py_UNICODE'))), c.Constant('string', init, prefix='L')),
-											c.Constant('integer', strlen)))))
+		return c.FuncCall(c.ID('PyUnicode_FromUnicode'), c.ExprList(
+											c.Cast(c.PtrDecl(c.TypeDecl(None, c.IdentifierType('Py_UNICODE'))), c.Constant('string', init, prefix='L')),
+											c.Constant('integer', strlen)))
+
+
+	def new(self, py_init):
+		super().new()
+		self.v.ctx.add(c.Assignment('=', c.ID(self.name), self.initializer(py_init)))
 		self.fail_if_null(self.name)
 
@@ -9,6 +9,12 @@ from millipede.c.types.pyobject import PyObjectLL
 
 
 class PyTupleLL(PyObjectLL):
+	ITEM_HELPERS = {
+		'get': ('MpTuple_GetItem', 'MpTuple_GetItemIfExact'),
+		'get_long': ('MpTuple_GetItemLong', 'MpTuple_GetItemLongIfExact'),
+		'contains': ('MpTuple_Contains', 'MpTuple_ContainsIfExact'),
+	}
+
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
 		self._length = None
@@ -60,18 +66,6 @@ class PyTupleLL(PyObjectLL):
 		self.v.ctx.add(c.FuncCall(c.ID('Py_XINCREF'), c.ExprList(c.ID(out_var.name))))
 
 
-	def get_item(self, offset:CIntegerLL, out_inst=None):
-		if not isinstance(offset, CIntegerLL):
-			offset = offset.as_ssize()
-		if not out_inst:
-			out_inst = PyObjectLL(None, self.v)
-			out_inst.declare_tmp(name="_item")
-		self.v.ctx.add(c.Assignment('=', c.ID(out_inst.name), c.FuncCall(c.ID('PyTuple_GetItem'), c.ExprList(c.ID(self.name), c.ID(offset.name)))))
-		self.fail_if_null(out_inst.name)
-		out_inst.incref()
-		return out_inst
-
-
 	def get_length(self, out_inst=None):
 		if not out_inst:
 			out_inst = CIntegerLL(None, self.v)
@@ -0,0 +1,247 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.c.types.integer import CIntegerLL
+from millipede.lang.visitor import ASTVisitor
+from millipede.py import ast as py
+import math
+
+
+LONG = 'long'
+DOUBLE = 'double'
+# the kind of an expression that depends on a name whose kind we have not found yet
+PENDING = 'pending'
+
+LONG_OPS = {py.Add, py.Sub, py.Mult, py.FloorDiv, py.Mod, py.BitAnd, py.BitOr, py.BitXor}
+DOUBLE_OPS = {py.Add, py.Sub, py.Mult, py.Div}
+
+
+def binop_kind(op, left, right):
+	'''The kind of the result of op on values of kind left and right.'''
+	if left is None or right is None:
+		return None
+	if op == py.Div:
+		return DOUBLE
+	if DOUBLE in (left, right):
+		return DOUBLE if op in DOUBLE_OPS else None
+	if op not in LONG_OPS:
+		return None
+	if PENDING in (left, right):
+		return PENDING
+	return LONG
+
+
+def numeric_kind(node, name_kind):
+	'''
+	Return LONG or DOUBLE if node is arithmetic over ints or floats that we can compute unboxed, or None if
+	it is not.  name_kind gives the kind of a Name node.
+	'''
+	if isinstance(node, py.Num):
+		if isinstance(node.n, bool):
+			return None
+		if isinstance(node.n, int):
+			return LONG if node.n <= CIntegerLL.MAX else None
+		if isinstance(node.n, float):
+			return DOUBLE if not math.isinf(node.n) and not math.isnan(node.n) else None
+		return None
+	if isinstance(node, py.Name) and node.ctx == py.Load:
+		return name_kind(node)
+	if isinstance(node, py.UnaryOp) and node.op in (py.UAdd, py.USub):
+		return numeric_kind(node.operand, name_kind)
+	if isinstance(node, py.BinOp):
+		return binop_kind(node.op, numeric_kind(node.left, name_kind), numeric_kind(node.right, name_kind))
+	return None
+
+
+
+class NumericLocals(ASTVisitor):
+	'''
+	Find the locals of a function that only ever hold ints, or only ever hold floats, so that we can keep them
+	unboxed in c variables.  Such a local must be assigned by a top-level statement of the function before
+	any use, or only be used inside for loops that count it, so that it can never be unbound when read.  Every
+	store to it must be an assignment of arithmetic over other such locals and literals, or the counter of a
+	for loop over range or enumerate.
+
+	counted_loop(node) returns 'range' or 'enumerate' for the for loops that count their target in c.
+	'''
+	# builtins that can see or rewrite locals by name
+	DYNAMIC = {'locals', 'vars', 'dir', 'exec', 'eval'}
+
+	def __init__(self, counted_loop=lambda node: None):
+		super().__init__()
+		self.counted_loop = counted_loop
+
+		# the values stored to each name, as expressions or AugAssign nodes
+		self.stores = {} # {str: [py.AST]}
+
+		# the index of the top-level statement that first assigns each name, and of the first that reads it
+		self.defined = {} # {str: int}
+		self.first_load = {} # {str: int}
+
+		# the counters of the for loops we are in; they are always bound inside their loop's body
+		self.counting = [] # [str]
+
+		# names we cannot unbox
+		self.excluded = set()
+
+		# set if the function can reach its locals dynamically
+		self.dynamic = False
+
+		self.index = 0
+		self.nested = 0
+
+
+	def scan(self, node:py.FunctionDef) -> {str: str}:
+		'''Return the kind of each local of the function that we can keep unboxed.'''
+		for arg in (node.args.args or []) + (node.args.kwonlyargs or []):
+			self.excluded.add(str(arg.arg))
+		for name in (node.args.vararg, node.args.kwarg):
+			if name:
+				self.excluded.add(str(name))
+
+		body = node.body if isinstance(node.body, list) else [node.body]
+		for self.index, stmt in enumerate(body):
+			if isinstance(stmt, py.Assign) and all(isinstance(t, py.Name) for t in stmt.targets):
+				for target in stmt.targets:
+					self.defined.setdefault(str(target), self.index)
+			self.visit(stmt)
+
+		if self.dynamic:
+			return {}
+
+		candidates = set()
+		for name in self.stores:
+			if name in self.excluded:
+				continue
+			if name in self.first_load and self.first_load[name] <= self.defined.get(name, len(body)):
+				continue
+			candidates.add(name)
+		return self.solve(candidates)
+
+
+	def solve(self, candidates):
+		'''Find the kinds of the candidates, dropping any that can hold something other than one kind of number.'''
+		kinds = {}
+		def name_kind(node):
+			name = str(node)
+			if name not in candidates:
+				return None
+			return kinds.get(name, PENDING)
+
+		def store_kind(value):
+			if isinstance(value, py.For):
+				return LONG
+			if isinstance(value, py.AugAssign):
+				return binop_kind(value.op, name_kind(value.target), numeric_kind(value.value, name_kind))
+			return numeric_kind(value, name_kind)
+
+		while True:
+			changed = False
+			for name in sorted(candidates):
+				found = set(store_kind(value) for value in self.stores[name])
+				found.discard(PENDING)
+				if None in found or len(found) > 1:
+					candidates.remove(name)
+					kinds.pop(name, None)
+					changed = True
+				elif found and name not in kinds:
+					kinds[name] = found.pop()
+					changed = True
+			if changed:
+				continue
+
+			# anything still pending only depends on itself and other pending names, so we cannot prove it
+			pending = set(name for name in candidates if name not in kinds)
+			if not pending:
+				return kinds
+			candidates -= pending
+
+
+	def _exclude_all(self, node):
+		self.nested += 1
+		self.generic_visit(node)
+		self.nested -= 1
+
+
+	def visit_Assign(self, node):
+		if self.nested or not all(isinstance(t, py.Name) for t in node.targets):
+			self.generic_visit(node)
+			return
+		self.visit(node.value)
+		for target in node.targets:
+			self.stores.setdefault(str(target), []).append(node.value)
+
+
+	def visit_AugAssign(self, node):
+		if self.nested or not isinstance(node.target, py.Name):
+			self.generic_visit(node)
+			return
+		self._load(str(node.target))
+		self.visit(node.value)
+		self.stores.setdefault(str(node.target), []).append(node)
+
+
+	def visit_For(self, node):
+		kind = self.counted_loop(node) if not self.nested else None
+		counter = node.target if kind == 'range' else node.target.elts[0] if kind == 'enumerate' else None
+		if not isinstance(counter, py.Name):
+			self.generic_visit(node)
+			return
+
+		self.visit(node.iter)
+		if kind == 'enumerate':
+			self.visit(node.target.elts[1])
+		self.stores.setdefault(str(counter), []).append(node)
+		self.counting.append(str(counter))
+		self.visit_nodelist(node.body)
+		self.counting.pop()
+		self.visit_nodelist(node.orelse)
+
+
+	def visit_ClassDef(self, node):
+		self.excluded.add(str(node.name))
+		self._exclude_all(node)
+
+
+	def visit_FunctionDef(self, node):
+		self.excluded.add(str(node.name))
+		self._exclude_all(node)
+
+	visit_Lambda = _exclude_all
+	visit_GeneratorExp = _exclude_all
+
+
+	def visit_ExceptHandler(self, node):
+		if node.name:
+			self.excluded.add(str(node.name))
+		self.generic_visit(node)
+
+
+	def visit_Global(self, node):
+		for name in node.names:
+			self.excluded.add(str(name))
+
+	visit_Nonlocal = visit_Global
+
+
+	def visit_Import(self, node):
+		for alias in node.names:
+			self.excluded.add(str(alias.asname or alias.name).split('.')[0])
+
+	visit_ImportFrom = visit_Import
+
+
+	def visit_Name(self, node):
+		name = str(node)
+		if self.nested or node.ctx != py.Load:
+			self.excluded.add(name)
+		if node.ctx == py.Load:
+			if name in self.DYNAMIC:
+				self.dynamic = True
+			self._load(name)
+
+
+	def _load(self, name):
+		if name not in self.counting:
+			self.first_load.setdefault(name, self.index)
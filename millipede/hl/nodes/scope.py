@@ -57,6 +57,15 @@ class Scope:
 		return name in self.ownership
 
 
+	def owner_of(self, name:str):
+		'''Return the scope that holds the value of name: us, unless our symbol is a reference to a name in
+			another scope, as for global and nonlocal names.'''
+		sym = self.symbols.get(name)
+		if isinstance(sym, NameRef):
+			return sym.parent
+		return self
+
+
 	def set_needs_closure(self):
 		if self.owner.parent:
 			self.owner.parent.set_needs_closure()
@@ -7,16 +7,16 @@ class AST:
 	'''Base class of all ast nodes.'''
 	_fields = ()
 	__slots__ = ('symbol', 'hl', 'll', 'bb', 'start', 'end')
-	def __init__(self, llnode):
+	def __init__(self, pos):
+		'''pos -- the (start, end) position of the source we were built from, or None'''
 		self.hl = None
 		self.ll = None
 		self.bb = None
 
 		self.symbol = None
 
-		if llnode:
-			self.start = llnode.startpos
-			self.end = llnode.endpos
+		if pos:
+			self.start, self.end = pos
 		else:
 			self.start = self.end = None
 
@@ -1,11 +1,18 @@
 '''
 Walk an AST.  Copied and extended from CPython.
 '''
-from collections import Iterable
 from .ast import AST
 
 
 class ASTVisitor:
+	# per visitor class, the visit method for each node class we have seen; None where we fall
+	#		back to generic_visit.  Shared by all instances, so each lookup only happens once
+	_dispatch_tables = {} # {type: {type: function}}
+
+	# per node class, the names of its child fields; read off the class once, rather than through its mro on
+	#		every walk.  Shared by all visitors
+	_child_fields = {} # {type: (str,)}
+
 	def __init__(self):
 		# track current context node to give output methods access to our state for printing errors
 		self._current_node = None
@@ -16,10 +23,17 @@ class ASTVisitor:
 		'''Called every time the line number of the currently visited node changes.'''
 
 
-	def _v_inner(self, node):
-		'''Note move lookup to subnode to improve the most common traceback and tracing tasks.'''
+	def _lookup(self, node_cls):
+		'''Find and cache the visit method for node_cls on this visitor's class.'''
+		method = getattr(self.__class__, 'visit_' + node_cls.__name__, None)
+		self._dispatch_tables.setdefault(self.__class__, {})[node_cls] = method
+		return method
+
+
+	def visit(self, node):
+		"""Visit a node."""
 		if node is None:
-			return lambda node: None
+			return None
 
 		# check for line changes
 		if node.start:
@@ -30,27 +44,33 @@ class ASTVisitor:
 
 		# lookup the method
 		self._current_node = node
-		method = 'visit_' + node.__class__.__name__
-		visitor = getattr(self, method, self.generic_visit)
-		return visitor
-
-
-	def visit(self, node):
-		"""Visit a node."""
-		v = self._v_inner(node)
-		return v(node)
+		node_cls = node.__class__
+		try:
+			method = self._dispatch_tables[self.__class__][node_cls]
+		except KeyError:
+			method = self._lookup(node_cls)
+		if method is None:
+			return self.generic_visit(node)
+		return method(self, node)
 
 
 	def generic_visit(self, node):
 		"""Called if no explicit visitor function exists for a node."""
+		node_cls = node.__class__
+		try:
+			fields = self._child_fields[node_cls]
+		except KeyError:
+			fields = self._child_fields[node_cls] = tuple(node_cls._fields)
 		rv = None
-		for value in [getattr(node, f) for f in node._fields]:
-			if isinstance(value, Iterable):
+		for f in fields:
+			value = getattr(node, f)
+			# NOTE: child fields only ever hold a node, a list (or tuple) of nodes, or a plain value
+			if isinstance(value, AST):
+				rv = self.visit(value)
+			elif isinstance(value, (list, tuple)):
 				for item in value:
 					if isinstance(item, AST):
 						rv = self.visit(item)
-			elif isinstance(value, AST):
-				rv = self.visit(value)
 		return rv
 
 
@@ -0,0 +1,380 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+
+A compact, memory-mapped store for parsed module asts.
+
+Each module is encoded as a flat record: a table of node class names and a table of nodes, in the
+order that we first meet them in the tree.  Each node is its class index, a string giving the kind
+of each of its slots, and the slot values, with child nodes replaced by their index in the node
+table.  The tables are written with marshal, so decoding a record is one pass in c over the values
+and one pass in python that only allocates the nodes and fills in their slots.  The store file is a
+header, the records, and an index mapping each path to the source hash and extent of its record.
+We only map the file on load; a record is only decoded when its module is asked for.
+
+Decoding a tree costs about as much as unpickling it, since most of the time goes to creating the
+nodes.  What we save over the old cache is the per-file orm round trip, and decoding the modules
+that a build does not use.
+'''
+import errno
+import logging
+import marshal
+import millipede.py.ast as py
+import mmap
+import os
+import struct
+
+
+# bump this whenever the layout of the ast nodes changes
+FORMAT_VERSION = 2
+
+# Note: the marshal format can change between python versions, so it is part of our format
+MAGIC = b'MPAST' + struct.pack('<H', FORMAT_VERSION) + bytes((marshal.version,))
+
+# slot kinds
+KIND_VALUE = 'v' # a plain value, with no nodes in it
+KIND_NODE = 'n' # the index of a node
+KIND_NODES = 'l' # a list of node indexes, with -1 for None
+KIND_MIXED = 'x' # anything else; see _Encoder.pack
+KIND_UNSET = 'u' # a slot that was never assigned
+
+# slots that only hold analysis state, which is never present in a freshly parsed tree
+TRANSIENT_SLOTS = frozenset(('symbol', 'hl', 'll', 'bb'))
+
+# the plain values that marshal can store for us
+_PLAIN = (type(None), bool, int, float, complex, str, bytes)
+
+_Count = struct.Struct('<I')
+_Header = struct.Struct('<8sQ')
+_Entry = struct.Struct('<40sQQ')
+
+
+class AstFormatError(Exception):
+	'''Raised when a record in the store does not decode, or a tree cannot be encoded.'''
+
+
+_slot_cache = {}
+def _get_slots(cls):
+	'''Return the persistent slots of cls, in a stable order.'''
+	try:
+		return _slot_cache[cls]
+	except KeyError:
+		pass
+	slots = []
+	for base in reversed(cls.__mro__):
+		for name in base.__dict__.get('__slots__', ()):
+			if name not in TRANSIENT_SLOTS and name not in slots:
+				slots.append(name)
+	_slot_cache[cls] = slots
+	return slots
+
+
+
+class _Encoder:
+	def __init__(self):
+		self.classes = []
+		self.class_ids = {}
+		self.nodes = {} # {id(node): index}; keeps shared subtrees shared
+		self.records = []
+		# Note: marshal only shares a string that is the same object, so we make equal strings the same object
+		self.strings = {}
+
+
+	def intern_class(self, cls):
+		try:
+			return self.class_ids[cls]
+		except KeyError:
+			self.class_ids[cls] = len(self.classes)
+			self.classes.append(cls)
+			return self.class_ids[cls]
+
+
+	def is_plain(self, value):
+		if value.__class__ in _PLAIN:
+			return True
+		if isinstance(value, (list, tuple)):
+			return all(self.is_plain(item) for item in value)
+		return False
+
+
+	def plain(self, value):
+		if isinstance(value, str):
+			return self.strings.setdefault(value, value)
+		if isinstance(value, list):
+			return [self.plain(item) for item in value]
+		if isinstance(value, tuple):
+			return tuple(self.plain(item) for item in value)
+		return value
+
+
+	def pack(self, value):
+		'''Encode a value that mixes nodes and plain values as a tree of (kind, value) pairs.'''
+		if isinstance(value, (py.AST, py.alias)):
+			return (KIND_NODE, self.add(value))
+		if isinstance(value, list):
+			return ('list', [self.pack(item) for item in value])
+		if isinstance(value, tuple):
+			return ('tuple', tuple(self.pack(item) for item in value))
+		if value.__class__ not in _PLAIN:
+			raise AstFormatError("cannot encode value of type {}".format(type(value).__name__))
+		return (KIND_VALUE, self.plain(value))
+
+
+	def add(self, node):
+		'''Add node and everything below it to the node table and return its index.'''
+		key = id(node)
+		if key in self.nodes:
+			return self.nodes[key]
+		index = self.nodes[key] = len(self.records)
+		record = [self.intern_class(type(node)), None, None]
+		self.records.append(record)
+
+		kinds = []
+		values = []
+		for name in _get_slots(type(node)):
+			try:
+				value = getattr(node, name)
+			except AttributeError:
+				kinds.append(KIND_UNSET)
+				values.append(None)
+				continue
+			if isinstance(value, (py.AST, py.alias)):
+				kinds.append(KIND_NODE)
+				values.append(self.add(value))
+			elif self.is_plain(value):
+				kinds.append(KIND_VALUE)
+				values.append(self.plain(value))
+			elif isinstance(value, list) and all(item is None or isinstance(item, (py.AST, py.alias)) for item in value):
+				kinds.append(KIND_NODES)
+				values.append([-1 if item is None else self.add(item) for item in value])
+			else:
+				kinds.append(KIND_MIXED)
+				values.append(self.pack(value))
+		record[1] = self.plain(''.join(kinds))
+		record[2] = tuple(values)
+		return index
+
+
+	def finish(self):
+		classes = tuple(cls.__name__ for cls in self.classes)
+		records = tuple(tuple(record) for record in self.records)
+		return marshal.dumps((classes, records), marshal.version)
+
+
+
+_filler_cache = {}
+def _get_filler(cls, slots, kinds):
+	'''
+	Return a function that fills in the slots of a new node of class cls from the record values for a node
+	with the given slot kinds.  We generate one function per layout, so that filling a node in is straight
+	line code, instead of a loop that tests the kind of each slot.
+	'''
+	key = (cls, kinds)
+	try:
+		return _filler_cache[key]
+	except KeyError:
+		pass
+	lines = ['def fill(node, values, nodes, unpack):']
+	if issubclass(cls, py.AST):
+		lines.append('\tnode.symbol = node.hl = node.ll = node.bb = None')
+	for i, (name, kind) in enumerate(zip(slots, kinds)):
+		if kind == KIND_VALUE:
+			lines.append('\tnode.{} = values[{}]'.format(name, i))
+		elif kind == KIND_NODE:
+			lines.append('\tnode.{} = nodes[values[{}]]'.format(name, i))
+		elif kind == KIND_NODES:
+			lines.append('\tnode.{} = [nodes[j] if j >= 0 else None for j in values[{}]]'.format(name, i))
+		elif kind == KIND_MIXED:
+			lines.append('\tnode.{} = unpack(values[{}])'.format(name, i))
+		elif kind != KIND_UNSET:
+			raise AstFormatError("bad slot kind {} for {}.{}".format(kind, cls.__name__, name))
+	lines.append('\treturn node')
+	namespace = {}
+	exec('\n'.join(lines), namespace)
+	_filler_cache[key] = namespace['fill']
+	return namespace['fill']
+
+
+
+class _Decoder:
+	def __init__(self, buf, offset):
+		try:
+			names, self.records = marshal.loads(buf[offset:] if offset else buf)
+		except (EOFError, ValueError, TypeError) as ex:
+			raise AstFormatError("bad record: {}".format(str(ex)))
+		self.classes = []
+		for name in names:
+			cls = getattr(py, name, None)
+			if cls is None:
+				raise AstFormatError("unknown node type: {}".format(name))
+			self.classes.append((cls, _get_slots(cls)))
+		self.nodes = []
+
+
+	def unpack(self, value):
+		kind, value = value
+		if kind == KIND_NODE:
+			return self.nodes[value]
+		if kind == 'list':
+			return [self.unpack(item) for item in value]
+		if kind == 'tuple':
+			return tuple(self.unpack(item) for item in value)
+		return value
+
+
+	def read(self):
+		classes = self.classes
+		nodes = self.nodes
+		for class_index, _, _ in self.records:
+			cls = classes[class_index][0]
+			nodes.append(cls.__new__(cls))
+
+		fillers = {}
+		unpack = self.unpack
+		for node, (class_index, kinds, values) in zip(nodes, self.records):
+			try:
+				fill = fillers[class_index, kinds]
+			except KeyError:
+				cls, slots = classes[class_index]
+				fill = fillers[class_index, kinds] = _get_filler(cls, slots, kinds)
+			fill(node, values, nodes, unpack)
+		if not nodes:
+			raise AstFormatError("empty record")
+		return nodes[0]
+
+
+def encode_ast(node) -> bytes:
+	'''Encode the given tree into a standalone record.'''
+	encoder = _Encoder()
+	encoder.add(node)
+	return encoder.finish()
+
+
+def decode_ast(buf, offset:int=0):
+	'''Decode the record in buf, starting at offset.'''
+	return _Decoder(buf, offset).read()
+
+
+
+class AstStore:
+	'''
+	The on-disk collection of module records.  Updates are held in memory until commit, which
+	rewrites the store (copying the untouched records straight from the old mapping) and swaps
+	it into place, so every build lands as one atomic write.
+	'''
+	def __init__(self, filename):
+		self.filename = filename
+
+		self.index = {} # {path: (hash, offset, length)}
+		self.pending = {} # {path: (hash, data)}
+
+		self._fp = None
+		self._map = None
+		self._open()
+
+
+	def _open(self):
+		try:
+			fp = open(self.filename, 'rb')
+		except IOError as ex:
+			if ex.errno != errno.ENOENT: raise
+			return
+
+		if os.fstat(fp.fileno()).st_size < _Header.size:
+			fp.close()
+			return
+
+		data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, index_offset = _Header.unpack_from(data, 0)
+		if magic != MAGIC:
+			logging.warning("AST store {} has an old format -- discarding".format(self.filename))
+			data.close()
+			fp.close()
+			return
+
+		self._fp = fp
+		self._map = data
+
+		pos = index_offset
+		count, = _Count.unpack_from(data, pos)
+		pos += _Count.size
+		for _ in range(count):
+			size, = _Count.unpack_from(data, pos)
+			pos += _Count.size
+			path = bytes(data[pos:pos + size]).decode('UTF-8', 'surrogateescape')
+			pos += size
+			hash, offset, length = _Entry.unpack_from(data, pos)
+			pos += _Entry.size
+			self.index[path] = (hash.decode('ascii'), offset, length)
+
+
+	def close(self):
+		if self._map:
+			self._map.close()
+			self._fp.close()
+		self._map = self._fp = None
+		self.index = {}
+
+
+	def has(self, path, hash):
+		'''Return true if we have a record for the given path and source hash.'''
+		entry = self.pending.get(path) or self.index.get(path)
+		return entry is not None and entry[0] == hash
+
+
+	def get(self, path, hash):
+		'''Return the ast stored for the given path and source hash, or None.'''
+		if path in self.pending:
+			pending_hash, data = self.pending[path]
+			return decode_ast(data) if pending_hash == hash else None
+		entry = self.index.get(path)
+		if entry is None or entry[0] != hash:
+			return None
+		try:
+			# NOTE: pull the record out of the mapping in one go; indexing into bytes is far cheaper
+			return decode_ast(self._map[entry[1]:entry[1] + entry[2]])
+		except (AstFormatError, IndexError, ValueError) as ex:
+			logging.warning("Corrupt ast record for {}: {}".format(path, str(ex)))
+			return None
+
+
+	def put(self, path, hash, data:bytes):
+		'''Queue an encoded record to be written at the next commit.'''
+		self.pending[path] = (hash, data)
+
+
+	def commit(self):
+		if not self.pending:
+			return
+
+		tmpname = self.filename + '.tmp'
+		entries = []
+		with open(tmpname, 'wb') as fp:
+			fp.write(_Header.pack(MAGIC, 0))
+			pos = _Header.size
+			for path, (hash, offset, length) in self.index.items():
+				if path in self.pending:
+					continue
+				fp.write(self._map[offset:offset + length])
+				entries.append((path, hash, pos, length))
+				pos += length
+			for path, (hash, data) in self.pending.items():
+				fp.write(data)
+				entries.append((path, hash, pos, len(data)))
+				pos += len(data)
+
+			fp.write(_Count.pack(len(entries)))
+			for path, hash, offset, length in entries:
+				data = path.encode('UTF-8', 'surrogateescape')
+				fp.write(_Count.pack(len(data)) + data)
+				fp.write(_Entry.pack(hash.encode('ascii'), offset, length))
+
+			fp.seek(0)
+			fp.write(_Header.pack(MAGIC, pos))
+			fp.flush()
+			os.fsync(fp.fileno())
+
+		self.close()
+		os.rename(tmpname, self.filename)
+		self.pending = {}
+		self._open()
@@ -2,6 +2,7 @@
 Copyright (c) 2011, Terrence Cole.
 All rights reserved.
 '''
+from millipede.project.ast_store import AstStore
 from sqlalchemy.engine import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -14,29 +15,27 @@ import os.path
 SQLBase = declarative_base()
 
 
-class AST(SQLBase):
-	__tablename__ = 'ast'
+class Links(SQLBase):
+	__tablename__ = 'ast_imports'
 	id = Column(Integer, primary_key=True)
 	path = Column(Unicode)
-	hash = Column(String(40))
-	data = Column(String)
-
+	data = Column(String) # pickled (imports, importfroms, renames)
 
-	def __init__(self, path, hash, data):
-		super().__init__()
+	def __init__(self, path, data):
 		self.path = path
-		self.hash = hash
 		self.data = data
 
 
-class Links(SQLBase):
-	__tablename__ = 'ast_imports'
+class Probe(SQLBase):
+	__tablename__ = 'probes'
 	id = Column(Integer, primary_key=True)
-	path = Column(Unicode)
-	data = Column(String) # pickled (imports, importfroms, renames)
+	build = Column(Unicode) # the interpreter build that we probed with
+	modname = Column(Unicode)
+	data = Column(Unicode) # newline separated names; empty if the module could not be imported
 
-	def __init__(self, path, data):
-		self.path = path
+	def __init__(self, build, modname, data):
+		self.build = build
+		self.modname = modname
 		self.data = data
 
 
@@ -48,34 +47,68 @@ class GlobalCache:
 		SQLBase.metadata.create_all(self.engine)
 		self.session = sessionmaker(bind=self.engine)()
 
+		# NOTE: we need the links for every file we trace, so take the whole table in one query
+		self.links = {row.path: row.data for row in self.session.query(Links)} # {str: bytes}
+		self.probes = {(row.build, row.modname): row.data for row in self.session.query(Probe)} # {(str, str): str}
+
+		# parsed asts live outside of sqlite, in a flat, mapped file
+		self.ast_store = AstStore(os.path.join(os.path.realpath(cache_dir), '__common__') + '.ast')
+
 
-	def query_ast_data(self, path, hash):
-		row = self.session.query(AST).filter_by(path=path, hash=hash).first()
-		# NOTE: if our hash updates, then we lose access to the data -- we clear out the existing row
-		#		_and_ the matching rows from all dependent structures
-		if not row:
-			self.session.query(AST).filter_by(path=path).delete()
+	def has_ast(self, path, hash):
+		return self.ast_store.has(path, hash)
+
+
+	def query_ast(self, path, hash):
+		ast = self.ast_store.get(path, hash)
+		if ast is None:
+			self.invalidate(path)
+		return ast
+
+
+	def invalidate(self, path):
+		'''Call when we have no ast for the current contents of path.'''
+		# NOTE: if our hash updates, then we lose access to the data -- we clear out the matching
+		#		rows from all dependent structures; the stale ast is replaced at the next commit
+		if path in self.links:
+			del self.links[path]
 			self.session.query(Links).filter_by(path=path).delete()
+
+
+	def update_ast(self, path, hash, data:bytes):
+		'''Data is the ast, as encoded by ast_store.encode_ast.'''
+		self.ast_store.put(path, hash, data)
+
+
+	def query_probe(self, build, modname):
+		'''Return the names found in modname by the given interpreter build: None if we have never probed it
+			with that build or an empty list if it was missing.'''
+		data = self.probes.get((build, modname))
+		if data is None:
 			return None
-		return row.data
+		return data.split('\n') if data else []
+
 
+	def update_probe(self, build, modname, names):
+		'''Record a probe result; this is not written to disk until the next commit.'''
+		data = '\n'.join(names)
+		self.probes[(build, modname)] = data
+		self.session.add(Probe(build, modname, data))
 
-	def update_ast_data(self, path, hash, data):
-		self.session.query(AST).filter_by(path=path).delete()
-		row = AST(path, hash, data)
-		self.session.add(row)
+
+	def commit(self):
+		'''Write out all of the asts, links, and probes we have found in this build.'''
+		self.ast_store.commit()
 		self.session.commit()
 
 
 	def query_file_links(self, path):
-		row = self.session.query(Links).filter_by(path=path).first()
-		if not row:
-			return None
-		return row.data
+		return self.links.get(path)
 
 
 	def update_file_links(self, path, data):
+		'''Record the links for path; this is not written to disk until the next commit.'''
+		self.links[path] = data
 		self.session.add(Links(path, data))
-		self.session.commit()
 
 
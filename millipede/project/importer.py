@@ -4,14 +4,12 @@ All rights reserved.
 '''
 from millipede.hl.nodes.module import MpModule
 from millipede.project.analysis.find_links import FindLinks
-from textwrap import dedent
+from millipede.project.probe import Prober
 import logging
 import millipede.py.ast as py
 import os
 import pdb
 import pickle
-import subprocess
-import tempfile
 
 
 class ModuleDesc:
@@ -113,9 +111,12 @@ class Importer:
 		self._renames = {}
 
 		# if we find a module is missing, it doesn't get "visited" so add it here at a low-level to avoid
-		#		having to spawn dozens of un-needed probe processes
+		#		having to send dozens of un-needed probes
 		self._missing = set()
 
+		# the interpreter(s) we use to look inside of modules we have no source for
+		self.prober = Prober(project.c_prefix, project.c_version, project.global_cache)
+
 		# outputs
 		self.out = []
 
@@ -177,6 +178,9 @@ class Importer:
 		else:
 			imports, importfroms, renames = pickle.loads(data)
 
+		# get the parser pool working on our children before we descend into the first of them
+		self._prefetch_links(imports, importfroms, package_directory, base_location)
+
 		for alias_name in imports:
 			for modname in self.__import_name_parts(alias_name):
 				last = None
@@ -209,6 +213,27 @@ class Importer:
 		return renames, ref_paths, ast
 
 
+	def _prefetch_links(self, imports, importfroms, package_directory, base_location):
+		'''Queue the parse of every file we are about to trace.  This only resolves paths, the same way that
+			trace_import_tree will, so the order and results of the trace are unchanged.'''
+		if not self.project.parse_pool:
+			return
+		modnames = []
+		for alias_name in imports:
+			modnames.extend(self.__import_name_parts(alias_name))
+		for imp_level, imp_module, _ in importfroms:
+			try:
+				modnames.append(self.find_absolute_modname('.' * imp_level + str(imp_module), package_directory, base_location))
+			except ImportError:
+				pass
+		for modname in modnames:
+			if modname in self._visited:
+				continue
+			desc = self.find_best_path_for_modname(modname)
+			if isinstance(desc, ModuleFileDesc) and desc.path.endswith('.py'):
+				self.project.prefetch_file_ast(desc.path)
+
+
 	def find_absolute_modname(self, maybe_rel_modname, package_directory, base_dir):
 		'''
 		Given a module name and the package directory it was found in _and_ the base directory
@@ -372,37 +397,22 @@ class Importer:
 		if modname in self._missing:
 			raise NoSuchModuleError("Could not find module {} with direct probe".format(modname))
 
-		with tempfile.NamedTemporaryFile() as tmp:
-			probe = dedent("""
-				import sys
-				print(str(sys.version_info.major) + '.' + str(sys.version_info.minor))
-				import {0}
-				for n in sorted(dir({0})):
-					print(n)
-			""".format(modname))
-			probe = self._probe_quirks(modname, probe)
-			tmp.write(probe.encode('UTF-8'))
-			tmp.flush()
-			exe0 = os.path.join(self.project.c_prefix, 'bin', 'python' + self.project.c_version)
-			exe1 = os.path.join(self.project.c_prefix, 'bin', 'python')
-			for exe in (exe0, exe1):
-				p = subprocess.Popen([exe, tmp.name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-				rv = p.communicate()
-				if p.returncode != 0:
-					continue
-				lines = rv[0].decode('UTF-8').split()
-				if lines[0] != self.project.c_version:
-					continue
-				return ModuleProbedDesc(MpModule.BUILTIN, modname, lines[1:])
+		names = self.prober.probe(modname, self._probe_quirks(modname))
+		if names is not None:
+			return ModuleProbedDesc(MpModule.BUILTIN, modname, names)
 
 		self._missing.add(modname)
 		raise NoSuchModuleError("Could not find module {} with direct probe".format(modname))
 
 
-	def _probe_quirks(self, modname, probe):
-		'''Specially handle cases where python is simply insane.'''
+	def _probe_quirks(self, modname):
+		'''Specially handle cases where python is simply insane.  Returns the modules to import before modname.'''
 		if modname == '_dummy_threading':
 			# dummy_threading imports threading and sets it as _dummy_threading in the modules list, so we need to
 			#	import dummy_threading to actually import _dummy_threading, or we just fail.
-			probe = 'import dummy_threading\n' + probe
-		return probe
+			return ['dummy_threading']
+		return []
+
+
+	def close(self):
+		self.prober.close()
@@ -0,0 +1,151 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+
+Find the names in modules we do not have sources for by importing them in a real interpreter.
+'''
+from textwrap import dedent
+import logging
+import os
+import subprocess
+
+
+# The server reports its version, then answers one request per line: a module name followed by any
+#	modules that must be imported first.  Each import happens in a forked child so that probes cannot
+#	see each other's side effects (e.g. submodules showing up in a package's dir) -- this is what a fresh
+#	interpreter would see, without paying for interpreter startup.  The reply is "+ <names>" or "-".
+PROBE_SERVER = dedent("""
+	import os, sys
+	def probe(modname, preloads):
+		for name in preloads:
+			__import__(name)
+		__import__(modname)
+		return sorted(dir(sys.modules[modname]))
+	def answer(modname, preloads):
+		try:
+			return '+ ' + ' '.join(probe(modname, preloads))
+		except BaseException:
+			return '-'
+	out = os.dup(1)
+	os.dup2(2, 1)
+	os.write(out, (str(sys.version_info[0]) + '.' + str(sys.version_info[1]) + '\\n').encode('UTF-8'))
+	for line in iter(sys.stdin.readline, ''):
+		parts = line.split()
+		if not parts:
+			continue
+		if not hasattr(os, 'fork'):
+			os.write(out, (answer(parts[0], parts[1:]) + '\\n').encode('UTF-8'))
+			continue
+		pid = os.fork()
+		if pid == 0:
+			os.write(out, (answer(parts[0], parts[1:]) + '\\n').encode('UTF-8'))
+			os._exit(0)
+		_, status = os.waitpid(pid, 0)
+		if status != 0:
+			os.write(out, b'-\\n')
+""")
+
+
+class ProbeServer:
+	'''A long-lived interpreter that imports modules for us on request.'''
+	def __init__(self, exe):
+		self.exe = exe
+		self.devnull = open(os.devnull, 'wb')
+		self.proc = subprocess.Popen([exe, '-c', PROBE_SERVER], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+									stderr=self.devnull)
+		self.version = self.proc.stdout.readline().decode('UTF-8').strip()
+
+
+	def probe(self, modname, preloads):
+		'''Return the sorted names in modname, or None if it cannot be imported.'''
+		self.proc.stdin.write((' '.join([modname] + list(preloads)) + '\n').encode('UTF-8'))
+		self.proc.stdin.flush()
+		line = self.proc.stdout.readline().decode('UTF-8')
+		if not line:
+			raise EOFError("probe server {} exited".format(self.exe))
+		if not line.startswith('+'):
+			return None
+		return line[1:].split()
+
+
+	def close(self):
+		try:
+			self.proc.stdin.close()
+		except IOError:
+			pass
+		self.proc.wait()
+		self.devnull.close()
+
+
+
+class Prober:
+	'''
+	Probe modules with the first of the target version's interpreters that can import them.  Results are kept
+	in the global cache, keyed on the interpreter build, so that we only ever import a module once per python.
+	'''
+	def __init__(self, prefix:str, version:str, cache):
+		self.version = version
+		self.cache = cache
+		self.exes = [os.path.join(prefix, 'bin', 'python' + version), os.path.join(prefix, 'bin', 'python')]
+
+		# the servers we have started; None if the interpreter is not usable
+		self._servers = {} # {str: ProbeServer or None}
+
+
+	@staticmethod
+	def build_id(exe):
+		'''Identify the interpreter build at exe, without running it.'''
+		real = os.path.realpath(exe)
+		st = os.stat(real)
+		return '{}:{}:{}'.format(real, st.st_size, int(st.st_mtime))
+
+
+	def _get_server(self, exe):
+		if exe not in self._servers:
+			server = None
+			try:
+				server = ProbeServer(exe)
+				if server.version != self.version:
+					logging.info("Not probing with {}: version {} is not {}".format(exe, server.version, self.version))
+					server.close()
+					server = None
+			except OSError as ex:
+				logging.warning("Failed to start probe server {}: {}".format(exe, str(ex)))
+				server = None
+			self._servers[exe] = server
+		return self._servers[exe]
+
+
+	def probe(self, modname:str, preloads:[str]=()) -> [str]:
+		'''Return the names in modname, or None if no interpreter can import it.'''
+		for exe in self.exes:
+			if not os.path.exists(exe):
+				continue
+
+			build = self.build_id(exe)
+			names = self.cache.query_probe(build, modname)
+			if names is None:
+				server = self._get_server(exe)
+				if server is None:
+					continue
+				try:
+					names = server.probe(modname, preloads)
+				except (IOError, EOFError) as ex:
+					logging.warning(str(ex))
+					server.close()
+					self._servers[exe] = None
+					continue
+				names = names or []
+				self.cache.update_probe(build, modname, names)
+
+			if names:
+				return names
+
+		return None
+
+
+	def close(self):
+		for server in self._servers.values():
+			if server:
+				server.close()
+		self._servers = {}
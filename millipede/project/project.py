@@ -17,19 +17,22 @@ from millipede.project.analysis.indexer0 import Indexer0
 from millipede.project.analysis.indexer1 import Indexer1
 from millipede.project.analysis.linker import Linker
 from millipede.project.analysis.typeflow0 import TypeFlow0
+from millipede.project.ast_store import encode_ast, decode_ast
 from millipede.project.global_cache import GlobalCache
-from millipede.project.importer import Importer, ModuleDesc
+from millipede.project.importer import Importer, ModuleDesc, ModuleFileDesc
 from millipede.project.project_cache import ProjectCache
 from millipede.py.driver import PythonParserDriver
 import errno
 import hashlib
 import logging
 import millipede.py.ast as ast
+import multiprocessing
 import os
 import pdb
 import pickle
 import re
 import sys
+import threading
 
 
 class FileNotFoundException(Exception):
@@ -38,6 +41,28 @@ class FileNotFoundException(Exception):
 class MissingSymbolsError(Exception):
 	'''Raised if we cannot resolve all symbols when indexing.'''
 
+class BuildStateError(Exception):
+	'''Raised if an incremental build cannot store its analysis for the next build.'''
+
+
+# the analyzed module graph nests about as deeply as the asts it hangs off of, so we pickle it with a
+#		recursion limit, and on a thread with a stack, that are deep enough for large modules
+STATE_RECURSION_LIMIT = 50000
+STATE_STACK_SIZE = 512 * 1024 * 1024
+
+
+# the per-process parser used by the parallel front end; set by _parse_worker_init
+_worker_driver = None
+
+def _parse_worker_init(grammar_filename, cache_dir):
+	'''Build a parser for this worker process; the grammar is only loaded once per process.'''
+	global _worker_driver
+	_worker_driver = PythonParserDriver(grammar_filename, cache_dir)
+
+def _parse_worker(source):
+	'''Tokenize, parse, and build the ast for source; returns the ast in its cached (encoded) form.'''
+	return encode_ast(_worker_driver.parse_string(source))
+
 
 class MpProject:
 	'''
@@ -79,14 +104,25 @@ class MpProject:
 		self.modules_by_absname = {} # {str: MpModule}
 		self.order = [] # depth first traversal order
 
-		# the core parser infrastructure
-		self.parser_driver = PythonParserDriver('data/grammar/python-3.1')
+		# incremental builds: the analysis state from the last build and the modules we need to redo
+		self.incremental = False
+		self.prior_state = None
+		self.dirty = set() # {str}
+
+		# the parallel front end: a pool of parser processes and the parses we have submitted to it
+		self.jobs = 1
+		self.parse_pool = None
+		self.pending_asts = {} # {str: (str, AsyncResult)}
 
 		# create a cache directory
 		self.cachedir = os.path.realpath('./cache')
 		if not os.path.exists(self.cachedir):
 			os.makedirs(self.cachedir)
 
+		# the core parser infrastructure; the generated grammar tables live with our other caches
+		self.grammar_filename = 'data/grammar/python-3.1'
+		self.parser_driver = PythonParserDriver(self.grammar_filename, self.cachedir)
+
 		# ensure the build directory exists
 		if not os.path.exists(self.build_dir):
 			os.makedirs(self.build_dir)
@@ -104,7 +140,7 @@ class MpProject:
 				stdlib:[str]=[], extensions:[str]=[], builtins:[str]=[], override:[str]=[],
 				prefix:str='/usr', version:str='3.1', abi:str='',
 				include='.*', exclude='$^',
-				verbose=False, opt_level:int=1, opt_options:{str}=''):
+				verbose=False, opt_level:int=1, opt_options:{str}='', jobs:int=None, incremental:bool=False):
 		'''
 		Set up this project.
 		stdlib, extensions, builtins, overrides : extra directories to search before the standard paths
@@ -114,6 +150,11 @@ class MpProject:
 		opt_level : 0 or 1, corresponding to sap and asp respectively
 		opt_options : set of string options
 			nodocstrings -- elide docstrings from output executable  
+			static_globals -- keep module globals in c variables; assumes no code outside the project writes them
+			static_builtins -- look up each used builtin once at startup; assumes nothing replaces builtins at runtime
+			stackless_generators -- run generators as step functions with heap frames instead of coroutines where we can
+		jobs : number of processes to parse modules with; defaults to the number of cpus, 1 parses serially
+		incremental : re-use the analysis from the last build for modules that have not changed
 		'''
 		self.programs = programs
 		self.roots = roots
@@ -132,6 +173,10 @@ class MpProject:
 		self.opt_level = opt_level
 		self.opt_options = opt_options
 
+		self.jobs = jobs if jobs is not None else multiprocessing.cpu_count()
+		self.incremental = incremental
+		self.statefile = os.path.join(self.cachedir, self.name + '.state')
+
 		self.cache.prepare(programs, roots, stdlib, extensions, builtins, override)
 
 		self.verbose = verbose
@@ -151,6 +196,7 @@ class MpProject:
 		self.link_references()
 		self.build_ir()
 		self.derive_types()
+		self.save_state()
 		return self.transform_ll_c()
 
 
@@ -160,6 +206,16 @@ class MpProject:
 
 		ref_paths_by_module = {}
 
+		# NOTE: the prior build's modules all share its builtins scope, so any module we build fresh must too
+		self.load_state()
+		if self.prior_state:
+			self.builtins_scope = self.prior_state['builtins']
+
+		# NOTE: the importer still walks the tree serially, in depth-first order; it only hands us the files it
+		#		is about to visit early, so that their parses can proceed in the pool while it works
+		if self.jobs > 1:
+			self.parse_pool = multiprocessing.Pool(self.jobs, _parse_worker_init, (self.grammar_filename, self.cachedir))
+
 		# load all modules in depth-first order
 		for program in self.programs:
 			importer.trace_import_tree(program)
@@ -208,6 +264,22 @@ class MpProject:
 					if desc.modname == program:
 						mod.set_as_main()
 
+		# the importer has visited everything, so the pool has nothing left to do
+		if self.parse_pool:
+			self.parse_pool.close()
+			self.parse_pool.join()
+			self.parse_pool = None
+		importer.close()
+
+		# store all of the asts we had to parse and the locations and links we resolved
+		self.global_cache.commit()
+		self.cache.commit()
+
+		# swap in the modules from the last build that we do not need to redo
+		self.dirty = set(self.order)
+		if self.prior_state:
+			self.apply_state(ref_paths_by_module)
+
 		# after we have loaded all modules, fill in the refs in each module
 		# NOTE: we can only track refs when we have the source (so we know what names are imports)
 		for filename, mod in self.modules_by_path.items():
@@ -221,8 +293,10 @@ class MpProject:
 
 	def index_static(self):
 		'''Find all statically scoped names in reachable modules -- classes, functions, variable, etc.'''
-		logging.info("Indexing: Phase 0, {} files".format(len(self.order)))
+		logging.info("Indexing: Phase 0, {} files".format(len(self.dirty)))
 		for fn in self.order:
+			if fn not in self.dirty:
+				continue
 			mod = self.modules_by_path[fn]
 
 			if self.verbose: logging.info("Indexing0: {}".format(mod.filename))
@@ -241,9 +315,11 @@ class MpProject:
 		missing = {}
 		records = {}
 		visited = {mod for mod in self.modules_by_absname.values() if isinstance(mod, (MpProbedModule, MpMissingModule))}
+		visited |= {self.modules_by_path[fn] for fn in self.order if fn not in self.dirty}
+		order = [fn for fn in self.order if fn in self.dirty]
 		def _index(self):
 			nonlocal missing, records, visited
-			for fn in reversed(self.order):
+			for fn in reversed(order):
 				if fn not in missing or missing[fn] > 0:
 					mod = self.modules_by_path[fn]
 					if self.verbose:
@@ -261,7 +337,7 @@ class MpProject:
 				assert self.modules_by_path[fn] in visited or missing[fn] > 0
 
 
-		logging.info("Indexing: Phase 1, {} files".format(len(self.order)))
+		logging.info("Indexing: Phase 1, {} files".format(len(order)))
 		_index(self)
 
 		logging.info("Indexing: Phase 2, {} remaining".format(sum(list(missing.values()))))
@@ -278,6 +354,8 @@ class MpProject:
 			the actual definition points for all referenced code.'''
 		logging.info("Linking")
 		for fn in reversed(self.order):
+			if fn not in self.dirty:
+				continue
 			mod = self.modules_by_path[fn]
 			if self.is_local(mod):
 				if self.verbose: logging.info("Linking: {}".format(mod.filename))
@@ -288,6 +366,8 @@ class MpProject:
 	def build_ir(self):
 		out = {}
 		for fn in reversed(self.order):
+			if fn not in self.dirty:
+				continue
 			mod = self.modules_by_path[fn]
 			if self.is_local(mod):
 				if self.verbose: logging.info("Building IR: {}".format(mod.filename))
@@ -306,6 +386,8 @@ class MpProject:
 		'''Look up-reference and thru-call to find the types of all names.'''
 		logging.info("Typing")
 		for fn in reversed(self.order):
+			if fn not in self.dirty:
+				continue
 			mod = self.modules_by_path[fn]
 			if self.is_local(mod):
 				if self.verbose: logging.info("Typing: {}".format(mod.filename))
@@ -318,6 +400,15 @@ class MpProject:
 		makefile = Makefile(os.path.join(self.build_dir, makename), self.data_dir, prefix=self.c_prefix, version=self.c_version, abi=self.c_abi)
 
 		for program in self.programs:
+			target = os.path.join(self.build_dir, program + '.c')
+
+			# if none of our modules or options changed, then neither has the output
+			if not self.dirty and os.path.exists(target) and \
+					self.prior_state['c_options'] == (self.opt_level, sorted(self.opt_options)):
+				logging.info("Unchanged: {}".format(target))
+				makefile.add_target(program, target)
+				continue
+
 			# apply the low-level transformation
 			visitor = Py2C(self.opt_level, self.opt_options, self.builtins_scope)
 			for fn in self.order:
@@ -335,7 +426,6 @@ class MpProject:
 			visitor.close()
 
 			# write the file
-			target = os.path.join(self.build_dir, program + '.c')
 			logging.info("Writing: {}".format(target))
 			with COut(target) as v:
 				v.visit(visitor.tu)
@@ -360,6 +450,115 @@ class MpProject:
 		return makefile
 
 
+	def load_state(self):
+		'''Load the analyzed modules from our last build, if we are building incrementally.'''
+		self.prior_state = None
+		if not self.incremental or not os.path.exists(self.statefile):
+			return
+		try:
+			with open(self.statefile, 'rb') as fp:
+				self.prior_state = pickle.load(fp)
+		except Exception as ex:
+			logging.warning("Discarding build state {}: {}".format(self.statefile, str(ex)))
+
+
+	def apply_state(self, ref_paths_by_module):
+		'''
+		Replace every module whose source and imports are unchanged since our last build, and which does not 
+		import a module that has changed, with the fully analyzed module from that build.  Everything else is
+		marked dirty and gets rebuilt.
+		'''
+		prior_by_path = self.prior_state['modules_by_path']
+		prior_by_absname = self.prior_state['modules_by_absname']
+
+		def _ref_key(target):
+			return (target.modname, target.path if isinstance(target, ModuleFileDesc) else '')
+
+		# find modules whose source or import resolution has changed
+		changed = set()
+		for fn in self.order:
+			mod = self.modules_by_path[fn]
+			prior = prior_by_path.get(fn)
+			if prior is None or prior.checksum != mod.checksum:
+				changed.add(fn)
+				continue
+			prior_refs = {k: (m.python_name, m.filename) for k, m in prior.refs.items()}
+			refs = {k: _ref_key(desc) for k, desc in ref_paths_by_module[fn].items()}
+			if prior_refs != refs:
+				changed.add(fn)
+
+		# anything that imports a changed module has to be redone as well
+		importers = {fn: set() for fn in self.order}
+		for fn in self.order:
+			for desc in ref_paths_by_module[fn].values():
+				if isinstance(desc, ModuleFileDesc) and desc.path in importers:
+					importers[desc.path].add(fn)
+		self.dirty = set()
+		todo = list(changed)
+		while todo:
+			fn = todo.pop()
+			if fn in self.dirty:
+				continue
+			self.dirty.add(fn)
+			todo.extend(importers[fn])
+		logging.info("Incremental: {} changed, {} of {} modules to rebuild".format(len(changed), len(self.dirty), len(self.order)))
+
+		# NOTE: a clean module can only see other clean modules, so we can take the whole
+		#		sub-graph of clean modules as-is from the prior build
+		for fn in self.order:
+			if fn in self.dirty:
+				continue
+			mod = prior_by_path[fn]
+			self.modules_by_path[fn] = mod
+			self.modules_by_absname[mod.python_name] = mod
+		for modname, mod in self.modules_by_absname.items():
+			if isinstance(mod, (MpProbedModule, MpMissingModule)) and modname in prior_by_absname:
+				self.modules_by_absname[modname] = prior_by_absname[modname]
+
+
+	def save_state(self):
+		'''Store our analyzed modules so that the next incremental build can re-use them.'''
+		if not self.incremental:
+			return
+		state = {
+			'builtins': self.builtins_scope,
+			'modules_by_path': self.modules_by_path,
+			'modules_by_absname': self.modules_by_absname,
+			'c_options': (self.opt_level, sorted(self.opt_options)),
+		}
+		data = self._dump_state(state)
+		with open(self.statefile, 'wb') as fp:
+			fp.write(data)
+
+
+	@staticmethod
+	def _dump_state(state) -> bytes:
+		'''Pickle state on a thread with a deep stack.  Raises BuildStateError if we cannot, since an incremental
+			build that cannot store its state would silently rebuild everything, every time.'''
+		out = {}
+		def _dump():
+			limit = sys.getrecursionlimit()
+			sys.setrecursionlimit(STATE_RECURSION_LIMIT)
+			try:
+				out['data'] = pickle.dumps(state)
+			except (pickle.PicklingError, RuntimeError, TypeError) as ex:
+				out['error'] = ex
+			finally:
+				sys.setrecursionlimit(limit)
+
+		prior_size = threading.stack_size(STATE_STACK_SIZE)
+		try:
+			worker = threading.Thread(target=_dump)
+			worker.start()
+			worker.join()
+		finally:
+			threading.stack_size(prior_size)
+
+		if 'data' not in out:
+			raise BuildStateError("Failed to save build state for --incremental: {}".format(str(out.get('error'))))
+		return out['data']
+
+
 	def reset_ll(self):
 		logging.info("Reset LL nodes")
 
@@ -406,18 +605,39 @@ class MpProject:
 		return self.modules_by_absname[dottedname]
 
 
+	def prefetch_file_ast(self, filename):
+		'''Start parsing filename in the background, if we have a pool and it is not already cached.'''
+		if not self.parse_pool or filename in self.pending_asts:
+			return
+		source = MpModule._read_file(filename)
+		checksum = hashlib.sha1(source.encode('UTF-8')).hexdigest()
+		if self.global_cache.has_ast(filename, checksum):
+			return
+		# Note: the pending parse skips query_ast, so drop what we derived from the old source here
+		self.global_cache.invalidate(filename)
+		logging.info("Parsing: {}".format(filename))
+		self.pending_asts[filename] = (checksum, self.parse_pool.apply_async(_parse_worker, (source,)))
+
+
 	def get_file_ast(self, filename):
+		# NOTE: the worker returns the encoded ast, which is exactly what we store in the cache
+		if filename in self.pending_asts:
+			checksum, result = self.pending_asts.pop(filename)
+			data = result.get()
+			self.global_cache.update_ast(filename, checksum, data)
+			return decode_ast(data)
+
 		source = MpModule._read_file(filename)
 		checksum = hashlib.sha1(source.encode('UTF-8')).hexdigest()
-		data = self.global_cache.query_ast_data(filename, checksum)
+		ast = self.global_cache.query_ast(filename, checksum)
 
-		if data:
+		if ast:
 			logging.debug("Cached: {} @ {}".format(filename, checksum))
-			return pickle.loads(data)
+			return ast
 
 		else:
 			logging.info("Parsing: {}".format(filename))
 			ast = self.parser_driver.parse_string(source)
-			self.global_cache.update_ast_data(filename, checksum, pickle.dumps(ast))
+			self.global_cache.update_ast(filename, checksum, encode_ast(ast))
 			return ast
 
@@ -66,6 +66,9 @@ class ProjectCache:
 		self._builtins = None
 		self._overrides = None
 
+		# all known module locations, by modname; loaded at prepare and written back at commit
+		self._locations = {} # {str: [(int, int, str, str)]}
+
 		# select the cache file
 		self.cachefile = os.path.join(os.path.realpath(cache_dir), self.name) + '.db'
 		logging.info("Cachefile: {}".format(self.cachefile))
@@ -136,9 +139,14 @@ class ProjectCache:
 			self.session.query(ModuleLocation).delete()
 			#FIXME: other tables here, probably
 
+		# NOTE: we look up every module we import, so take the whole table in one query
+		self._locations = {}
+		for row in self.session.query(ModuleLocation):
+			self._locations.setdefault(row.modname, []).append((row.type, row.modtype, row.modname, row.data))
+
 
 	def get_module_path(self, dottedname):
-		rows = self.session.query(ModuleLocation).filter_by(modname=dottedname).all()
+		rows = self._locations.get(dottedname, ())
 
 		# NOTE: if we have more than one reference to this raw name (e.g. if it is a relative name .foo
 		#	from more than one project directory), then there is not much we can do here and we need
@@ -146,11 +154,14 @@ class ProjectCache:
 		if len(rows) != 1:
 			raise KeyError
 
-		row = rows[0]
-		return row.type, row.modtype, row.modname, row.data
+		return rows[0]
 
 
 	def add_module_location(self, type, modtype, modname, data):
-		row = ModuleLocation(type, modtype, modname, data)
-		self.session.add(row)
+		'''Record a module location; this is not written to disk until the next commit.'''
+		self._locations.setdefault(modname, []).append((type, modtype, modname, data))
+		self.session.add(ModuleLocation(type, modtype, modname, data))
+
+
+	def commit(self):
 		self.session.commit()
@@ -5,8 +5,8 @@ Unlike the builtin python parser, this parser has 2 additional capabilities:
 1) It should be able to parse supported versions of python, regardless of 
 	what interpretter is running the parser.
 2) It passes through full source-level information.  It includes the exact
-	start and end information for all ast nodes by passing through direct
-	refences to the low-level parse tree.
+	start and end information for all ast nodes, copied out of the
+	low-level parse tree as each node is built.
 
 Parsing Process:
 1) Tokenization
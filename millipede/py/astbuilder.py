@@ -4,9 +4,14 @@ Convert the low-level parse tree into a high-level Abstract Syntax Tree.
 NOTES for Millipede:
 	- Copied and adapted from pypy; this involved a complete rewrite of many
 		different elements to support new python3 constructs.
-	- Passes the low-level Node to the ast nodes directly, rather than pulling
-		off and passing start line and column individually.
-	- Handles our skiptokens by filtering the children lists as needed.
+	- Passes the (start, end) position of the low-level node to the ast nodes
+		directly, rather than pulling off and passing line and column
+		individually.
+	- Reads the parser's ParseTree arrays directly: every handler takes the
+		index of a node in the tree, rather than a node object.
+	- Skip tokens (comments and blank lines) never enter the tree; the
+		NEWLINE and ENDMARKER tokens that the grammar does place in it are
+		stepped over where the grammar puts them.
 '''
 import millipede.py.ast as ast
 import pdb
@@ -28,11 +33,13 @@ class PythonASTBuilder:
 		for name, index in self.parser.grammar.TOKENS.items():
 			setattr(self.tokens, name, index)
 
-		self.SKIPTOKENS = {
-				self.tokens.COMMENT,
-				self.tokens.NL,
-				self.tokens.NEWLINE,
-				self.tokens.ENDMARKER}
+		# expression nodes that, with a single child, are just a wrapper around that child
+		self.chain_syms = {
+				self.syms.test, self.syms.test_nocond,
+				self.syms.or_test, self.syms.and_test, self.syms.not_test, self.syms.comparison,
+				self.syms.expr, self.syms.xor_expr, self.syms.and_expr, self.syms.shift_expr,
+				self.syms.arith_expr, self.syms.term, self.syms.factor}
+		self.lambdef_syms = {self.syms.lambdef, self.syms.lambdef_nocond}
 
 		self.operator_map = {
 			self.tokens.VBAR : ast.BitOr,
@@ -63,6 +70,17 @@ class PythonASTBuilder:
 			'**=' : ast.Pow
 		}
 
+		# the arrays of the tree we are building from; see bind
+		self.tree = None
+		self.types = None
+		self.values = None
+		self.positions = None
+		self.child_begin = None
+		self.child_end = None
+		self.kids = None
+		self.start_lines = self.start_cols = None
+		self.end_lines = self.end_cols = None
+
 	def show_tokens(self):
 		import pprint
 		pprint.pprint({k: getattr(self.tokens, k) for k in dir(self.tokens)})
@@ -81,42 +99,63 @@ class PythonASTBuilder:
 				return name
 
 
-	def build(self, node):
-		assert node.type == self.syms.file_input
+	def bind(self, tree):
+		'''Look at the arrays of tree in all later calls.'''
+		self.tree = tree
+		self.types = tree.types
+		self.values = tree.values
+		self.positions = tree.positions
+		self.child_begin = tree.child_begin
+		self.child_end = tree.child_end
+		self.kids = tree.kids
+		self.start_lines = tree.start_lines
+		self.start_cols = tree.start_cols
+		self.end_lines = tree.end_lines
+		self.end_cols = tree.end_cols
+
+
+	def build(self, tree):
+		'''Build the Module for the ParseTree returned by the parser.'''
+		self.bind(tree)
+		node = tree.root
+		assert self.types[node] == self.syms.file_input
 
 		children = self.children(node)
 		stmts = []
 		for stmt in children:
-			ty = stmt.type
-			if ty in self.SKIPTOKENS:
-				continue
-			if ty == self.syms.stmt:
+			# Note: the others are NEWLINEs and the final ENDMARKER
+			if self.types[stmt] == self.syms.stmt:
 				stmts.extend(self.handle_stmt(stmt))
 
-		node.endpos = node.children[-1].endpos
-		return ast.Module(stmts, node)
+		start, _ = self.pos(node)
+		_, end = self.pos(children[-1])
+		return ast.Module(stmts, (start, end))
 
 
 	def children(self, node):
-		'''Return the 'real' children of a node -- e.g. filter skip-tokens.'''
-		if not node.children:
-			self.pretty_print(node)
-		return [c for c in node.children if c.type not in self.SKIPTOKENS]
+		'''Return the indices of the children of a node; a token has none.'''
+		return self.kids[self.child_begin[node]:self.child_end[node]]
+
+
+	def pos(self, node):
+		'''Return the (start, end) position of a node, as the ast nodes take it.
+			A nonterminal is placed at its first token.'''
+		at = self.positions[node]
+		return ((self.start_lines[at], self.start_cols[at]), (self.end_lines[at], self.end_cols[at]))
 
 
 	def print_children(self, node):
-		print('CHILD:', self.type_name(node.type))
-		for c in node.children:
-			print('\t' + self.type_name(c.type))
+		print('CHILD:', self.type_name(self.types[node]))
+		for c in self.children(node):
+			print('\t' + self.type_name(self.types[c]))
 		print("END")
 
 
 	def pretty_print(self, node, level=0):
 		pad = '\t' * level
-		print(pad + self.type_name(node.type) + ' [' + str(node.value).strip() + ']')
-		if node.children:
-			for c in node.children:
-				self.pretty_print(c, level + 1)
+		print(pad + self.type_name(self.types[node]) + ' [' + str(self.values[node]).strip() + ']')
+		for c in self.children(node):
+			self.pretty_print(c, level + 1)
 
 
 	def set_context(self, expr, ctx):
@@ -144,28 +183,28 @@ class PythonASTBuilder:
 		children = self.children(del_node)
 		targets = self.handle_exprlist(children[1], ast.Del)
 		if isinstance(targets, ast.Tuple):
-			return ast.Delete(targets.elts, del_node)
-		return ast.Delete([targets], del_node)
+			return ast.Delete(targets.elts, self.pos(del_node))
+		return ast.Delete([targets], self.pos(del_node))
 
 
 	def handle_flow_stmt(self, flow_node):
 		first_child = self.children(flow_node)[0]
-		first_child_type = first_child.type
+		first_child_type = self.types[first_child]
 		if first_child_type == self.syms.break_stmt:
-			return ast.Break(flow_node)
+			return ast.Break(self.pos(flow_node))
 		elif first_child_type == self.syms.continue_stmt:
-			return ast.Continue(flow_node)
+			return ast.Continue(self.pos(flow_node))
 		elif first_child_type == self.syms.yield_stmt:
 			children = self.children(first_child)
 			yield_expr = self.handle_expr(children[0])
-			return ast.Expr(yield_expr, flow_node)
+			return ast.Expr(yield_expr, self.pos(flow_node))
 		elif first_child_type == self.syms.return_stmt:
 			children = self.children(first_child)
 			if len(children) == 1:
 				values = None
 			else:
 				values = self.handle_testlist(children[1])
-			return ast.Return(values, flow_node)
+			return ast.Return(values, self.pos(flow_node))
 		elif first_child_type == self.syms.raise_stmt:
 			exc = None
 			value = None
@@ -174,16 +213,16 @@ class PythonASTBuilder:
 				exc = self.handle_expr(children[1])
 			if len(children) >= 4:
 				value = self.handle_expr(children[3])
-			return ast.Raise(exc, value, flow_node)
+			return ast.Raise(exc, value, self.pos(flow_node))
 		else:
 			raise AssertionError("unknown flow statement")
 
 
 	def handle_import_stmt(self, import_node):
 		children = self.children(import_node)
-		if children[0].type == self.syms.import_name:
+		if self.types[children[0]] == self.syms.import_name:
 			return self.handle_import_name(children[0])
-		elif children[0].type == self.syms.import_from:
+		elif self.types[children[0]] == self.syms.import_from:
 			return self.handle_import_from(children[0])
 		else:
 			raise AssertionError("unknown import node")
@@ -191,47 +230,48 @@ class PythonASTBuilder:
 
 	def handle_import_name(self, import_name):
 		children = self.children(import_name)
-		assert children[0].value == 'import'
+		assert self.values[children[0]] == 'import'
 		aliases = self.handle_dotted_as_names(children[1])
-		return ast.Import(aliases, import_name)
+		return ast.Import(aliases, self.pos(import_name))
 
 
 	def handle_import_from(self, import_from):
+		types = self.types
 		children = self.children(import_from)
 		at = 0
-		assert children[at].value == 'from'
+		assert self.values[children[at]] == 'from'
 		at += 1
 		level = 0
-		while children[at].type in (self.tokens.DOT, self.tokens.ELLIPSIS):
-			if children[at].type == self.tokens.DOT:
+		while types[children[at]] in (self.tokens.DOT, self.tokens.ELLIPSIS):
+			if types[children[at]] == self.tokens.DOT:
 				level += 1
-			elif children[at].type == self.tokens.ELLIPSIS:
+			elif types[children[at]] == self.tokens.ELLIPSIS:
 				level += 3
 			at += 1
-		if children[at].type == self.syms.dotted_name:
+		if types[children[at]] == self.syms.dotted_name:
 			module = self.handle_dotted_name(children[at])
 			at += 1
 		else:
-			module = ast.Name('', ast.Load, children[at])
-		assert children[at].value == 'import'
+			module = ast.Name('', ast.Load, self.pos(children[at]))
+		assert self.values[children[at]] == 'import'
 		at += 1
-		if children[at].type == self.syms.import_as_names:
+		if types[children[at]] == self.syms.import_as_names:
 			names = self.handle_import_as_names(children[at])
-		elif children[at].type == self.tokens.STAR:
-			names = [ast.alias(ast.Name("*", ast.Load, children[at]), None)]
+		elif types[children[at]] == self.tokens.STAR:
+			names = [ast.alias(ast.Name("*", ast.Load, self.pos(children[at])), None)]
 		else:
-			assert children[at].type == self.tokens.LPAR
-			assert children[-1].type == self.tokens.RPAR
+			assert types[children[at]] == self.tokens.LPAR
+			assert types[children[-1]] == self.tokens.RPAR
 			at += 1
 			names = self.handle_import_as_names(children[at])
-		return ast.ImportFrom(module, names, level, import_from)
+		return ast.ImportFrom(module, names, level, self.pos(import_from))
 
 
 	def handle_import_as_names(self, import_as_names):
 		children = self.children(import_as_names)
 		aliases = []
 		for child in children:
-			if child.type == self.tokens.COMMA: continue
+			if self.types[child] == self.tokens.COMMA: continue
 			alias = self.handle_import_as_name(child)
 			aliases.append(alias)
 		return aliases
@@ -239,13 +279,13 @@ class PythonASTBuilder:
 
 	def handle_import_as_name(self, import_as_name):
 		children = self.children(import_as_name)
-		assert children[0].type == self.tokens.NAME
-		name = ast.Name(children[0].value, ast.Store, children[0])
+		assert self.types[children[0]] == self.tokens.NAME
+		name = ast.Name(self.values[children[0]], ast.Store, self.pos(children[0]))
 		asname = None
 		if len(children) > 1:
-			assert children[1].value == 'as'
-			assert children[2].type == self.tokens.NAME
-			asname = ast.Name(children[2].value, ast.Store, children[2])
+			assert self.values[children[1]] == 'as'
+			assert self.types[children[2]] == self.tokens.NAME
+			asname = ast.Name(self.values[children[2]], ast.Store, self.pos(children[2]))
 			name.set_context(ast.Load)
 		return ast.alias(name, asname)
 
@@ -253,8 +293,8 @@ class PythonASTBuilder:
 	def handle_dotted_as_names(self, dotted_as_names):
 		aliases = []
 		for child in self.children(dotted_as_names):
-			if child.type == self.tokens.COMMA: continue
-			assert child.type == self.syms.dotted_as_name
+			if self.types[child] == self.tokens.COMMA: continue
+			assert self.types[child] == self.syms.dotted_as_name
 			alias = self.handle_dotted_as_name(child)
 			aliases.append(alias)
 		return aliases
@@ -265,9 +305,9 @@ class PythonASTBuilder:
 		name = self.handle_dotted_name(children[0])
 		asname = None
 		if len(children) > 1:
-			assert children[1].value == 'as'
-			assert children[2].type == self.tokens.NAME
-			asname = ast.Name(children[2].value, ast.Store, children[2])
+			assert self.values[children[1]] == 'as'
+			assert self.types[children[2]] == self.tokens.NAME
+			asname = ast.Name(self.values[children[2]], ast.Store, self.pos(children[2]))
 		else:
 			name.set_context(ast.Store)
 		return ast.alias(name, asname)
@@ -275,14 +315,14 @@ class PythonASTBuilder:
 
 	def handle_global_stmt(self, global_node):
 		children = self.children(global_node)
-		names = [children[i].value for i in range(1, len(children), 2)]
-		return ast.Global(names, global_node)
+		names = [self.values[children[i]] for i in range(1, len(children), 2)]
+		return ast.Global(names, self.pos(global_node))
 
 
 	def handle_nonlocal_stmt(self, nonlocal_node):
 		children = self.children(nonlocal_node)
-		names = [children[i].value for i in range(1, len(children), 2)]
-		return ast.Nonlocal(names, nonlocal_node)
+		names = [self.values[children[i]] for i in range(1, len(children), 2)]
+		return ast.Nonlocal(names, self.pos(nonlocal_node))
 
 
 	def handle_assert_stmt(self, assert_node):
@@ -292,7 +332,7 @@ class PythonASTBuilder:
 		msg = None
 		if len(children) == 4:
 			msg = self.handle_expr(children[3])
-		return ast.Assert(expr, msg, assert_node)
+		return ast.Assert(expr, msg, self.pos(assert_node))
 
 
 	def handle_suite(self, suite_node):
@@ -300,31 +340,28 @@ class PythonASTBuilder:
 		children = self.children(suite_node)
 		first_child = children[0]
 		# e.x. -> stuff ':' simple_stmt
-		#	otherwise, we get an INDENT [stuff] DEDENT pattern
-		if first_child.type == self.syms.simple_stmt:
+		#	otherwise, we get a NEWLINE INDENT [stuff] DEDENT pattern
+		if self.types[first_child] == self.syms.simple_stmt:
 			return self.handle_simple_stmt(first_child)
 		else:
-			assert children[0].type == self.tokens.INDENT
-			assert children[-1].type == self.tokens.DEDENT
-			children = children[1:-1]
+			assert self.types[children[0]] == self.tokens.NEWLINE
+			assert self.types[children[1]] == self.tokens.INDENT
+			assert self.types[children[-1]] == self.tokens.DEDENT
 			stmts = []
-			for stmt in children:
-				if stmt.type in self.SKIPTOKENS:
-					continue
-				assert stmt.type == self.syms.stmt
+			for stmt in children[2:-1]:
+				assert self.types[stmt] == self.syms.stmt
 				stmts.extend(self.handle_stmt(stmt))
 		return stmts
 
 
 	def handle_simple_stmt(self, simple_stmt) -> list:
 		'''simple_stmt: small_stmt (';' small_stmt)* [';'] NEWLINE'''
-		assert simple_stmt.type == self.syms.simple_stmt
+		assert self.types[simple_stmt] == self.syms.simple_stmt
 		stmts = []
 		children = self.children(simple_stmt)
-		for child in children:
-			if child.type == self.tokens.SEMI:
-				continue
-			stmts.append(self.handle_small_stmt(child))
+		# Note: step over the semicolons and stop before the NEWLINE
+		for i in range(0, len(children) - 1, 2):
+			stmts.append(self.handle_small_stmt(children[i]))
 		return stmts
 
 
@@ -332,35 +369,36 @@ class PythonASTBuilder:
 		'''Dispatch to a more specific handler.
 			Handles exactly one stmt, so this should not be called on stmt
 			or simple_stmt unless it is known to hav exactly one stmt in it.
-			
+
 			stmt: simple_stmt | compound_stmt
 		'''
-		assert stmt.type == self.syms.stmt
+		assert self.types[stmt] == self.syms.stmt
 		children = self.children(stmt)
 		assert len(children) == 1
-		if children[0].type == self.syms.simple_stmt:
+		child_type = self.types[children[0]]
+		if child_type == self.syms.simple_stmt:
 			return self.handle_simple_stmt(children[0])
-		elif children[0].type == self.syms.compound_stmt:
+		elif child_type == self.syms.compound_stmt:
 			return [self.handle_compound_stmt(children[0])]
 		else:
 			raise AssertionError('Unrecognized stmt: {}'.format(
-					self.type_name(children[0].type)))
+					self.type_name(child_type)))
 
 
 	def handle_small_stmt(self, small_stmt):
 		'''small_stmt: (expr_stmt | del_stmt | pass_stmt | flow_stmt |
 					import_stmt | global_stmt | nonlocal_stmt | assert_stmt)'''
-		assert small_stmt.type == self.syms.small_stmt
+		assert self.types[small_stmt] == self.syms.small_stmt
 		children = self.children(small_stmt)
 		assert len(children) == 1
 		stmt = children[0]
-		stmt_type = stmt.type
+		stmt_type = self.types[stmt]
 		if stmt_type == self.syms.expr_stmt:
 			return self.handle_expr_stmt(stmt)
 		elif stmt_type == self.syms.del_stmt:
 			return self.handle_del_stmt(stmt)
 		elif stmt_type == self.syms.pass_stmt:
-			return ast.Pass(stmt)
+			return ast.Pass(self.pos(stmt))
 		elif stmt_type == self.syms.flow_stmt:
 			return self.handle_flow_stmt(stmt)
 		elif stmt_type == self.syms.import_stmt:
@@ -376,13 +414,13 @@ class PythonASTBuilder:
 
 
 	def handle_compound_stmt(self, compound_stmt):
-		'''compound_stmt: if_stmt | while_stmt | for_stmt | try_stmt | 
+		'''compound_stmt: if_stmt | while_stmt | for_stmt | try_stmt |
 			with_stmt | funcdef | classdef | decorated'''
-		assert compound_stmt.type == self.syms.compound_stmt
+		assert self.types[compound_stmt] == self.syms.compound_stmt
 		children = self.children(compound_stmt)
 		assert len(children) == 1
 		stmt = children[0]
-		stmt_type = stmt.type
+		stmt_type = self.types[stmt]
 		if stmt_type == self.syms.if_stmt:
 			return self.handle_if_stmt(stmt)
 		elif stmt_type == self.syms.while_stmt:
@@ -409,18 +447,18 @@ class PythonASTBuilder:
 		if child_count == 4:
 			test = self.handle_expr(children[1])
 			suite = self.handle_suite(children[3])
-			return ast.If(test, suite, None, if_node)
-		otherwise_string = children[4].value
+			return ast.If(test, suite, None, self.pos(if_node))
+		otherwise_string = self.values[children[4]]
 		if otherwise_string == "else":
 			test = self.handle_expr(children[1])
 			suite = self.handle_suite(children[3])
 			else_suite = self.handle_suite(children[6])
-			return ast.If(test, suite, else_suite, if_node)
+			return ast.If(test, suite, else_suite, self.pos(if_node))
 		elif otherwise_string == "elif":
 			elif_count = child_count - 4
 			after_elif = children[elif_count + 1]
-			if after_elif.type == self.tokens.NAME and \
-					after_elif.value == "else":
+			if self.types[after_elif] == self.tokens.NAME and \
+					self.values[after_elif] == "else":
 				has_else = True
 				elif_count -= 3
 			else:
@@ -431,7 +469,7 @@ class PythonASTBuilder:
 				last_elif_test = self.handle_expr(last_elif)
 				elif_body = self.handle_suite(children[-4])
 				else_body = self.handle_suite(children[-1])
-				otherwise = [ast.If(last_elif_test, elif_body, else_body, last_elif)]
+				otherwise = [ast.If(last_elif_test, elif_body, else_body, self.pos(last_elif))]
 				elif_count -= 1
 			else:
 				otherwise = None
@@ -440,11 +478,11 @@ class PythonASTBuilder:
 				elif_test_node = children[offset]
 				elif_test = self.handle_expr(elif_test_node)
 				elif_body = self.handle_suite(children[offset + 2])
-				new_if = ast.If(elif_test, elif_body, otherwise, elif_test_node)
+				new_if = ast.If(elif_test, elif_body, otherwise, self.pos(elif_test_node))
 				otherwise = [new_if]
 			expr = self.handle_expr(children[1])
 			body = self.handle_suite(children[3])
-			return ast.If(expr, body, otherwise, if_node)
+			return ast.If(expr, body, otherwise, self.pos(if_node))
 		else:
 			raise AssertionError("unknown if statement configuration")
 
@@ -457,7 +495,7 @@ class PythonASTBuilder:
 			otherwise = self.handle_suite(children[6])
 		else:
 			otherwise = None
-		return ast.While(loop_test, body, otherwise, while_node)
+		return ast.While(loop_test, body, otherwise, self.pos(while_node))
 
 
 	def handle_for_stmt(self, for_node):
@@ -471,7 +509,7 @@ class PythonASTBuilder:
 			otherwise = self.handle_suite(children[8])
 		else:
 			otherwise = None
-		return ast.For(target, expr, body, otherwise, for_node)
+		return ast.For(target, expr, body, otherwise, self.pos(for_node))
 
 
 	def handle_except_clause(self, exc, body):
@@ -485,10 +523,10 @@ class PythonASTBuilder:
 			test = self.handle_expr(children[1])
 		if child_count == 4:
 			target = children[3]
-			assert children[2].type == self.tokens.NAME and children[2].value == 'as'
-			assert target.type == self.tokens.NAME
-			name = ast.Name(target.value, ast.Store, target)
-		return ast.excepthandler(test, name, suite, exc)
+			assert self.types[children[2]] == self.tokens.NAME and self.values[children[2]] == 'as'
+			assert self.types[target] == self.tokens.NAME
+			name = ast.Name(self.values[target], ast.Store, self.pos(target))
+		return ast.excepthandler(test, name, suite, self.pos(exc))
 
 
 	def handle_try_stmt(self, try_node):
@@ -499,10 +537,10 @@ class PythonASTBuilder:
 		otherwise = None
 		finally_suite = None
 		possible_extra_clause = children[-3]
-		if possible_extra_clause.type == self.tokens.NAME:
-			if possible_extra_clause.value == "finally":
+		if self.types[possible_extra_clause] == self.tokens.NAME:
+			if self.values[possible_extra_clause] == "finally":
 				if child_count >= 9 and \
-						children[-6].type == self.tokens.NAME:
+						self.types[children[-6]] == self.tokens.NAME:
 					otherwise = self.handle_suite(children[-4])
 					except_count -= 1
 				finally_suite = self.handle_suite(children[-1])
@@ -517,23 +555,23 @@ class PythonASTBuilder:
 				exc = children[3 + base_offset]
 				except_body = children[5 + base_offset]
 				handlers.append(self.handle_except_clause(exc, except_body))
-			except_ast = ast.TryExcept(body, handlers, otherwise, try_node)
+			except_ast = ast.TryExcept(body, handlers, otherwise, self.pos(try_node))
 			if finally_suite is None:
 				return except_ast
 			body = [except_ast]
-		return ast.TryFinally(body, finally_suite, try_node)
+		return ast.TryFinally(body, finally_suite, self.pos(try_node))
 
 
 	def handle_with_stmt(self, with_node):
 		children = self.children(with_node)
-		assert children[0].type == self.tokens.NAME
-		assert children[0].value == 'with'
+		assert self.types[children[0]] == self.tokens.NAME
+		assert self.values[children[0]] == 'with'
 		context_suite = self.handle_suite(children[-1])
 		with_items = [children[i] for i in range(1, len(children) - 2, 2)]
 		assert len(with_items) > 0
 		for with_item in reversed(with_items):
 			context_expr, optional_vars = self.handle_with_item(with_item)
-			context_suite = ast.With(context_expr, optional_vars, context_suite, with_node)
+			context_suite = ast.With(context_expr, optional_vars, context_suite, self.pos(with_node))
 		return context_suite
 
 
@@ -542,8 +580,8 @@ class PythonASTBuilder:
 		context_expr = self.handle_testlist(children[0])
 		optional_vars = None
 		if len(children) > 1:
-			assert children[1].type == self.tokens.NAME
-			assert children[1].value == 'as'
+			assert self.types[children[1]] == self.tokens.NAME
+			assert self.values[children[1]] == 'as'
 			optional_vars = self.handle_expr(children[2])
 			self.set_context(optional_vars, ast.Store)
 		return context_expr, optional_vars
@@ -551,19 +589,19 @@ class PythonASTBuilder:
 
 	def handle_classdef(self, classdef_node, decorators=None):
 		children = self.children(classdef_node)
-		name_node = ast.Name(children[1].value, ast.Store, children[1])
+		name_node = ast.Name(self.values[children[1]], ast.Store, self.pos(children[1]))
 		# e.x. class foo:
 		if len(children) == 4:
 			body = self.handle_suite(children[3])
-			return ast.ClassDef(name_node, None, None, None, None, body, decorators, classdef_node)
+			return ast.ClassDef(name_node, None, None, None, None, body, decorators, self.pos(classdef_node))
 		# e.x. class foo():
-		if children[3].type == self.tokens.RPAR:
+		if self.types[children[3]] == self.tokens.RPAR:
 			body = self.handle_suite(children[5])
-			return ast.ClassDef(name_node, None, None, None, None, body, decorators, classdef_node)
+			return ast.ClassDef(name_node, None, None, None, None, body, decorators, self.pos(classdef_node))
 		# everything else
 		bases, keywords, starargs, kwargs = self.handle_arglist(children[3])
 		body = self.handle_suite(children[6])
-		return ast.ClassDef(name_node, bases, keywords, starargs, kwargs, body, decorators, classdef_node)
+		return ast.ClassDef(name_node, bases, keywords, starargs, kwargs, body, decorators, self.pos(classdef_node))
 
 
 	def handle_arglist(self, arglist_node):
@@ -575,17 +613,18 @@ class PythonASTBuilder:
 		i = 0
 		while i < len(children):
 			arg = children[i]
-			if arg.type == self.tokens.COMMA:
+			arg_type = self.types[arg]
+			if arg_type == self.tokens.COMMA:
 				i += 1
-			elif arg.type == self.tokens.RPAR:
+			elif arg_type == self.tokens.RPAR:
 				i += 1
-			elif arg.type == self.tokens.STAR:
+			elif arg_type == self.tokens.STAR:
 				starargs = self.handle_testlist(children[i + 1])
 				i += 2
-			elif arg.type == self.tokens.DOUBLESTAR:
+			elif arg_type == self.tokens.DOUBLESTAR:
 				kwargs = self.handle_testlist(children[i + 1])
 				i += 2
-			elif arg.type == self.syms.argument:
+			elif arg_type == self.syms.argument:
 				base = self.handle_argument(arg)
 				if isinstance(base, ast.keyword):
 					keywords.append(base)
@@ -593,7 +632,7 @@ class PythonASTBuilder:
 					bases.append(base)
 				i += 1
 			else:
-				raise Exception("Unknown sym in arglist:", self.type_name(arg))
+				raise Exception("Unknown sym in arglist:", self.type_name(arg_type))
 		return bases, keywords, starargs, kwargs
 
 
@@ -602,46 +641,47 @@ class PythonASTBuilder:
 		children = self.children(argument_node)
 		if len(children) == 1:
 			return self.handle_testlist(children[0])
-		elif children[1].type == self.tokens.NAME and children[1].value == 'for':
+		elif self.types[children[1]] == self.tokens.NAME and self.values[children[1]] == 'for':
 			return self.handle_genexp(argument_node)
-		elif children[1].type == self.syms.comp_for:
+		elif self.types[children[1]] == self.syms.comp_for:
 			return self.handle_genexp(argument_node)
-		elif children[1].type == self.tokens.EQUAL:
+		elif self.types[children[1]] == self.tokens.EQUAL:
 			key = self.handle_testlist(children[0])
 			value = self.handle_testlist(children[2])
-			return ast.keyword(key, value, argument_node)
+			return ast.keyword(key, value, self.pos(argument_node))
 		raise NotImplementedError("Unknown argument type")
 
 
 	def handle_decorated(self, decorated_node):
-		decos = self.handle_decorators(decorated_node.children[0])
-		if decorated_node.children[1].children[0].value == 'def':
-			defined = self.handle_funcdef(decorated_node.children[1], decos)
+		children = self.children(decorated_node)
+		decos = self.handle_decorators(children[0])
+		if self.types[children[1]] == self.syms.funcdef:
+			defined = self.handle_funcdef(children[1], decos)
 		else:
-			defined = self.handle_classdef(decorated_node.children[1], decos)
+			defined = self.handle_classdef(children[1], decos)
 		return defined
 
 
 	def handle_funcdef(self, funcdef_node, decorators=None):
 		children = self.children(funcdef_node)
-		assert children[0].value == 'def'
-		assert children[1].type == self.tokens.NAME
-		assert children[2].type == self.syms.parameters
+		assert self.values[children[0]] == 'def'
+		assert self.types[children[1]] == self.tokens.NAME
+		assert self.types[children[2]] == self.syms.parameters
 
 		name_node = children[1]
-		name = ast.Name(name_node.value, ast.Store, name_node)
+		name = ast.Name(self.values[name_node], ast.Store, self.pos(name_node))
 		#self.check_forbidden_name(name, name_node)
 
 		args = self.handle_parameters(children[2])
 		at = 3
 		returns = None
-		if children[3].type == self.tokens.RARROW:
+		if self.types[children[3]] == self.tokens.RARROW:
 			returns = self.handle_expr(children[4])
 			at = 5
-		assert children[at].type == self.tokens.COLON
+		assert self.types[children[at]] == self.tokens.COLON
 		body = self.handle_suite(children[at + 1])
 
-		return ast.FunctionDef(name, args, body, decorators, returns, funcdef_node)
+		return ast.FunctionDef(name, args, body, decorators, returns, self.pos(funcdef_node))
 
 
 	def handle_decorators(self, decorators_node):
@@ -650,41 +690,43 @@ class PythonASTBuilder:
 
 
 	def handle_decorator(self, decorator_node):
+		'''decorator: '@' dotted_name [ '(' [arglist] ')' ] NEWLINE'''
 		children = self.children(decorator_node)
 		dec_name = self.handle_dotted_name(children[1])
-		if len(children) == 2:
+		if len(children) == 3:
 			dec = dec_name
-		elif len(children) == 4:
-			assert children[2].type == self.tokens.LPAR
-			assert children[3].type == self.tokens.RPAR
-			dec = ast.Call(dec_name, None, None, None, None, decorator_node)
+		elif len(children) == 5:
+			assert self.types[children[2]] == self.tokens.LPAR
+			assert self.types[children[3]] == self.tokens.RPAR
+			dec = ast.Call(dec_name, None, None, None, None, self.pos(decorator_node))
 		else:
-			assert children[2].type == self.tokens.LPAR
-			assert children[-1].type == self.tokens.RPAR
+			assert self.types[children[2]] == self.tokens.LPAR
+			assert self.types[children[-2]] == self.tokens.RPAR
 			args, keywords, starargs, kwargs = self.handle_arglist(children[3])
-			dec = ast.Call(dec_name, args, keywords, starargs, kwargs, decorator_node)
+			dec = ast.Call(dec_name, args, keywords, starargs, kwargs, self.pos(decorator_node))
 		return dec
 
 
 	def handle_dotted_name(self, dotted_name_node):
-		base_value = dotted_name_node.children[0].value
-		name = ast.Name(base_value, ast.Load, dotted_name_node)
-		for i in range(2, len(dotted_name_node.children), 2):
-			attr = ast.Name(dotted_name_node.children[i].value, ast.Load, dotted_name_node.children[i])
-			name = ast.Attribute(name, attr, ast.Load, dotted_name_node)
+		children = self.children(dotted_name_node)
+		base_value = self.values[children[0]]
+		name = ast.Name(base_value, ast.Load, self.pos(dotted_name_node))
+		for i in range(2, len(children), 2):
+			attr = ast.Name(self.values[children[i]], ast.Load, self.pos(children[i]))
+			name = ast.Attribute(name, attr, ast.Load, self.pos(dotted_name_node))
 		return name
 
 
 	def handle_parameters(self, arguments_node):
-		assert arguments_node.type == self.syms.parameters
+		assert self.types[arguments_node] == self.syms.parameters
 		children = self.children(arguments_node)
 
 		# the trivial (and common) case of '()'
 		if len(children) == 2:
-			assert children[0].type == self.tokens.LPAR
-			assert children[1].type == self.tokens.RPAR
+			assert self.types[children[0]] == self.tokens.LPAR
+			assert self.types[children[1]] == self.tokens.RPAR
 			return ast.arguments(None, None, None, None,
-				None, None, None, None, arguments_node)
+				None, None, None, None, self.pos(arguments_node))
 
 		# hand off to typedargs processing
 		args = self.handle_argslist(children[1])
@@ -693,8 +735,9 @@ class PythonASTBuilder:
 
 	def handle_argslist(self, argslist_node):
 		'''Both typedargslist and varargslist'''
-		assert argslist_node.type == self.syms.typedargslist or \
-				argslist_node.type == self.syms.varargslist
+		types = self.types
+		assert types[argslist_node] == self.syms.typedargslist or \
+				types[argslist_node] == self.syms.varargslist
 		children = self.children(argslist_node)
 		i = 0
 		child_count = len(children)
@@ -709,16 +752,17 @@ class PythonASTBuilder:
 		have_args = False
 		while i < child_count:
 			argument = children[i]
-			arg_type = argument.type
+			arg_type = types[argument]
 			if arg_type == self.syms.tfpdef or arg_type == self.syms.vfpdef:
 				if arg_type == self.syms.tfpdef:
 					arg = self.handle_tfpdef(argument)
 				else:
-					arg_name = ast.Name(argument.children[0].value, ast.Param, argument.children[0])
-					arg = ast.arg(arg_name, None, argument)
+					arg_name_node = self.children(argument)[0]
+					arg_name = ast.Name(self.values[arg_name_node], ast.Param, self.pos(arg_name_node))
+					arg = ast.arg(arg_name, None, self.pos(argument))
 				i += 1
 				default = None
-				if i < len(children) and children[i].type == self.tokens.EQUAL:
+				if i < len(children) and types[children[i]] == self.tokens.EQUAL:
 					i += 1
 					default = self.handle_testlist(children[i])
 					i += 1
@@ -729,19 +773,15 @@ class PythonASTBuilder:
 				else:
 					kwonlyargs.append(arg)
 					kw_defaults.append(default)
-			#elif arg_type == self.syms.vfpdef:
-			#	assert argument.children[0].type == self.tokens.NAME
-			#	args.append(ast.arg(argument.children[0].value, None, argument))
-			#	i += 1
 			elif arg_type == self.tokens.COMMA:
 				i += 1
 			elif arg_type == self.tokens.STAR:
-				if len(children) >= i and children[i + 1].type == self.syms.tfpdef:
+				if len(children) >= i and types[children[i + 1]] == self.syms.tfpdef:
 					vararg = self.handle_tfpdef(children[i + 1])
 					vararg_name = vararg.arg
 					vararg_annotation = vararg.annotation
 					i += 3
-				elif len(children) >= i and children[i + 1].type == self.syms.vfpdef:
+				elif len(children) >= i and types[children[i + 1]] == self.syms.vfpdef:
 					vararg = self.handle_vfpdef(children[i + 1])
 					vararg_name = vararg.arg
 					i += 3
@@ -749,12 +789,12 @@ class PythonASTBuilder:
 					i += 2
 				have_args = True
 			elif arg_type == self.tokens.DOUBLESTAR:
-				if len(children) >= i and children[i + 1].type == self.syms.tfpdef:
+				if len(children) >= i and types[children[i + 1]] == self.syms.tfpdef:
 					kwarg = self.handle_tfpdef(children[i + 1])
 					kwarg_name = kwarg.arg
 					kwarg_annotation = kwarg.annotation
 					i += 3
-				elif len(children) >= i and children[i + 1].type == self.syms.vfpdef:
+				elif len(children) >= i and types[children[i + 1]] == self.syms.vfpdef:
 					kwarg = self.handle_vfpdef(children[i + 1])
 					kwarg_name = kwarg.arg
 					i += 3
@@ -764,64 +804,65 @@ class PythonASTBuilder:
 					args, vararg_name, vararg_annotation,
 					kwonlyargs, kwarg_name, kwarg_annotation,
 					defaults, kw_defaults,
-					argslist_node)
+					self.pos(argslist_node))
 
 
 	def handle_tfpdef(self, tfpdef_node):
 		'''tfpdef: NAME [':' test]'''
-		assert tfpdef_node.type == self.syms.tfpdef
+		assert self.types[tfpdef_node] == self.syms.tfpdef
 		children = self.children(tfpdef_node)
-		assert children[0].type == self.tokens.NAME
-		name = ast.Name(children[0].value, ast.Param, children[0])
+		assert self.types[children[0]] == self.tokens.NAME
+		name = ast.Name(self.values[children[0]], ast.Param, self.pos(children[0]))
 		annotation = None
 		if len(children) > 1:
-			assert children[1].type == self.tokens.COLON
+			assert self.types[children[1]] == self.tokens.COLON
 			annotation = self.handle_testlist(children[2])
-		return ast.arg(name, annotation, tfpdef_node)
+		return ast.arg(name, annotation, self.pos(tfpdef_node))
 
 
 	def handle_vfpdef(self, vfpdef_node):
 		'''tfpdef: NAME'''
-		assert vfpdef_node.type == self.syms.vfpdef
+		assert self.types[vfpdef_node] == self.syms.vfpdef
 		children = self.children(vfpdef_node)
-		assert children[0].type == self.tokens.NAME
-		name = ast.Name(children[0].value, ast.Param, children[0])
-		return ast.arg(name, None, vfpdef_node)
+		assert self.types[children[0]] == self.tokens.NAME
+		name = ast.Name(self.values[children[0]], ast.Param, self.pos(children[0]))
+		return ast.arg(name, None, self.pos(vfpdef_node))
 
 
 	def handle_expr_stmt(self, stmt):
 		children = self.children(stmt)
 		if len(children) == 1:
 			expression = self.handle_testlist(children[0])
-			return ast.Expr(expression, stmt)
-		elif children[1].type == self.syms.augassign:
+			return ast.Expr(expression, self.pos(stmt))
+		elif self.types[children[1]] == self.syms.augassign:
 			target_child = children[0]
 			target_expr = self.handle_testlist(target_child)
 			self.set_context(target_expr, ast.Aug)
 			value_child = children[2]
-			if value_child.type == self.syms.testlist:
+			if self.types[value_child] == self.syms.testlist:
 				value_expr = self.handle_testlist(value_child)
 			else:
 				value_expr = self.handle_expr(value_child)
-			op_str = children[1].children[0].value
+			op_str = self.values[self.children(children[1])[0]]
 			operator = self.augassign_operator_map[op_str]
-			return ast.AugAssign(target_expr, operator, value_expr, stmt)
+			return ast.AugAssign(target_expr, operator, value_expr, self.pos(stmt))
 		else: # Normal assignment.
 			targets = []
 			for i in range(0, len(children) - 2, 2):
 				target_node = children[i]
-				if target_node.type == self.syms.yield_expr:
+				if self.types[target_node] == self.syms.yield_expr:
 					self.error("can't assign to yield expression", target_node)
 				target_expr = self.handle_testlist(target_node)
 				self.set_context(target_expr, ast.Store)
 				targets.append(target_expr)
-			assert children[-2].type == self.tokens.EQUAL and children[-2].value == '='
+			assert self.types[children[-2]] == self.tokens.EQUAL and self.values[children[-2]] == '='
 			value_child = children[-1]
-			if value_child.type == self.syms.testlist or value_child.type == self.syms.testlist_star_expr:
+			value_type = self.types[value_child]
+			if value_type == self.syms.testlist or value_type == self.syms.testlist_star_expr:
 				value_expr = self.handle_testlist(value_child)
 			else:
 				value_expr = self.handle_expr(value_child)
-			return ast.Assign(targets, value_expr, stmt)
+			return ast.Assign(targets, value_expr, self.pos(stmt))
 
 
 	def get_expression_list(self, tests):
@@ -840,22 +881,35 @@ class PythonASTBuilder:
 		children = self.children(tests)
 		if len(children) == 1:
 			return self.handle_expr(children[0])
-		elif children[1].type == self.tokens.NAME and children[1].value == 'if':
+		elif self.types[children[1]] == self.tokens.NAME and self.values[children[1]] == 'if':
 			return self.handle_ifexp(tests)
 		else:
 			elts = self.get_expression_list(tests)
-			return ast.Tuple(elts, ast.Load, tests)
+			return ast.Tuple(elts, ast.Load, self.pos(tests))
+
 
 
+	def skip_chain(self, node):
+		'''Step down through expression nodes that only wrap a single child.'''
+		types, begin, end, kids = self.types, self.child_begin, self.child_end, self.kids
+		while types[node] in self.chain_syms:
+			first = begin[node]
+			if end[node] - first != 1 or types[kids[first]] in self.lambdef_syms:
+				break
+			node = kids[first]
+		return node
+
 
 	def handle_expr(self, expr_node):
+		types = self.types
+		expr_node = self.skip_chain(expr_node)
 		# Loop until we return something.
 		while True:
 			children = self.children(expr_node)
-			expr_node_type = expr_node.type
+			expr_node_type = types[expr_node]
 			if expr_node_type in (self.syms.test, self.syms.test_nocond):
 				first_child = children[0]
-				if first_child.type in (self.syms.lambdef, self.syms.lambdef_nocond):
+				if types[first_child] in (self.syms.lambdef, self.syms.lambdef_nocond):
 					return self.handle_lambdef(first_child)
 				elif len(children) > 1:
 					return self.handle_ifexp(expr_node)
@@ -874,13 +928,13 @@ class PythonASTBuilder:
 					op = ast.Or
 				else:
 					op = ast.And
-				return ast.BoolOp(op, seq, expr_node)
+				return ast.BoolOp(op, seq, self.pos(expr_node))
 			elif expr_node_type == self.syms.not_test:
 				if len(children) == 1:
 					expr_node = children[0]
 					continue
 				expr = self.handle_expr(children[1])
-				return ast.UnaryOp(ast.Not, expr, expr_node)
+				return ast.UnaryOp(ast.Not, expr, self.pos(expr_node))
 			elif expr_node_type == self.syms.comparison:
 				if len(children) == 1:
 					expr_node = children[0]
@@ -891,7 +945,7 @@ class PythonASTBuilder:
 				for i in range(1, len(children), 2):
 					operators.append(self.handle_comp_op(children[i]))
 					operands.append(self.handle_expr(children[i + 1]))
-				return ast.Compare(expr, operators, operands, expr_node)
+				return ast.Compare(expr, operators, operands, self.pos(expr_node))
 			elif expr_node_type == self.syms.expr or \
 					expr_node_type == self.syms.xor_expr or \
 					expr_node_type == self.syms.and_expr or \
@@ -907,7 +961,7 @@ class PythonASTBuilder:
 					exp = self.handle_testlist(children[1])
 				else:
 					exp = None
-				return ast.Yield(exp, expr_node)
+				return ast.Yield(exp, self.pos(expr_node))
 			elif expr_node_type == self.syms.factor:
 				if len(children) == 1:
 					expr_node = children[0]
@@ -919,10 +973,10 @@ class PythonASTBuilder:
 				return self.handle_lambdef(expr_node)
 			elif expr_node_type == self.syms.star_expr:
 				assert len(children) == 2
-				assert children[0].type == self.tokens.STAR
-				assert children[0].value == '*'
+				assert types[children[0]] == self.tokens.STAR
+				assert self.values[children[0]] == '*'
 				value = self.handle_expr(children[1])
-				return ast.Starred(value, ast.Load, expr_node)
+				return ast.Starred(value, ast.Load, self.pos(expr_node))
 			else:
 				raise AssertionError("unknown expr: {}".format(
 					self.type_name(expr_node_type)))
@@ -930,14 +984,14 @@ class PythonASTBuilder:
 
 	def handle_lambdef(self, lambdef_node):
 		children = self.children(lambdef_node)
-		assert children[0].type == self.tokens.NAME and children[0].value == 'lambda'
+		assert self.types[children[0]] == self.tokens.NAME and self.values[children[0]] == 'lambda'
 		expr = self.handle_expr(children[-1])
 		if len(children) == 3:
-			assert children[1].type == self.tokens.COLON and children[1].value == ':'
-			args = ast.arguments(None, None, None, None, None, None, None, None, lambdef_node)
+			assert self.types[children[1]] == self.tokens.COLON and self.values[children[1]] == ':'
+			args = ast.arguments(None, None, None, None, None, None, None, None, self.pos(lambdef_node))
 		else:
 			args = self.handle_varargslist(children[1])
-		return ast.Lambda(args, [ast.Return(expr, children[-1])], lambdef_node)
+		return ast.Lambda(args, [ast.Return(expr, self.pos(children[-1]))], self.pos(lambdef_node))
 
 
 	def handle_varargslist(self, varargslist_node):
@@ -949,13 +1003,14 @@ class PythonASTBuilder:
 		body = self.handle_expr(children[0])
 		expression = self.handle_expr(children[2])
 		otherwise = self.handle_expr(children[4])
-		return ast.IfExp(expression, body, otherwise, if_expr_node)
+		return ast.IfExp(expression, body, otherwise, self.pos(if_expr_node))
 
 
 	def handle_comp_op(self, comp_op_node):
-		comp_node = comp_op_node.children[0]
-		comp_type = comp_node.type
-		if len(comp_op_node.children) == 1:
+		children = self.children(comp_op_node)
+		comp_node = children[0]
+		comp_type = self.types[comp_node]
+		if len(children) == 1:
 			if comp_type == self.tokens.LESS:
 				return ast.Lt
 			elif comp_type == self.tokens.GREATER:
@@ -969,18 +1024,18 @@ class PythonASTBuilder:
 			elif comp_type == self.tokens.NOTEQUAL:
 				return ast.NotEq
 			elif comp_type == self.tokens.NAME:
-				if comp_node.value == "is":
+				if self.values[comp_node] == "is":
 					return ast.Is
-				elif comp_node.value == "in":
+				elif self.values[comp_node] == "in":
 					return ast.In
 				else:
 					raise AssertionError("invalid comparison")
 			else:
 				raise AssertionError("invalid comparison")
 		else:
-			if comp_op_node.children[1].value == "in":
+			if self.values[children[1]] == "in":
 				return ast.NotIn
-			elif comp_node.value == "is":
+			elif self.values[comp_node] == "is":
 				return ast.IsNot
 			else:
 				raise AssertionError("invalid comparison")
@@ -990,33 +1045,35 @@ class PythonASTBuilder:
 		children = self.children(binop_node)
 		left = self.handle_expr(children[0])
 		right = self.handle_expr(children[2])
-		op = self.operator_map[children[1].type]
-		result = ast.BinOp(left, op, right, binop_node)
+		op = self.operator_map[self.types[children[1]]]
+		result = ast.BinOp(left, op, right, self.pos(binop_node))
 		number_of_ops = (len(children) - 1) // 2
 		for i in range(1, number_of_ops):
 			op_node = children[i * 2 + 1]
-			op = self.operator_map[op_node.type]
+			op = self.operator_map[self.types[op_node]]
 			sub_right = self.handle_expr(children[i * 2 + 2])
-			result = ast.BinOp(result, op, sub_right, op_node)
+			result = ast.BinOp(result, op, sub_right, self.pos(op_node))
 		return result
 
 
 	def handle_factor(self, factor_node):
+		types = self.types
+		children = self.children(factor_node)
 		# Fold '-' on constant numbers.
-		if factor_node.children[0].type == self.tokens.MINUS and \
-				len(factor_node.children) == 2:
-			factor = factor_node.children[1]
-			if factor.type == self.syms.factor and len(factor.children) == 1:
-				power = factor.children[0]
-				if power.type == self.syms.power and len(power.children) == 1:
-					atom = power.children[0]
-					if atom.type == self.syms.atom and \
-							atom.children[0].type == self.tokens.NUMBER:
-						num = atom.children[0]
-						num.value = "-" + num.value
-						return self.handle_atom(atom)
-		expr = self.handle_expr(factor_node.children[1])
-		op_type = factor_node.children[0].type
+		if types[children[0]] == self.tokens.MINUS and len(children) == 2:
+			factor = children[1]
+			factor_children = self.children(factor)
+			if types[factor] == self.syms.factor and len(factor_children) == 1:
+				power = factor_children[0]
+				power_children = self.children(power)
+				if types[power] == self.syms.power and len(power_children) == 1:
+					atom = power_children[0]
+					if types[atom] == self.syms.atom:
+						num = self.children(atom)[0]
+						if types[num] == self.tokens.NUMBER:
+							return ast.Num(self.parse_number("-" + self.values[num]), self.pos(atom))
+		expr = self.handle_expr(children[1])
+		op_type = types[children[0]]
 		if op_type == self.tokens.PLUS:
 			op = ast.UAdd
 		elif op_type == self.tokens.MINUS:
@@ -1025,7 +1082,7 @@ class PythonASTBuilder:
 			op = ast.Invert
 		else:
 			raise AssertionError("invalid factor node")
-		return ast.UnaryOp(op, expr, factor_node)
+		return ast.UnaryOp(op, expr, self.pos(factor_node))
 
 
 	def handle_power(self, power_node):
@@ -1035,83 +1092,86 @@ class PythonASTBuilder:
 			return atom_expr
 		for i in range(1, len(children)):
 			trailer = children[i]
-			if trailer.type != self.syms.trailer:
+			if self.types[trailer] != self.syms.trailer:
 				break
 			tmp_atom_expr = self.handle_trailer(trailer, atom_expr)
 			tmp_atom_expr.llcopy(atom_expr)
 			atom_expr = tmp_atom_expr
-		if children[-1].type == self.syms.factor:
+		if self.types[children[-1]] == self.syms.factor:
 			right = self.handle_expr(children[-1])
-			atom_expr = ast.BinOp(atom_expr, ast.Pow, right, power_node)
+			atom_expr = ast.BinOp(atom_expr, ast.Pow, right, self.pos(power_node))
 		return atom_expr
 
 
 	def handle_slice(self, slice_node):
+		types = self.types
 		children = self.children(slice_node)
 		first_child = children[0]
-		if first_child.type == self.tokens.DOT:
-			return ast.Ellipsis(slice_node)
-		if len(children) == 1 and first_child.type == self.syms.test:
+		if types[first_child] == self.tokens.DOT:
+			return ast.Ellipsis(self.pos(slice_node))
+		if len(children) == 1 and types[first_child] == self.syms.test:
 			index = self.handle_expr(first_child)
-			return ast.Index(index, slice_node)
+			return ast.Index(index, self.pos(slice_node))
 		lower = None
 		upper = None
 		step = None
-		if first_child.type == self.syms.test:
+		if types[first_child] == self.syms.test:
 			lower = self.handle_expr(first_child)
-		if first_child.type == self.tokens.COLON:
+		if types[first_child] == self.tokens.COLON:
 			if len(children) > 1:
 				second_child = children[1]
-				if second_child.type == self.syms.test:
+				if types[second_child] == self.syms.test:
 					upper = self.handle_expr(second_child)
 		elif len(children) > 2:
 			third_child = children[2]
-			if third_child.type == self.syms.test:
+			if types[third_child] == self.syms.test:
 				upper = self.handle_expr(third_child)
 		last_child = children[-1]
-		if last_child.type == self.syms.sliceop:
-			if len(last_child.children) == 1:
-				step = ast.Name("None", ast.Load, last_child)
+		if types[last_child] == self.syms.sliceop:
+			sliceop_children = self.children(last_child)
+			if len(sliceop_children) == 1:
+				step = ast.Name("None", ast.Load, self.pos(last_child))
 			else:
-				step_child = last_child.children[1]
-				if step_child.type == self.syms.test:
+				step_child = sliceop_children[1]
+				if types[step_child] == self.syms.test:
 					step = self.handle_expr(step_child)
-		return ast.Slice(lower, upper, step, slice_node)
+		return ast.Slice(lower, upper, step, self.pos(slice_node))
 
 
 	def handle_trailer(self, trailer_node, left_expr):
 		children = self.children(trailer_node)
 		first_child = children[0]
-		if first_child.type == self.tokens.LPAR:
+		if self.types[first_child] == self.tokens.LPAR:
 			if len(children) == 2:
-				return ast.Call(left_expr, None, None, None, None, trailer_node)
+				return ast.Call(left_expr, None, None, None, None, self.pos(trailer_node))
 			else:
 				bases, keywords, starargs, kwargs = self.handle_arglist(children[1])
-				return ast.Call(left_expr, bases, keywords, starargs, kwargs, trailer_node)
-		elif first_child.type == self.tokens.DOT:
-			attr = ast.Name(children[1].value, ast.Load, children[1])
-			return ast.Attribute(left_expr, attr, ast.Load, trailer_node)
+				return ast.Call(left_expr, bases, keywords, starargs, kwargs, self.pos(trailer_node))
+		elif self.types[first_child] == self.tokens.DOT:
+			attr = ast.Name(self.values[children[1]], ast.Load, self.pos(children[1]))
+			return ast.Attribute(left_expr, attr, ast.Load, self.pos(trailer_node))
 		else:
 			middle = children[1]
-			if len(middle.children) == 1:
-				slice = self.handle_slice(middle.children[0])
-				return ast.Subscript(left_expr, slice, ast.Load, middle)
+			middle_children = self.children(middle)
+			if len(middle_children) == 1:
+				slice = self.handle_slice(middle_children[0])
+				return ast.Subscript(left_expr, slice, ast.Load, self.pos(middle))
 			slices = []
 			simple = True
-			for i in range(0, len(middle.children), 2):
-				slc = self.handle_slice(middle.children[i])
+			for i in range(0, len(middle_children), 2):
+				slc = self.handle_slice(middle_children[i])
 				if not isinstance(slc, ast.Index):
 					simple = False
 				slices.append(slc)
 			if not simple:
 				ext_slice = ast.ExtSlice(slices)
-				return ast.Subscript(left_expr, ext_slice, ast.Load, middle)
+				return ast.Subscript(left_expr, ext_slice, ast.Load, self.pos(middle))
 			elts = []
 			for idx in slices:
 				assert isinstance(idx, ast.Index)
 				elts.append(idx.value)
-			tup = ast.Tuple(elts, ast.Load, middle)
-			return ast.Subscript(left_expr, ast.Index(tup, middle), ast.Load, middle)
+			tup = ast.Tuple(elts, ast.Load, self.pos(middle))
+			return ast.Subscript(left_expr, ast.Index(tup, self.pos(middle)), ast.Load, self.pos(middle))
 
 
 	def parse_number(self, raw):
@@ -1131,46 +1191,47 @@ class PythonASTBuilder:
 
 	#FIXME: this can sometimes be a Store op, e.g. as optional_vars on with_stmt
 	def handle_atom(self, atom_node):
+		types = self.types
 		children = self.children(atom_node)
 		first_child = children[0]
-		first_child_type = first_child.type
+		first_child_type = types[first_child]
 		if first_child_type == self.tokens.NAME:
-			return ast.Name(first_child.value, ast.Load, first_child)
+			return ast.Name(self.values[first_child], ast.Load, self.pos(first_child))
 		elif first_child_type == self.tokens.STRING:
-			sub_strings = [s.value for s in children]
+			sub_strings = [self.values[s] for s in children]
 			if len(sub_strings) > 0:
 				final_string = ''.join(sub_strings)
 			else:
 				final_string = sub_strings
 			if self.is_byte_string(final_string):
-				return ast.Bytes(final_string, atom_node)
-			return ast.Str(final_string, atom_node)
+				return ast.Bytes(final_string, self.pos(atom_node))
+			return ast.Str(final_string, self.pos(atom_node))
 		elif first_child_type == self.tokens.NUMBER:
-			num_value = self.parse_number(first_child.value)
-			return ast.Num(num_value, atom_node)
+			num_value = self.parse_number(self.values[first_child])
+			return ast.Num(num_value, self.pos(atom_node))
 		elif first_child_type == self.tokens.ELLIPSIS:
-			return ast.Ellipsis(atom_node)
+			return ast.Ellipsis(self.pos(atom_node))
 		elif first_child_type == self.tokens.LPAR:
 			second_child = children[1]
-			if second_child.type == self.tokens.RPAR:
-				return ast.Tuple(None, ast.Load, atom_node)
-			elif second_child.type == self.syms.yield_expr:
+			if types[second_child] == self.tokens.RPAR:
+				return ast.Tuple(None, ast.Load, self.pos(atom_node))
+			elif types[second_child] == self.syms.yield_expr:
 				return self.handle_expr(second_child)
 			return self.handle_testlist_gexp(second_child)
 		elif first_child_type == self.tokens.LSQB:
 			second_child = children[1]
-			if second_child.type == self.tokens.RSQB:
-				return ast.List(None, ast.Load, atom_node)
+			if types[second_child] == self.tokens.RSQB:
+				return ast.List(None, ast.Load, self.pos(atom_node))
 			second_children = self.children(second_child)
 			if len(second_children) == 1 or \
-					second_children[1].type == self.tokens.COMMA:
+					types[second_children[1]] == self.tokens.COMMA:
 				elts = self.get_expression_list(second_child)
-				return ast.List(elts, ast.Load, atom_node)
+				return ast.List(elts, ast.Load, self.pos(atom_node))
 			return self.handle_listcomp(second_child)
 		elif first_child_type == self.tokens.LBRACE:
 			second_child = children[1]
-			if second_child.type == self.tokens.RBRACE:
-				return ast.Dict(None, None, atom_node)
+			if types[second_child] == self.tokens.RBRACE:
+				return ast.Dict(None, None, self.pos(atom_node))
 			return self.handle_dictorsetmaker(second_child, atom_node)
 		else:
 			raise AssertionError("unknown atom")
@@ -1179,32 +1240,33 @@ class PythonASTBuilder:
 	#dictorsetmaker: ( (test ':' test (comp_for | (',' test ':' test)* [','])) |
 	#              (test (comp_for | (',' test)* [','])) )
 	def handle_dictorsetmaker(self, second_child, atom_node):
+		types = self.types
 		children = self.children(second_child)
 		# SET
-		if len(children) < 2 or children[1].type != self.tokens.COLON:
+		if len(children) < 2 or types[children[1]] != self.tokens.COLON:
 			# Set Comprehension
-			if len(children) == 2 and children[1].type == self.syms.comp_for:
+			if len(children) == 2 and types[children[1]] == self.syms.comp_for:
 				elt = self.handle_testlist(children[0])
 				comps = self.handle_comp_for(children[1])
 				elt.set_context(ast.Load)
-				return ast.SetComp(elt, comps, atom_node)
+				return ast.SetComp(elt, comps, self.pos(atom_node))
 			# Normal Set
 			else:
 				values = []
 				for i in range(0, len(children), 2):
 					values.append(self.handle_testlist(children[i]))
-				return ast.Set(values, atom_node)
+				return ast.Set(values, self.pos(atom_node))
 		# DICT
 		else:
 			# Dict Comprehension
 			# test ':' test comp_for
-			if len(children) == 4 and children[3].type == self.syms.comp_for:
+			if len(children) == 4 and types[children[3]] == self.syms.comp_for:
 				key = self.handle_testlist(children[0])
 				value = self.handle_testlist(children[2])
 				generators = self.handle_comp_for(children[3])
 				key.set_context(ast.Load)
 				value.set_context(ast.Load)
-				return ast.DictComp(key, value, generators, atom_node)
+				return ast.DictComp(key, value, generators, self.pos(atom_node))
 			# Normal Dict
 			else:
 				keys = []
@@ -1212,7 +1274,7 @@ class PythonASTBuilder:
 				for i in range(0, len(children), 4):
 					keys.append(self.handle_testlist(children[i]))
 					values.append(self.handle_testlist(children[i + 2]))
-				return ast.Dict(keys, values, atom_node)
+				return ast.Dict(keys, values, self.pos(atom_node))
 
 
 	def handle_comp_for(self, comp_for_node) -> [ast.comprehension]:
@@ -1224,14 +1286,14 @@ class PythonASTBuilder:
 		ifs = []
 		if len(children) > 4:
 			iter_children = self.children(children[4])
-			if iter_children[0].type == self.syms.comp_for:
-				return [ast.comprehension(target, iter_, [], comp_for_node)] + \
+			if self.types[iter_children[0]] == self.syms.comp_for:
+				return [ast.comprehension(target, iter_, [], self.pos(comp_for_node))] + \
 						self.handle_comp_for(iter_children[0])
 			else:
-				assert iter_children[0].type == self.syms.comp_if
+				assert self.types[iter_children[0]] == self.syms.comp_if
 				ifs, comps = self.handle_comp_if(iter_children[0])
-				return [ast.comprehension(target, iter_, ifs, comp_for_node)] + comps
-		return [ast.comprehension(target, iter_, [], comp_for_node)]
+				return [ast.comprehension(target, iter_, ifs, self.pos(comp_for_node))] + comps
+		return [ast.comprehension(target, iter_, [], self.pos(comp_for_node))]
 
 
 	def handle_comp_if(self, comp_iter_node) -> ([ast.expr], [ast.comprehension]):
@@ -1241,18 +1303,19 @@ class PythonASTBuilder:
 		comps = []
 		if len(children) > 2:
 			iter_children = self.children(children[2])
-			if iter_children[0].type == self.syms.comp_for:
+			if self.types[iter_children[0]] == self.syms.comp_for:
 				comps = self.handle_comp_for(iter_children[0])
 			else:
-				assert iter_children[0].type == self.syms.comp_if
+				assert self.types[iter_children[0]] == self.syms.comp_if
 				extra_ifs, comps = self.handle_comp_if(iter_children[0])
 				ifs.extend(extra_ifs)
 		return ifs, comps
 
 
 	def handle_testlist_gexp(self, gexp_node):
-		if len(gexp_node.children) > 1 and \
-				gexp_node.children[1].type == self.syms.comp_for:
+		children = self.children(gexp_node)
+		if len(children) > 1 and \
+				self.types[children[1]] == self.syms.comp_for:
 			return self.handle_genexp(gexp_node)
 		return self.handle_testlist(gexp_node)
 
@@ -1262,18 +1325,20 @@ class PythonASTBuilder:
 		current_for = self.children(comp_node)[1]
 		while True:
 			count += 1
-			if len(self.children(current_for)) == 5:
-				current_iter = self.children(current_for)[4]
+			for_children = self.children(current_for)
+			if len(for_children) == 5:
+				current_iter = for_children[4]
 			else:
 				return count
 			while True:
 				first_child = self.children(current_iter)[0]
-				if first_child.type == for_type:
-					current_for = self.children(current_iter)[0]
+				if self.types[first_child] == for_type:
+					current_for = first_child
 					break
-				elif first_child.type == if_type:
-					if len(self.children(first_child)) == 3:
-						current_iter = self.children(first_child)[2]
+				elif self.types[first_child] == if_type:
+					if_children = self.children(first_child)
+					if len(if_children) == 3:
+						current_iter = if_children[2]
 					else:
 						return count
 				else:
@@ -1283,12 +1348,11 @@ class PythonASTBuilder:
 	def count_comp_ifs(self, iter_node, for_type):
 		count = 0
 		while True:
-			iter_children = self.children(iter_node)
-			first_child = iter_children[0]
-			first_children = self.children(first_child)
-			if first_child.type == for_type:
+			first_child = self.children(iter_node)[0]
+			if self.types[first_child] == for_type:
 				return count
 			count += 1
+			first_children = self.children(first_child)
 			if len(first_children) == 2:
 				return count
 			iter_node = first_children[2]
@@ -1296,33 +1360,36 @@ class PythonASTBuilder:
 
 	def comprehension_helper(self, comp_node, for_type, if_type, iter_type,
 							 handle_source_expression):
-		elt = self.handle_expr(comp_node.children[0])
+		children = self.children(comp_node)
+		elt = self.handle_expr(children[0])
 		elt.set_context(ast.Load)
 		fors_count = self.count_comp_fors(comp_node, for_type, if_type)
 		comps = []
-		comp_for = self.children(comp_node)[1]
+		comp_for = children[1]
 		for i in range(fors_count):
-			for_node = self.children(comp_for)[1]
+			for_children = self.children(comp_for)
+			for_node = for_children[1]
 			for_targets = self.handle_exprlist(for_node, ast.Store)
-			expr = handle_source_expression(self.children(comp_for)[3])
+			expr = handle_source_expression(for_children[3])
 			assert isinstance(expr, ast.expr)
 			if len(self.children(for_node)) == 1:
-				comp = ast.comprehension(for_targets, expr, None, comp_for)
+				comp = ast.comprehension(for_targets, expr, None, self.pos(comp_for))
 			else:
-				comp = ast.comprehension(for_targets, expr, None, comp_node)
-			if len(self.children(comp_for)) == 5:
-				comp_for = comp_iter = self.children(comp_for)[4]
-				assert comp_iter.type == iter_type
+				comp = ast.comprehension(for_targets, expr, None, self.pos(comp_node))
+			if len(for_children) == 5:
+				comp_for = comp_iter = for_children[4]
+				assert self.types[comp_iter] == iter_type
 				ifs_count = self.count_comp_ifs(comp_iter, for_type)
 				if ifs_count:
 					ifs = []
 					for j in range(ifs_count):
 						comp_for = comp_if = self.children(comp_iter)[0]
-						ifs.append(self.handle_expr(self.children(comp_if)[1]))
-						if len(self.children(comp_if)) == 3:
-							comp_for = comp_iter = self.children(comp_if)[2]
+						if_children = self.children(comp_if)
+						ifs.append(self.handle_expr(if_children[1]))
+						if len(if_children) == 3:
+							comp_for = comp_iter = if_children[2]
 					comp.ifs = ifs
-				if comp_for.type == iter_type:
+				if self.types[comp_for] == iter_type:
 					comp_for = self.children(comp_for)[0]
 			assert isinstance(comp, ast.comprehension)
 			comps.append(comp)
@@ -1333,14 +1400,14 @@ class PythonASTBuilder:
 		elt, comps = self.comprehension_helper(genexp_node, self.syms.comp_for,
 											   self.syms.comp_if, self.syms.comp_iter,
 											   self.handle_expr)
-		return ast.GeneratorExp(elt, comps, genexp_node)
+		return ast.GeneratorExp(elt, comps, self.pos(genexp_node))
 
 
 	def handle_listcomp(self, listcomp_node):
 		elt, comps = self.comprehension_helper(listcomp_node, self.syms.comp_for,
 											   self.syms.comp_if, self.syms.comp_iter,
 											   self.handle_testlist)
-		return ast.ListComp(elt, comps, listcomp_node)
+		return ast.ListComp(elt, comps, self.pos(listcomp_node))
 
 
 	def handle_exprlist(self, exprlist, context):
@@ -1353,6 +1420,4 @@ class PythonASTBuilder:
 			exprs.append(expr)
 		if len(exprs) == 1:
 			return exprs[0]
-		return ast.Tuple(exprs, context, exprlist)
-
-
+		return ast.Tuple(exprs, context, self.pos(exprlist))
@@ -2,27 +2,103 @@
 Wraps pypy's low-level pgen and provides some supporting infrastructure.  
 This is original to millipede, but based heavily on the equivalent class in pypy.
 '''
+from .pgen import metaparser, parser as pgen_parser
 from .pgen.metaparser import ParserGenerator
-from .pgen.parser import Parser, Grammar, Node
+from .pgen.parser import Parser, Grammar, ParseTree
+import errno
+import hashlib
 import io
+import logging
+import os
+import pickle
+
+
+# bump this if the layout of the Grammar tables changes
+GRAMMAR_CACHE_VERSION = 1
+
+# the tables that ParserGenerator.build_grammar fills in
+GRAMMAR_TABLES = ('symbol_ids', 'symbol_names', 'symbol_to_label', 'keyword_ids', 'dfas', 'labels', 'token_ids', 'start')
+
+
+def default_cache_dir() -> str:
+	'''The per-user directory we keep the grammar tables in when we are not given one.'''
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	return os.path.join(base, 'millipede')
 
 
 class PythonParser(Parser):
-	def __init__(self, grammar_file:str, grammar_cls:Grammar):
+	'''
+	cache_dir -- where to keep the generated grammar tables; defaults to default_cache_dir()
+	'''
+	def __init__(self, grammar_file:str, grammar_cls:Grammar, cache_dir:str=None):
 		# build a parser generator for the provided grammar
 		with open(grammar_file, 'rt', encoding='utf-8') as fp:
 			grammar_source = fp.read()
-		pgen = ParserGenerator(grammar_source)
-		pgen.start_symbol = 'file_input'
 
-		# build a grammar with the generator and the grammar symbols
-		gram = pgen.build_grammar(grammar_cls)
+		# NOTE: the tables depend on the token numbering in the grammar class and on the parser generator
+		#		that builds them, as well as on the grammar itself
+		key = hashlib.sha1()
+		key.update(grammar_source.encode('utf-8'))
+		key.update(repr(sorted(grammar_cls.TOKENS.items())).encode('utf-8'))
+		for module in (metaparser, pgen_parser):
+			with open(module.__file__, 'rb') as fp:
+				key.update(fp.read())
+		key = '{}:{}:{}'.format(GRAMMAR_CACHE_VERSION, grammar_cls.__name__, key.hexdigest())
+
+		# Note: name the file after the key, so that different grammars, or versions of us, do not fight over it
+		cache_file = os.path.join(cache_dir or default_cache_dir(),
+								'{}-{}.tables'.format(os.path.basename(grammar_file), key[-40:]))
+		gram = self._load_grammar(cache_file, key, grammar_cls)
+		if gram is None:
+			pgen = ParserGenerator(grammar_source)
+			pgen.start_symbol = 'file_input'
+
+			# build a grammar with the generator and the grammar symbols
+			gram = pgen.build_grammar(grammar_cls)
+			self._save_grammar(cache_file, key, gram)
 
 		# pass on the grammar to the real parser
 		super().__init__(gram)
 
 
-	def parse(self, tokens:list) -> Node:
+	@staticmethod
+	def _load_grammar(cache_file:str, key:str, grammar_cls:Grammar) -> Grammar:
+		'''Return the grammar stored in cache_file if it was built from the same source, or None.'''
+		try:
+			with open(cache_file, 'rb') as fp:
+				cached_key, tables = pickle.load(fp)
+		except Exception:
+			return None
+		if cached_key != key:
+			return None
+		gram = grammar_cls()
+		for name in GRAMMAR_TABLES:
+			setattr(gram, name, tables[name])
+		return gram
+
+
+	@staticmethod
+	def _save_grammar(cache_file:str, key:str, gram:Grammar):
+		tables = {name: getattr(gram, name) for name in GRAMMAR_TABLES}
+		tmpname = cache_file + '.' + str(os.getpid())
+		try:
+			try:
+				os.makedirs(os.path.dirname(cache_file))
+			except OSError as ex:
+				if ex.errno != errno.EEXIST: raise
+			try:
+				with open(tmpname, 'wb') as fp:
+					pickle.dump((key, tables), fp, pickle.HIGHEST_PROTOCOL)
+				os.rename(tmpname, cache_file)
+			finally:
+				if os.path.exists(tmpname):
+					os.unlink(tmpname)
+		except (IOError, OSError) as ex:
+			logging.debug("Not caching grammar tables at {}: {}".format(cache_file, str(ex)))
+
+
+	def parse(self, tokens:iter) -> ParseTree:
+		'''Tokens may be any iterable; we pull one token at a time.'''
 		self.prepare()
 		for tok in tokens:
 			rv = self.add_token(tok.type, tok.string, tok.start, tok.end, tok.line)
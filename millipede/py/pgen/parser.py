@@ -5,8 +5,14 @@ NOTES for Millipede:
     - Copied from pypy (+2to3)
     - Add SkipToken and logic to carry unparsed nodes in the tree
     - Carry startpos/endpos through parse rather than lineno/column
+    - Compile the dfas into dense (state, label) transition tables
+    - Build the parse tree into the parallel arrays of a ParseTree, rather than
+      allocating a Node per token; skip tokens are kept out of band
 """
 
+from array import array
+
+
 class SkipToken(Exception): pass
 
 
@@ -48,28 +54,55 @@ class Grammar(object):
         return True
 
 
-class Node(object):
+class ParseTree(object):
+    """
+    A parse tree stored as parallel arrays, indexed by node number.
 
-    __slots__ = "type value children startpos endpos".split()
+    Positions are only stored once per token, as separate line and column
+    arrays; each node refers to the position of its first token (a
+    nonterminal takes the position of the token that started it).  Child
+    lists are stored contiguously in kids; a node's children are
+    kids[child_begin:child_end], and terminals have a child_begin of -1.
+    Skip tokens are not part of the tree; they are kept, with the node they
+    were seen under, in skipped.  The start symbol is node root.
+    """
 
-    def __init__(self, type, value, children, startpos, endpos):
-        self.type = type
-        self.value = value
-        self.children = children
-        self.startpos = startpos
-        self.endpos = endpos
+    def __init__(self):
+        self.types = [] # NOTE: type ids are shared objects, so a list is compact here and faster to read
+        self.values = []
+        self.positions = array('i')
+        self.child_begin = array('i')
+        self.child_end = array('i')
+        self.kids = array('i')
+        self.start_lines = array('i')
+        self.start_cols = array('i')
+        self.end_lines = array('i')
+        self.end_cols = array('i')
+        self.skipped = [] # [(type, value, startpos, endpos, parent)]
+        self.root = -1
 
-    def __eq__(self, other):
-        # For tests.
-        return (self.type == other.type and
-                self.value == other.value and
-                self.children == other.children)
+    def add_position(self, startpos, endpos):
+        """Record the position of the next token and return its index."""
+        self.start_lines.append(startpos[0])
+        self.start_cols.append(startpos[1])
+        self.end_lines.append(endpos[0])
+        self.end_cols.append(endpos[1])
+        return len(self.end_cols) - 1
 
-    def __repr__(self):
-        if self.value is None:
-            return "Node(type=%s, children=%r)" % (self.type, self.children)
-        else:
-            return "Node(type=%s, value=%r)" % (self.type, self.value)
+    def add(self, type, value, position):
+        index = len(self.values)
+        self.types.append(type)
+        self.values.append(value)
+        self.positions.append(position)
+        self.child_begin.append(-1)
+        self.child_end.append(-1)
+        return index
+
+    def close(self, index, kids):
+        """Record the children of a nonterminal once it has been parsed."""
+        self.child_begin[index] = len(self.kids)
+        self.kids.extend(kids)
+        self.child_end[index] = len(self.kids)
 
 
 class ParseError(Exception):
@@ -94,6 +127,46 @@ class Parser(object):
         self.grammar = grammar
         self.root = None
         self.stack = None
+        self.tree = None
+        self.tables = self.compile_tables(grammar)
+
+    @staticmethod
+    def compile_tables(grammar):
+        """Compile each dfa into a list of states for the parse stack.
+
+        Each state is (row, is_accepting, accept_only, expected), where row is
+        indexed by token label and holds None or the action to take on that
+        token: (next_state, None, 0) to shift it or (next_state, sub_dfa_states,
+        sym_id) to push the nonterminal it starts.  Where several arcs could
+        take a token, the first arc wins, as in the linear scan.
+        """
+        num_labels = len(grammar.labels)
+        tables = {}
+        for sym_id in grammar.dfas:
+            tables[sym_id] = []
+        for sym_id, (states, first) in grammar.dfas.items():
+            compiled = tables[sym_id]
+            for arcs, is_accepting in states:
+                row = [None] * num_labels
+                for i, next_state in arcs:
+                    arc_sym_id = grammar.labels[i]
+                    if arc_sym_id < 256:
+                        if row[i] is None:
+                            row[i] = (next_state, None, 0)
+                    else:
+                        action = (next_state, tables[arc_sym_id], arc_sym_id)
+                        for label_index in grammar.dfas[arc_sym_id][1]:
+                            if row[label_index] is None:
+                                row[label_index] = action
+                # If only one possible input would satisfy, attach it to the
+                # error.
+                if len(arcs) == 1:
+                    expected = grammar.labels[arcs[0][0]]
+                else:
+                    expected = -1
+                accept_only = bool(is_accepting and not arcs)
+                compiled.append((row, is_accepting, accept_only, expected))
+        return tables
 
     def prepare(self, start= -1):
         """Setup the parser for parsing.
@@ -103,46 +176,42 @@ class Parser(object):
         if start == -1:
             start = self.grammar.start
         self.root = None
-        current_node = Node(start, None, [], (0, 0), (0, 0))
+        self.tree = ParseTree()
+        current_node = self.tree.add(start, None,
+                                     self.tree.add_position((0, 0), (0, 0)))
         self.stack = []
-        self.stack.append((self.grammar.dfas[start], 0, current_node))
+        self.stack.append((self.tables[start], 0, current_node, []))
 
     def add_token(self, token_type, value, startpos, endpos, line):
         try:
             label_index = self.classify(token_type, value, startpos, endpos, line)
         except SkipToken as ex:
-            new_node = Node(token_type, value, None, startpos, endpos)
-            self.stack[-1][2].children.append(new_node)
+            self.tree.skipped.append((token_type, value, startpos, endpos,
+                                      self.stack[-1][2]))
             return
 
-        sym_id = 0 # for the annotator
         while True:
-            dfa, state_index, node = self.stack[-1]
-            states, first = dfa
-            arcs, is_accepting = states[state_index]
-            for i, next_state in arcs:
-                sym_id = self.grammar.labels[i]
-                if label_index == i:
-                    # We matched a non-terminal.
+            states, state_index, node, kids = self.stack[-1]
+            row, is_accepting, accept_only, expected = states[state_index]
+            action = row[label_index]
+            if action is not None:
+                next_state, sub_states, sym_id = action
+                if sub_states is None:
+                    # We matched a terminal.
                     self.shift(next_state, token_type, value, startpos, endpos)
                     state = states[next_state]
                     # While the only possible action is to accept, pop nodes off
                     # the stack.
-                    while state[1] and not state[0]:
+                    while state[2]:
                         self.pop()
                         if not self.stack:
                             # Parsing is done.
                             return True
-                        dfa, state_index, node = self.stack[-1]
-                        state = dfa[0][state_index]
+                        states, state_index, node, kids = self.stack[-1]
+                        state = states[state_index]
                     return False
-                elif sym_id >= 256:
-                    sub_node_dfa = self.grammar.dfas[sym_id]
-                    # Check if this token can start a child node.
-                    if label_index in sub_node_dfa[1]:
-                        self.push(sub_node_dfa, next_state, sym_id, startpos,
-                                  endpos)
-                        break
+                # This token starts a child node.
+                self.push(sub_states, next_state, sym_id, startpos, endpos)
             else:
                 # We failed to find any arcs to another state, so unless this
                 # state is accepting, it's invalid input.
@@ -152,12 +221,6 @@ class Parser(object):
                         raise ParseError("too much input", token_type, value,
                                          startpos, endpos, line)
                 else:
-                    # If only one possible input would satisfy, attach it to the
-                    # error.
-                    if len(arcs) == 1:
-                        expected = sym_id
-                    else:
-                        expected = -1
                     raise ParseError("bad input", token_type, value, startpos,
                                      endpos, line, expected)
 
@@ -177,22 +240,27 @@ class Parser(object):
 
     def shift(self, next_state, token_type, value, startpos, endpos):
         """Shift a non-terminal and prepare for the next state."""
-        dfa, state, node = self.stack[-1]
-        new_node = Node(token_type, value, None, startpos, endpos)
-        node.children.append(new_node)
-        self.stack[-1] = (dfa, next_state, node)
+        dfa, state, node, kids = self.stack[-1]
+        position = self.tree.add_position(startpos, endpos)
+        kids.append(self.tree.add(token_type, value, position))
+        self.stack[-1] = (dfa, next_state, node, kids)
 
     def push(self, next_dfa, next_state, node_type, startpos, endpos):
         """Push a terminal and adjust the current state."""
-        dfa, state, node = self.stack[-1]
-        new_node = Node(node_type, None, [], startpos, endpos)
-        self.stack[-1] = (dfa, next_state, node)
-        self.stack.append((next_dfa, 0, new_node))
+        dfa, state, node, kids = self.stack[-1]
+        # NOTE: the token that starts this node is shifted right after we
+        #       push, so it will be the next position that we record
+        new_node = self.tree.add(node_type, None, len(self.tree.end_cols))
+        self.stack[-1] = (dfa, next_state, node, kids)
+        self.stack.append((next_dfa, 0, new_node, []))
 
     def pop(self):
         """Pop an entry off the stack and make its node a child of the last."""
-        dfa, state, node = self.stack.pop()
+        dfa, state, node, kids = self.stack.pop()
+        self.tree.close(node, kids)
         if self.stack:
-            self.stack[-1][2].children.append(node)
+            self.stack[-1][3].append(node)
         else:
-            self.root = node
+            # NOTE: the consumer gets the whole tree; the start node is its root
+            self.tree.root = node
+            self.root = self.tree
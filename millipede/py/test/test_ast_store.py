@@ -0,0 +1,57 @@
+'''
+Copyright (c) 2011, Terrence Cole.
+All rights reserved.
+'''
+from millipede.project.ast_store import encode_ast, decode_ast, AstStore
+from millipede.py.driver import PythonParserDriver
+import millipede.py.ast as py
+import os
+import shutil
+import tempfile
+
+
+def _slots(cls):
+	# Note: include the slots we inherit, so that we compare the start and end positions as well
+	out = []
+	for base in reversed(cls.__mro__):
+		for name in base.__dict__.get('__slots__', ()):
+			if name not in out and name not in ('symbol', 'hl', 'll', 'bb'):
+				out.append(name)
+	return out
+
+
+def _dump(node):
+	if isinstance(node, (py.AST, py.alias)):
+		return (type(node).__name__, tuple((name, _dump(getattr(node, name, None))) for name in _slots(type(node))))
+	if isinstance(node, (list, tuple)):
+		return type(node)([_dump(n) for n in node])
+	return node
+
+
+def test_roundtrip():
+	prog = '''def foo(a, b=1, *args, c:int=2**70, **kwargs):\n\treturn [b"x", 1.5, a[1:2], ...]\n\n'''
+	driver = PythonParserDriver('data/grammar/python-3.1')
+	ast = driver.parse_string(prog)
+	assert _dump(decode_ast(encode_ast(ast))) == _dump(ast)
+	assert decode_ast(encode_ast(ast)).body[0].start == ast.body[0].start
+	assert decode_ast(encode_ast(ast)).body[0].body[0].end == ast.body[0].body[0].end
+
+
+def test_store():
+	driver = PythonParserDriver('data/grammar/python-3.1')
+	ast = driver.parse_string('import os\n\n')
+	tmpdir = tempfile.mkdtemp()
+	try:
+		filename = os.path.join(tmpdir, 'test.ast')
+		store = AstStore(filename)
+		store.put('a.py', '0' * 40, encode_ast(ast))
+		store.commit()
+		store.close()
+
+		store = AstStore(filename)
+		assert store.has('a.py', '0' * 40)
+		assert store.get('a.py', '1' * 40) is None
+		assert _dump(store.get('a.py', '0' * 40)) == _dump(ast)
+		store.close()
+	finally:
+		shutil.rmtree(tmpdir)
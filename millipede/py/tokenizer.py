@@ -16,6 +16,13 @@ class PythonTokenizer:
 		return tokens
 
 
+	def stream(self, source:str):
+		'''Like tokenize, but yield tokens as they are scanned, so that the parser can consume them
+			without us ever holding the full token list.'''
+		fp = StringIO(source)
+		return self.token_iter(fp.readline)
+
+
 	def token_iter(self, readline):
 		tokiter = _tokenize(readline, None)
 		opmap = self.grammar.OPERATOR_MAP
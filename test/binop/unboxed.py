@@ -0,0 +1,42 @@
+def ints(n):
+	i = 0
+	total = 0
+	big = 1
+	while i < n:
+		total += i * i - 3
+		big = big * 1000003
+		i = i + 1
+	m = -total // 7 % 5
+	print(total, m, big % 1000, total / 4)
+	print(i, big > 10 ** 20)
+ints(10)
+#out: 255 3 49 63.75
+#out: 10 True
+
+def floats(n):
+	x = 0.5
+	k = 0
+	while k < n:
+		x = x * 1.5 - 0.125
+		k += 1
+	y = k / 2
+	print(x, y, -x)
+	return x
+print(floats(3) > 1)
+#out: 1.09375 1.5 -1.09375
+#out: True
+
+def zero():
+	d = 0.0
+	try:
+		d = 1.0 / d
+	except ZeroDivisionError:
+		print('float division')
+	z = 0
+	try:
+		z = 1 // z
+	except ZeroDivisionError:
+		print('int division')
+zero()
+#out: float division
+#out: int division
@@ -11,4 +11,4 @@ def foo(A):
 
 foo('foo')()
 #out: foo
-#out: local variable 'A' referenced before assignment
+#out: free variable 'A' referenced before assignment in enclosing scope
@@ -0,0 +1,40 @@
+def total(n):
+	t = 0
+	for i in range(n):
+		t += i
+	for i in range(n, 0, -3):
+		t += i
+	return t
+print(total(10))
+#out: 67
+
+for i in range(2 ** 64, 2 ** 64 + 2):
+	print(i)
+#out: 18446744073709551616
+#out: 18446744073709551617
+
+try:
+	for i in range(0, 5, 0):
+		pass
+except ValueError:
+	print('ValueError')
+#out: ValueError
+
+def shadowed():
+	range = lambda n: [n]
+	for i in range(7):
+		print(i)
+shadowed()
+#out: 7
+
+l = [1, 2, 3]
+for x in l:
+	if len(l) < 5:
+		l.append(x * 10)
+print(l)
+#out: [1, 2, 3, 10, 20]
+
+for i, x in enumerate('ab', 1):
+	print(i, x)
+#out: 1 a
+#out: 2 b
@@ -0,0 +1,99 @@
+#options: static_builtins
+
+def total(n):
+	t = 0
+	for i in range(n):
+		t += i
+	for i in range(n, 0, -3):
+		t += i
+	for i in range(2, n, 4):
+		t += i
+	return t
+print(total(10))
+#out: 75
+
+def last(n):
+	i = -1
+	for i in range(n):
+		pass
+	return i
+print(last(5), last(0))
+#out: 4 -1
+
+def edges():
+	for i in range(9223372036854775805, 9223372036854775807):
+		print(i)
+	for i in range(-9223372036854775807, -9223372036854775808, -1):
+		print(i)
+	for i in range(5, 5):
+		print(i)
+	for i in range(0, 5, -1):
+		print(i)
+edges()
+#out: 9223372036854775805
+#out: 9223372036854775806
+#out: -9223372036854775807
+
+for i in range(2 ** 64, 2 ** 64 + 2):
+	print(i)
+#out: 18446744073709551616
+#out: 18446744073709551617
+
+def zero_step():
+	for i in range(0, 5, 0):
+		pass
+try:
+	zero_step()
+except ValueError:
+	print('ValueError')
+#out: ValueError
+
+def nested(n):
+	out = []
+	for i in range(n):
+		if i == 1:
+			continue
+		for j in range(i):
+			if j == 2:
+				break
+			out.append(i * 10 + j)
+	return out
+print(nested(4))
+#out: [20, 21, 30, 31]
+
+def shadowed():
+	range = lambda n: [n]
+	for i in range(7):
+		print(i)
+shadowed()
+#out: 7
+
+def pairs(seq):
+	for i, x in enumerate(seq):
+		print(i, x)
+	for i, x in enumerate(seq, -2):
+		print(i, x)
+pairs('ab')
+#out: 0 a
+#out: 1 b
+#out: -2 a
+#out: -1 b
+
+def grow(l):
+	for i, x in enumerate(l):
+		if len(l) < 5:
+			l.append(x * 10)
+		print(i, x)
+grow([1, 2, 3])
+#out: 0 1
+#out: 1 2
+#out: 2 3
+#out: 3 10
+#out: 4 20
+
+def over_generator():
+	for i, x in enumerate(c for c in 'xy'):
+		print(i, x)
+over_generator()
+#out: 0 x
+#out: 1 y
@@ -0,0 +1,30 @@
+def make_counter(step):
+	total = [0]
+	def add(n):
+		# a leaf closure: nothing can capture its locals
+		x = n * step
+		total[0] += x
+		return x
+	def fact(n):
+		if n <= 1:
+			return 1
+		m = n
+		return m * fact(n - 1)
+	return add, fact, total
+
+add, fact, total = make_counter(3)
+for i in range(1000):
+	add(i)
+print(total[0], fact(10))
+#out: 1498500 3628800
+
+def outer(a):
+	b = a + 1
+	def middle(c):
+		d = c * 2
+		def inner():
+			return a + b + d
+		return inner
+	return [middle(x) for x in range(3)]
+print([f() for f in outer(1)])
+#out: [3, 5, 7]
@@ -0,0 +1,44 @@
+def make(n):
+	big = list(range(n))
+	count = 0
+	def bump(k):
+		nonlocal count
+		count += k
+		return count
+	def peek():
+		return count
+	return bump, peek, len(big)
+
+bump, peek, size = make(1000)
+bump(2)
+bump(3)
+print(peek(), size)
+#out: 5 1000
+
+def late():
+	get = lambda: x
+	x = 'bound'
+	return get()
+print(late())
+#out: bound
+
+def unbound():
+	def get():
+		return y
+	try:
+		get()
+	except NameError:
+		print('NameError')
+	y = 1
+	return get()
+print(unbound())
+#out: NameError
+#out: 1
+
+def gen(a, b):
+	def add(v):
+		return v + a
+	for i in range(b):
+		yield add(i)
+print(list(gen(10, 3)))
+#out: [10, 11, 12]
@@ -0,0 +1,19 @@
+def make(n):
+	def add(a, b=n, *, c=n):
+		return a + b + c
+	return add
+
+one = make(1)
+two = make(2)
+
+# positional binding
+print(one(10), two(10))
+#out: 12 14
+
+# keyword lookup, then default
+print(one(a=10), two(a=10))
+#out: 12 14
+
+# keyword only defaults
+print(one(10, 0), two(10, 0))
+#out: 11 12
@@ -0,0 +1,44 @@
+#options: static_builtins
+
+def stats(l):
+	return sum(x * x for x in l), min(x for x in l if x > 1), max(-x for x in l)
+print(stats([1, 2, 3]))
+#out: (14, 2, -1)
+
+l = [3, 1, 2]
+print(list(x + 1 for x in l), tuple(x for x in l), sorted(set(x % 2 for x in l)))
+#out: [4, 2, 3] (3, 1, 2) [0, 1]
+
+print(', '.join(str(x) for x in l), ''.join(c * 2 for c in 'ab'))
+#out: 3, 1, 2 aabb
+
+seen = []
+def check(x):
+	seen.append(x)
+	return x > 1
+print(any(check(x) for x in l), all(check(x) for x in l), seen)
+#out: True False [3, 3, 1]
+
+print(any(x == (a, b) for a in range(3) for b in range(3) for x in [(1, 1)]))
+#out: True
+
+print(sum(x for x in []), any(x for x in []), all(x for x in []))
+#out: 0 False True
+
+try:
+	min(x for x in [])
+except ValueError as e:
+	print(e)
+#out: min() arg is an empty sequence
+
+def outer(n):
+	k = 2
+	return sum(i * k for i in range(n))
+print(outer(4))
+#out: 12
+
+def shadowed(l):
+	sum = lambda g: 'shadowed'
+	return sum(x for x in l)
+print(shadowed([1]))
+#out: shadowed
@@ -0,0 +1,22 @@
+def depth(n):
+	if n == 0:
+		return 0
+	return depth(n - 1) + 1
+
+total = 0
+for i in range(2000):
+	total += sum(x * 2 for x in range(i % 7))
+	if i % 500 == 0:
+		total += sum(depth(x) for x in [200])
+print(total)
+#out: 20770
+
+# many generators alive at once, each holding a stack from the pool
+def numbers(n):
+	for x in range(n):
+		yield x
+live = []
+for n in range(100):
+	live.append(numbers(n))
+print(sum(sum(g) for g in live))
+#out: 161700
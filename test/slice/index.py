@@ -0,0 +1,45 @@
+def indexes(n):
+	l = [0] * n
+	for i in range(n):
+		l[i] = i * i
+	t = (1, 2, 3)
+	total = 0
+	for i in range(n):
+		total += l[i] + l[-i - 1] + t[i % 3]
+	return l, total
+print(indexes(4))
+#out: ([0, 1, 4, 9], 35)
+
+l = [1, 2, 3]
+print(l[-1], (4, 5)[-2], [1, 2][True])
+#out: 3 4 2
+
+try:
+	l[3]
+except IndexError:
+	print('IndexError')
+#out: IndexError
+
+try:
+	(1, 2)[2 ** 64]
+except IndexError:
+	print('IndexError')
+#out: IndexError
+
+d = {'a': 1, (1, 2): 2}
+d['b'] = 3
+print(d['a'], d[1, 2], d['b'], 'a' in d, 'c' in d)
+#out: 1 2 3 True False
+
+try:
+	d['c']
+except KeyError as e:
+	print(repr(e))
+#out: KeyError('c',)
+
+class Missing(dict):
+	def __missing__(self, key):
+		return key * 2
+m = Missing()
+print(m[21], 2 in [1, 2], 3 not in (1, 2))
+#out: 42 True True
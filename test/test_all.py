@@ -34,12 +34,13 @@ def pytest_generate_tests(metafunc):
 
 def test_all(testfile, root, interpreter, version):
 	expect = load_expectations(testfile)
+	options = ','.join(['debug_memory'] + expect['options'])
 
 	if interpreter == 'millipede':
 		if expect['xfail']:
 			pytest.xfail()
 
-		p = subprocess.Popen(['python3.1', 'milli.py', '-P', version, '-O', 'asp', '-o', 'debug_memory', testfile], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+		p = subprocess.Popen(['python3.1', 'milli.py', '-P', version, '-O', 'asp', '-o', options, testfile], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
 		out = p.communicate()
 		assert p.returncode == 0, "Failed melano-x build for {}".format(testfile)
 
@@ -49,7 +50,7 @@ def test_all(testfile, root, interpreter, version):
 		if expect['xfail']:
 			pytest.xfail()
 
-		p = subprocess.Popen([os.path.join(TESTDIR, 'millipede-x-' + version), '-P', version, '-O', 'asp', '-o', 'debug_memory', testfile], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+		p = subprocess.Popen([os.path.join(TESTDIR, 'millipede-x-' + version), '-P', version, '-O', 'asp', '-o', options, testfile], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
 		p.communicate()
 		assert p.returncode == 0, "Failed melano-x build for {}".format(testfile)
 
@@ -69,7 +70,10 @@ def test_all(testfile, root, interpreter, version):
 	assert mem_used == 0
 	if not expect['skip_io']:
 		assert actual_stdout == expect['stdout']
-		assert actual_stderr == expect['stderr']
+		if expect['stderr_has']:
+			assert in_order(expect['stderr_has'], actual_stderr)
+		else:
+			assert actual_stderr == expect['stderr']
 	if interpreter == 'melano' and expect['no_external']:
 		with open('test.c', 'r') as fp:
 			assert len([ln for ln in fp if 'PyImport_ImportModule' in ln]) <= 1
@@ -85,20 +89,32 @@ def filter_output(data:bytes) -> [str]:
 		if line.startswith('DBG_excess_mem: '):
 			mem_used = int(line[len('DBG_excess_mem: '):])
 			continue
+		# traceback frames: the interpreters name the file differently and we also give the c line
+		m = re.match(r'File "(.*)", line (\d+)(?: \(\d+\))?, in (.*)$', line)
+		if m:
+			line = 'File "{}", line {}, in {}'.format(os.path.basename(m.group(1)), m.group(2), m.group(3))
 		out.append(line)
 
 	return out, mem_used
 
 
+def in_order(expected:[str], actual:[str]) -> bool:
+	'''Return True if all of the expected lines are in actual, in the same order, with any others between them.'''
+	lines = iter(actual)
+	return all(any(ln == want for ln in lines) for want in expected)
+
+
 
 def load_expectations(testfile):
 	out = {
 		'stdout': [],
 		'stderr': [],
+		'stderr_has': [],
 		'returncode': 0,
 		'xfail': False,
 		'skip_io': False,
 		'no_external': False,
+		'options': [],
 	}
 	with open(testfile, 'r') as fp:
 		for ln in fp:
@@ -106,6 +122,9 @@ def load_expectations(testfile):
 				out['stdout'].append(ln[6:].strip())
 			elif ln.startswith('#err: '):
 				out['stderr'].append(ln[6:].strip())
+			elif ln.startswith('#err_has: '):
+				# a line that stderr must have, after those of the #err_has before it
+				out['stderr_has'].append(ln[10:].strip())
 			elif ln.startswith('#returncode: '):
 				out['returncode'] = int(ln[13:].strip())
 			elif ln.startswith('#fail'):
@@ -114,5 +133,8 @@ def load_expectations(testfile):
 				out['skip_io'] = True
 			elif ln.startswith('#no_external'):
 				out['no_external'] = True
+			elif ln.startswith('#options: '):
+				# build options to compile the test with, as for -o; separated by commas or spaces
+				out['options'].extend(ln[10:].replace(',', ' ').split())
 	return out
 
@@ -0,0 +1,30 @@
+def lookup(d, key):
+	try:
+		return d[key]
+	except KeyError:
+		return None
+
+d = {'a': 1}
+for i in range(1000):
+	lookup(d, i)
+print(lookup(d, 'a'), lookup(d, 'b'))
+
+def down(n):
+	if n == 0:
+		raise NotImplementedError
+	down(n - 1)
+
+down(500)
+
+
+#Note: a deep unwind only keeps the innermost and outermost frames, so we check both ends of the traceback.
+#out: 1 None
+#err_has: Traceback (most recent call last):
+#err_has: File "except_deep.py", line 17, in <module>
+#err_has: down(500)
+#err_has: File "except_deep.py", line 15, in down
+#err_has: down(n - 1)
+#err_has: File "except_deep.py", line 14, in down
+#err_has: raise NotImplementedError
+#err_has: NotImplementedError
+#returncode: 1
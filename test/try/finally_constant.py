@@ -0,0 +1,9 @@
+def f():
+	try:
+		x = 1
+	finally:
+		print('finally')
+	return x
+print(f())
+#out: finally
+#out: 1
@@ -0,0 +1,21 @@
+def fail(x):
+	raise ValueError(x)
+
+def outer():
+	fail('bad')
+
+print('before')
+outer()
+print('after')
+
+
+#out: before
+#err: Traceback (most recent call last):
+#err: File "raise_traceback.py", line 8, in <module>
+#err: outer()
+#err: File "raise_traceback.py", line 5, in outer
+#err: fail('bad')
+#err: File "raise_traceback.py", line 2, in fail
+#err: raise ValueError(x)
+#err: ValueError: bad
+#returncode: 1
@@ -0,0 +1,49 @@
+#options: stackless_generators
+
+def counter(n):
+	total = 0.0
+	i = 0
+	while i < n:
+		total += i
+		yield i, total
+		i += 1
+	yield 'done'
+
+for item in counter(3):
+	print(item)
+#out: (0, 0.0)
+#out: (1, 1.0)
+#out: (2, 3.0)
+#out: done
+
+def outer(items):
+	scale = 10
+	def gen():
+		for x in items:
+			yield x * scale
+	return gen()
+print(list(outer([1, 2, 3])))
+#out: [10, 20, 30]
+
+def guarded():
+	try:
+		yield 1
+		yield 2
+	finally:
+		print('finally')
+print(list(guarded()))
+#out: finally
+#out: [1, 2]
+
+def interleave(a, b):
+	for x, y in zip(counter(a), counter(b)):
+		yield x, y
+g = interleave(2, 5)
+print(next(g))
+print(next(g))
+del g
+#out: ((0, 0.0), (0, 0.0))
+#out: ((1, 1.0), (1, 1.0))
+
+print(sum(x * x for x in range(5)), list(c for c in 'ab' for _ in range(2)))
+#out: 30 ['a', 'a', 'b', 'b']
@@ -0,0 +1,38 @@
+def depth(n):
+	if n == 0:
+		return 0
+	return 1 + depth(n - 1)
+
+class Deep:
+	def __add__(self, n):
+		return depth(n)
+	def __lt__(self, n):
+		return depth(n) < n
+	def __getitem__(self, n):
+		return depth(n)
+	@property
+	def far(self):
+		return depth(900)
+	def __iter__(self):
+		return self
+	def __next__(self):
+		raise StopIteration(depth(900))
+
+D = Deep()
+
+# none of these make a call, but each runs python code, deep, on the generator's stack
+def binop():
+	yield D + 900
+def compare():
+	yield D < 900
+def subscript():
+	yield D[900]
+def attribute():
+	yield D.far
+def iterate():
+	for x in D:
+		yield x
+	yield 'done'
+
+print(list(binop()), list(compare()), list(subscript()), list(attribute()), list(iterate()))
+#out: [900] [False] [900] [900] ['done']